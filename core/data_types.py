@@ -33,10 +33,89 @@ class EvaluationResponse(BaseModel):
     summary: str = Field(description="summary of the overall conversation")
     evaluation_results: List[MetricResult]
 
+@dataclass
+class TokenUsage:
+    """Token counts reported by the provider for a single LLM call"""
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    # Prompt tokens served from the provider's prompt cache, billed at a discount
+    cached_tokens: int = 0
+
+    def __add__(self, other: 'TokenUsage') -> 'TokenUsage':
+        return TokenUsage(prompt_tokens=self.prompt_tokens + other.prompt_tokens,
+                          completion_tokens=self.completion_tokens + other.completion_tokens,
+                          cached_tokens=self.cached_tokens + other.cached_tokens)
+
+    @property
+    def cached_ratio(self) -> float:
+        return self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+
+@dataclass
+class LLMCallTelemetry:
+    """Usage and timing of a single LLM call"""
+    model: str
+    usage: TokenUsage = field(default_factory=TokenUsage)
+    # Wall-clock seconds from sending the request until the complete response was received
+    wall_time: float = 0.0
+    # Only known for streamed calls
+    time_to_first_token: Optional[float] = None
+    retries: int = 0
+    from_cache: bool = False
+
+@dataclass
+class TurnTelemetry:
+    """Telemetry of the LLM call that generated a conversation turn"""
+    turn: int
+    speaker: str
+    telemetry: LLMCallTelemetry
+
+@dataclass
+class TurnLatency:
+    """Streaming latency of a single agent turn"""
+    turn: int
+    # None if no content or tool call delta was observed
+    time_to_first_token: Optional[float]
+    total_time: float
+    # None if the provider didn't report usage
+    completion_tokens: Optional[int]
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        if self.time_to_first_token is None or self.completion_tokens is None:
+            return None
+        # Generation speed after the first token arrived, so it doesn't overlap with time to first token
+        generation_time = self.total_time - self.time_to_first_token
+        return self.completion_tokens / generation_time if generation_time > 0 else 0.0
+
 @dataclass
 class TestResult:
-    evaluation_result: EvaluationResponse
+    # None until evaluated when evaluations are deferred to a batch
+    evaluation_result: Optional[EvaluationResponse]
     conversation_history: List[Dict[str, str]]
+    turn_telemetry: List[TurnTelemetry] = field(default_factory=list)
+    agent_turn_latencies: List[TurnLatency] = field(default_factory=list)
+
+    @property
+    def total_usage(self) -> TokenUsage:
+        return sum((turn.telemetry.usage for turn in self.turn_telemetry), TokenUsage())
+
+    @property
+    def total_llm_time(self) -> float:
+        return sum(turn.telemetry.wall_time for turn in self.turn_telemetry)
+
+    @property
+    def avg_time_to_first_token(self) -> Optional[float]:
+        return _average(latency.time_to_first_token for latency in self.agent_turn_latencies)
+
+    @property
+    def avg_tokens_per_second(self) -> Optional[float]:
+        return _average(latency.tokens_per_second for latency in self.agent_turn_latencies)
+
+
+def _average(values) -> Optional[float]:
+    """Average of the values that were measured, None if none were"""
+    measured = [value for value in values if value is not None]
+    return sum(measured) / len(measured) if measured else None
 
 
 @dataclass
@@ -45,6 +124,18 @@ class ConversationContext:
     system_prompt: str
     conversation_history: List[Dict[str, str]] = field(default_factory=list)
 
+    def to_messages(self, entity_speaking: "EntitySpeaking", user_input: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Convert the context to chat messages from the point of view of the speaking entity"""
+        messages = [{"role": "system", "content": self.system_prompt}]
+        for msg in self.conversation_history:
+            role = "assistant" if msg["speaker"] == entity_speaking.value else "user"
+            messages.append({"role": role, "content": msg["text"]})
+
+        if user_input:
+            messages.append({"role": "user", "content": user_input})
+
+        return messages
+
 @dataclass
 class ConversationEndStatus:
     reason: Optional[str] = None
@@ -55,15 +146,90 @@ class ConversationEndStatus:
         if self.who_ended and self.who_ended not in ['callee', 'agent']:
             raise ValueError("who_ended must be either 'callee' or 'agent'")
 
+@dataclass
+class FunctionCall:
+    """Provider-independent equivalent of the function part of an OpenAI tool call"""
+    name: str
+    arguments: str
+
+@dataclass
+class ToolCall:
+    """Provider-independent tool call, exposes the same attributes as OpenAI's tool call objects"""
+    id: str
+    function: FunctionCall
+    type: str = "function"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"id": self.id, "type": self.type,
+                "function": {"name": self.function.name, "arguments": self.function.arguments}}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'ToolCall':
+        return cls(id=data["id"], type=data.get("type", "function"),
+                   function=FunctionCall(name=data["function"]["name"], arguments=data["function"]["arguments"]))
+
+    @classmethod
+    def from_tool_call(cls, tool_call) -> 'ToolCall':
+        """Convert any object with OpenAI's tool call attributes"""
+        return cls(id=tool_call.id, type=tool_call.type,
+                   function=FunctionCall(name=tool_call.function.name, arguments=tool_call.function.arguments))
+
 class LLMResponse:
-    def __init__(self, response_content: str, tools_called):
+    def __init__(self, response_content: str, tools_called, usage: Optional[TokenUsage] = None,
+                 telemetry: Optional[LLMCallTelemetry] = None):
         """
         Args:
             response_content: The actual response text from the LLM
             end_status: The conversation end status
+            usage: Token usage reported by the provider, None if unknown (e.g. served from a local cache)
+            telemetry: Usage and timing of the call that generated the response
         """
         self.response_content = response_content
         self.tools_called = tools_called
+        self.usage = usage
+        self.telemetry = telemetry
+
+@dataclass
+class ResponseDelta:
+    """Incremental piece of a streamed LLM response, either text, part of a tool call or the final usage"""
+    content: Optional[str] = None
+    # Tool call deltas of the same call share an index, the id and name only arrive with the first delta
+    tool_call_index: Optional[int] = None
+    tool_call_id: Optional[str] = None
+    tool_name: Optional[str] = None
+    tool_arguments: Optional[str] = None
+    usage: Optional[TokenUsage] = None
+    # Sent by providers once the stream is complete
+    telemetry: Optional[LLMCallTelemetry] = None
+
+class StreamedResponse:
+    """Accumulates the deltas of a streamed response into an LLMResponse"""
+    def __init__(self):
+        self.content_parts: List[str] = []
+        self.tool_calls: Dict[int, ToolCall] = {}
+        self.usage: Optional[TokenUsage] = None
+        self.telemetry: Optional[LLMCallTelemetry] = None
+
+    def add(self, delta: ResponseDelta):
+        if delta.content:
+            self.content_parts.append(delta.content)
+        if delta.tool_call_index is not None:
+            tool_call = self.tool_calls.setdefault(delta.tool_call_index, ToolCall(id="", function=FunctionCall(name="", arguments="")))
+            if delta.tool_call_id:
+                tool_call.id = delta.tool_call_id
+            if delta.tool_name:
+                tool_call.function.name += delta.tool_name
+            if delta.tool_arguments:
+                tool_call.function.arguments += delta.tool_arguments
+        if delta.usage:
+            self.usage = delta.usage
+        if delta.telemetry:
+            self.telemetry = delta.telemetry
+
+    def to_llm_response(self) -> 'LLMResponse':
+        tools_called = [self.tool_calls[index] for index in sorted(self.tool_calls)] or None
+        content = "".join(self.content_parts) if self.content_parts else None
+        return LLMResponse(content, tools_called, self.usage, self.telemetry)
 
 # TODO get rid of all 'callee' and 'agent' literal strings
 class EntitySpeaking(Enum):
@@ -1,12 +1,18 @@
 import json
-from typing import List, Dict, Optional
+import os
+import time
+from typing import List, Dict, Optional, Union
 from abc import ABC, abstractmethod
 
 
 from .agent_config import AgentTaskConfig
-from .interfaces import LLMInterface
+from .interfaces import AsyncLLMInterface, LLMInterface
 from .data_types import EvaluationResponse
+from .metrics_registry import MetricsRegistry
 from .personas import CalleePersona
+from .providers.batch import BATCH_ENDPOINT, BATCH_FINAL_STATUSES, BatchClient
+
+DEFAULT_BATCH_FILE_PATH = ".cache/evaluation_batch.jsonl"
 
 
 class ConversationEvaluator(ABC):
@@ -20,44 +26,46 @@ class ConversationEvaluator(ABC):
 
 class LLMConversationEvaluator(ConversationEvaluator):
     """Evaluates conversation outcome using an LLM"""
-    def __init__(self, evaluation_llm: LLMInterface, eval_metrics_path: str, eval_system_prompt: str):
+    def __init__(self, evaluation_llm: Union[LLMInterface, AsyncLLMInterface], eval_metrics_path: str, eval_system_prompt: str):
         self.llm = evaluation_llm
         self.eval_metrics_config_path = eval_metrics_path
+        # Shared by all evaluators of the same metrics file, parsed once and re-read only when the file changes
+        self.metrics_registry = MetricsRegistry.get(eval_metrics_path)
         self.eval_system_prompt = eval_system_prompt
     
     def evaluate(self, conversation_history: List[Dict[str, str]], task_config: AgentTaskConfig,
                   persona: CalleePersona, success_criteria: Optional[str] = None,
                   scenario_guidelines: Optional[str] = None) -> EvaluationResponse:
-        prompt = self._create_evaluation_prompt(conversation_history, task_config, persona, success_criteria, scenario_guidelines)
-        system_prompt = self._get_evaluator_system_prompt()
         evaluation_response = self.llm.generate_response_with_structured_output(
-            [{"role": "system", "content": system_prompt},
-             {"role": "user", "content": prompt}],
+            self.create_evaluation_messages(conversation_history, task_config, persona, success_criteria, scenario_guidelines),
             response_format=EvaluationResponse
         )
          
         return evaluation_response
-    
-    def _generate_metrics_prompt(self, eval_metrics_path: str) -> str:
-        metrics_str = ""
-        with open(eval_metrics_path, "r") as file:
-            metrics = json.load(file)
-        
-        for metric in metrics:
-            curr_metric = metrics[metric]
-            metrics_str += f"Metric: {metric}\nEvaluation Prompt: {curr_metric['eval_prompt']}\n"
 
-        return metrics_str
+    async def evaluate_async(self, conversation_history: List[Dict[str, str]], task_config: AgentTaskConfig,
+                             persona: CalleePersona, success_criteria: Optional[str] = None,
+                             scenario_guidelines: Optional[str] = None) -> EvaluationResponse:
+        """Same as evaluate, but awaits the evaluation LLM which must implement AsyncLLMInterface"""
+        return await self.llm.generate_response_with_structured_output(
+            self.create_evaluation_messages(conversation_history, task_config, persona, success_criteria, scenario_guidelines),
+            response_format=EvaluationResponse
+        )
 
+    def create_evaluation_messages(self, conversation_history: List[Dict[str, str]],
+                                   task_config: Optional[AgentTaskConfig] = None,
+                                   persona: Optional[CalleePersona] = None,
+                                   success_criteria: Optional[str] = None,
+                                   scenario_guidelines: Optional[str] = None) -> List[Dict[str, str]]:
+        """System and user messages of an evaluation, e.g. to submit them in a batch"""
+        prompt = self._create_evaluation_prompt(conversation_history, task_config, persona, success_criteria, scenario_guidelines)
+        system_prompt = self._get_evaluator_system_prompt()
+        return [{"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt}]
+    
     def _get_evaluator_system_prompt(self) -> str:
         # TODO: use OpenAI's structured output mode for if typeof(self.llm) == OpenAIProvider
-        return f"""{self.eval_system_prompt}
-For each metric, provide a score according to the scoring format and an explanation of your evaluation.
-success_flag is a boolean value that indicates whether the metric was achieved. range_score is a number between 0 and 10 that indicates the degree to which the metric was achieved.
-
-# Metrics
-{self._generate_metrics_prompt(self.eval_metrics_config_path)}
-"""
+        return self.metrics_registry.get_system_prompt(self.eval_system_prompt)
     
     def _create_evaluation_prompt(self, 
                                 conversation_history: List[Dict[str, str]],
@@ -78,10 +86,100 @@ success_flag is a boolean value that indicates whether the metric was achieved.
 
     def _format_conversation(self, history: List[Dict[str, str]], persona: CalleePersona) -> str:
         formatted_history = ""
-        # TODO check if works for llm_testing
         for message in history:
-            formatted_history += f"{message['role']}: {message['content']}\n"
+            # llm_testing histories use speaker and text, web_eval histories use role and content
+            formatted_history += f"{message.get('role', message.get('speaker'))}: {message.get('content', message.get('text'))}\n"
 
         return formatted_history
 
 
+def _strict_json_schema(model) -> dict:
+    """JSON schema of a pydantic model in the form strict structured outputs require: no additional properties and
+    every property required"""
+    schema = model.model_json_schema()
+    for definition in [schema, *schema.get("$defs", {}).values()]:
+        if definition.get("type") == "object":
+            definition["additionalProperties"] = False
+            definition["required"] = list(definition.get("properties", {}))
+    return schema
+
+
+class BatchConversationEvaluator:
+    """
+    Defers evaluations of a whole run into a single Batch API submission instead of one blocking call per conversation.
+    Conversations are added as they finish and evaluated together once `run` is called.
+    """
+    def __init__(self, evaluator: LLMConversationEvaluator, model: str, batch_client: BatchClient,
+                 batch_file_path: str = DEFAULT_BATCH_FILE_PATH, poll_interval_sec: float = 30,
+                 timeout_sec: float = 24 * 60 * 60):
+        self.evaluator = evaluator
+        self.model = model
+        self.batch_client = batch_client
+        self.batch_file_path = batch_file_path
+        self.poll_interval_sec = poll_interval_sec
+        self.timeout_sec = timeout_sec
+        self._requests: Dict[str, List[Dict[str, str]]] = {}
+
+    def add(self, test_name: str, conversation_history: List[Dict[str, str]], task_config: Optional[AgentTaskConfig],
+            persona: Optional[CalleePersona], success_criteria: Optional[str] = None,
+            scenario_guidelines: Optional[str] = None):
+        if test_name in self._requests:
+            raise ValueError(f"Test {test_name} was already added to the evaluation batch")
+        self._requests[test_name] = self.evaluator.create_evaluation_messages(conversation_history, task_config, persona,
+                                                                               success_criteria, scenario_guidelines)
+
+    def write_batch_file(self) -> str:
+        """Write one Batch API request per added conversation, using the test name as custom_id"""
+        if os.path.dirname(self.batch_file_path):
+            os.makedirs(os.path.dirname(self.batch_file_path), exist_ok=True)
+
+        response_format = {
+            "type": "json_schema",
+            "json_schema": {"name": EvaluationResponse.__name__, "schema": _strict_json_schema(EvaluationResponse),
+                            "strict": True}
+        }
+        with open(self.batch_file_path, "w") as file:
+            for test_name, messages in self._requests.items():
+                file.write(json.dumps({
+                    "custom_id": test_name,
+                    "method": "POST",
+                    "url": BATCH_ENDPOINT,
+                    "body": {"model": self.model, "messages": messages, "response_format": response_format}
+                }) + "\n")
+
+        return self.batch_file_path
+
+    def run(self) -> Dict[str, EvaluationResponse]:
+        """Submit all added conversations, wait for the batch to complete and return the evaluations by test name"""
+        if not self._requests:
+            return {}
+
+        batch_id = self.batch_client.submit(self.write_batch_file())
+        print(f"Submitted evaluation batch {batch_id} with {len(self._requests)} conversations")
+
+        started_at = time.time()
+        status = self.batch_client.get_status(batch_id)
+        while status not in BATCH_FINAL_STATUSES:
+            if time.time() - started_at > self.timeout_sec:
+                raise TimeoutError(f"Evaluation batch {batch_id} did not complete within {self.timeout_sec} seconds")
+            time.sleep(self.poll_interval_sec)
+            status = self.batch_client.get_status(batch_id)
+
+        if status != "completed":
+            raise ValueError(f"Evaluation batch {batch_id} ended with status {status}")
+
+        evaluations = {}
+        for result in self.batch_client.get_results(batch_id):
+            test_name = result["custom_id"]
+            if result.get("error") or not result.get("response") or result["response"]["status_code"] != 200:
+                print(f"Evaluation of {test_name} failed: {result.get('error') or result.get('response')}")
+                continue
+            content = result["response"]["body"]["choices"][0]["message"]["content"]
+            evaluations[test_name] = EvaluationResponse.model_validate_json(content)
+
+        missing_tests = set(self._requests) - set(evaluations)
+        if missing_tests:
+            print(f"Warning: no evaluation returned for {', '.join(sorted(missing_tests))}")
+
+        self._requests = {}
+        return evaluations
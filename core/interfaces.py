@@ -1,8 +1,21 @@
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
 
 from pydantic import BaseModel
-from .data_types import ConversationContext, EntitySpeaking, LLMResponse
+from .data_types import ConversationContext, EntitySpeaking, LLMResponse, ResponseDelta
+
+def response_to_deltas(response: LLMResponse) -> List[ResponseDelta]:
+    """Split a complete response into the deltas a streaming provider would have yielded"""
+    deltas = []
+    if response.response_content:
+        deltas.append(ResponseDelta(content=response.response_content))
+    for index, tool_call in enumerate(response.tools_called or []):
+        deltas.append(ResponseDelta(tool_call_index=index, tool_call_id=tool_call.id, tool_name=tool_call.function.name,
+                                    tool_arguments=tool_call.function.arguments))
+    if response.usage or response.telemetry:
+        deltas.append(ResponseDelta(usage=response.usage, telemetry=response.telemetry))
+    return deltas
+
 
 class LLMInterface(ABC):
     """Abstract interface for LLM interactions"""
@@ -31,3 +44,47 @@ class LLMInterface(ABC):
             LLMResponse containing the response content and conversation end status
         """
         pass
+
+    def stream_response(self, messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]] = None) -> Iterator[ResponseDelta]:
+        """
+        Stream the response as deltas. Providers without streaming support yield the complete response at once.
+        Use StreamedResponse to assemble the deltas into an LLMResponse.
+        """
+        yield from response_to_deltas(self.generate_response(messages, tools))
+
+    def stream_response_with_conversation_history(self, context: ConversationContext,
+                                                   entity_speaking: EntitySpeaking,
+                                                   tools: Optional[List[Dict[str, Any]]] = None,
+                                                   user_input: str = None) -> Iterator[ResponseDelta]:
+        yield from self.stream_response(context.to_messages(entity_speaking, user_input), tools)
+
+
+class AsyncLLMInterface(ABC):
+    """Abstract interface for LLM interactions that can be awaited from within an event loop"""
+    @abstractmethod
+    async def generate_response_with_conversation_history(self, context: Optional[ConversationContext],
+                                                           entity_speaking: EntitySpeaking,
+                                                           tools: Optional[List[Dict[str, Any]]] = None,
+                                                           user_input: str = None) -> LLMResponse:
+        pass
+
+    @abstractmethod
+    async def generate_response_with_structured_output(self, messages: List[Dict[str, Any]], response_format: BaseModel):
+        pass
+
+    @abstractmethod
+    async def generate_response(self, messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]] = None) -> LLMResponse:
+        """Async counterpart of LLMInterface.generate_response"""
+        pass
+
+    async def stream_response(self, messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]] = None) -> AsyncIterator[ResponseDelta]:
+        """Async counterpart of LLMInterface.stream_response"""
+        for delta in response_to_deltas(await self.generate_response(messages, tools)):
+            yield delta
+
+    async def stream_response_with_conversation_history(self, context: ConversationContext,
+                                                         entity_speaking: EntitySpeaking,
+                                                         tools: Optional[List[Dict[str, Any]]] = None,
+                                                         user_input: str = None) -> AsyncIterator[ResponseDelta]:
+        async for delta in self.stream_response(context.to_messages(entity_speaking, user_input), tools):
+            yield delta
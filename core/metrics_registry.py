@@ -0,0 +1,106 @@
+import json
+import os
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+EVAL_OUTPUT_TYPES = ("success_flag", "range_score")
+RANGE_SCORE_MIN = 0
+RANGE_SCORE_MAX = 10
+
+
+@dataclass(frozen=True)
+class MetricDefinition:
+    """A single metric of an eval_metrics.json file"""
+    name: str
+    eval_prompt: str
+    eval_output: str
+    range_score_success_threshold: Optional[int] = None
+
+    def to_prompt(self) -> str:
+        metric_prompt = f"Metric: {self.name}\nEvaluation Prompt: {self.eval_prompt}\nOutput type: {self.eval_output}\n"
+        if self.eval_output == "range_score":
+            metric_prompt += f"Success threshold: {self.range_score_success_threshold}\n"
+        return metric_prompt
+
+
+def parse_metric(name: str, metric: Dict) -> MetricDefinition:
+    if not metric.get("eval_prompt"):
+        raise ValueError(f"Metric '{name}' is missing an eval_prompt")
+
+    eval_output = metric.get("eval_output")
+    if eval_output not in EVAL_OUTPUT_TYPES:
+        raise ValueError(f"Metric '{name}' has eval_output '{eval_output}', expected one of {EVAL_OUTPUT_TYPES}")
+
+    threshold = metric.get("range_score_success_threshold")
+    if eval_output == "range_score":
+        if not isinstance(threshold, int) or not RANGE_SCORE_MIN <= threshold <= RANGE_SCORE_MAX:
+            raise ValueError(f"Metric '{name}' must have an integer range_score_success_threshold between "
+                             f"{RANGE_SCORE_MIN} and {RANGE_SCORE_MAX}")
+
+    return MetricDefinition(name=name, eval_prompt=metric["eval_prompt"], eval_output=eval_output,
+                            range_score_success_threshold=threshold)
+
+
+class MetricsRegistry:
+    """
+    Parsed and validated metrics of an eval_metrics.json file. The rendered evaluator system prompt is cached and only
+    rebuilt when the file changes on disk, so every evaluation sends a byte-identical, prompt-cacheable prefix.
+    Use `MetricsRegistry.get` to share one registry per file across evaluators.
+    """
+    _registries: Dict[str, "MetricsRegistry"] = {}
+    _registries_lock = threading.Lock()
+
+    def __init__(self, eval_metrics_path: str):
+        self.eval_metrics_path = eval_metrics_path
+        self._lock = threading.Lock()
+        self._mtime: Optional[float] = None
+        self._metrics: List[MetricDefinition] = []
+        self._system_prompts: Dict[str, str] = {}
+
+    @classmethod
+    def get(cls, eval_metrics_path: str) -> "MetricsRegistry":
+        key = os.path.abspath(eval_metrics_path)
+        with cls._registries_lock:
+            if key not in cls._registries:
+                cls._registries[key] = cls(eval_metrics_path)
+            return cls._registries[key]
+
+    def _reload_if_changed(self):
+        mtime = os.stat(self.eval_metrics_path).st_mtime
+        if mtime == self._mtime:
+            return
+
+        with open(self.eval_metrics_path, "r") as file:
+            metrics = json.load(file)
+
+        self._metrics = [parse_metric(name, metric) for name, metric in metrics.items()]
+        self._system_prompts = {}
+        self._mtime = mtime
+
+    @property
+    def metrics(self) -> List[MetricDefinition]:
+        with self._lock:
+            self._reload_if_changed()
+            return self._metrics
+
+    def get_metrics_prompt(self) -> str:
+        with self._lock:
+            self._reload_if_changed()
+            return self._render_metrics_prompt()
+
+    def _render_metrics_prompt(self) -> str:
+        return "".join(metric.to_prompt() for metric in self._metrics)
+
+    def get_system_prompt(self, eval_system_prompt: str) -> str:
+        with self._lock:
+            self._reload_if_changed()
+            if eval_system_prompt not in self._system_prompts:
+                self._system_prompts[eval_system_prompt] = f"""{eval_system_prompt}
+For each metric, provide a score according to the scoring format and an explanation of your evaluation.
+success_flag is a boolean value that indicates whether the metric was achieved. range_score is a number between {RANGE_SCORE_MIN} and {RANGE_SCORE_MAX} that indicates the degree to which the metric was achieved.
+
+# Metrics
+{self._render_metrics_prompt()}
+"""
+            return self._system_prompts[eval_system_prompt]
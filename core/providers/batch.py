@@ -0,0 +1,124 @@
+import json
+import os
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional
+
+import openai
+from pydantic import BaseModel
+
+from ..interfaces import LLMInterface
+from .http_client import get_shared_http_client
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+class BatchClient(ABC):
+    """Abstract client for submitting a JSONL file of chat completion requests and fetching the results"""
+    @abstractmethod
+    def submit(self, input_file_path: str) -> str:
+        """Submit the batch input file and return the batch id"""
+        pass
+
+    @abstractmethod
+    def get_status(self, batch_id: str) -> str:
+        """Return one of validating, in_progress, finalizing, completed, failed, expired or cancelled"""
+        pass
+
+    @abstractmethod
+    def get_results(self, batch_id: str) -> List[Dict[str, Any]]:
+        """Return the parsed output lines of a completed batch"""
+        pass
+
+
+class OpenAIBatchClient(BatchClient):
+    """Runs batches through the OpenAI Batch API, at half the price of synchronous calls"""
+    def __init__(self, api_key: str):
+        self.client = openai.OpenAI(api_key=api_key, http_client=get_shared_http_client())
+
+    def submit(self, input_file_path: str) -> str:
+        with open(input_file_path, "rb") as file:
+            input_file = self.client.files.create(file=file, purpose="batch")
+        batch = self.client.batches.create(input_file_id=input_file.id, endpoint=BATCH_ENDPOINT,
+                                           completion_window="24h")
+        return batch.id
+
+    def get_status(self, batch_id: str) -> str:
+        return self.client.batches.retrieve(batch_id).status
+
+    def get_results(self, batch_id: str) -> List[Dict[str, Any]]:
+        batch = self.client.batches.retrieve(batch_id)
+        results = []
+        # Requests that failed validation or execution are reported in a separate error file
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                content = self.client.files.content(file_id).text
+                results.extend(json.loads(line) for line in content.splitlines() if line.strip())
+        return results
+
+
+class LocalBatchClient(BatchClient):
+    """
+    Offline stand-in for the Batch API. Requests are answered with an LLMInterface or a responder callable,
+    and the batch only completes after `polls_until_complete` status checks to exercise the polling logic.
+    """
+    def __init__(self, llm: Optional[LLMInterface] = None,
+                 responder: Optional[Callable[[Dict[str, Any]], str]] = None,
+                 response_format: Optional[type] = None, polls_until_complete: int = 1):
+        if llm is None and responder is None:
+            raise ValueError("Either llm or responder must be provided")
+        if llm is not None and response_format is None:
+            raise ValueError("response_format is required to answer requests with an llm")
+        self.llm = llm
+        self.responder = responder
+        self.response_format = response_format
+        self.polls_until_complete = polls_until_complete
+        self._batches: Dict[str, Dict[str, Any]] = {}
+
+    def _respond(self, body: Dict[str, Any]) -> str:
+        if self.responder:
+            return self.responder(body)
+        parsed: BaseModel = self.llm.generate_response_with_structured_output(body["messages"], self.response_format)
+        return parsed.model_dump_json()
+
+    def submit(self, input_file_path: str) -> str:
+        if not os.path.exists(input_file_path):
+            raise ValueError(f"Batch input file {input_file_path} does not exist")
+        batch_id = f"batch_local_{uuid.uuid4().hex}"
+        self._batches[batch_id] = {"input_file_path": input_file_path, "polls": 0, "results": None}
+        return batch_id
+
+    def get_status(self, batch_id: str) -> str:
+        batch = self._batches[batch_id]
+        batch["polls"] += 1
+        if batch["polls"] < self.polls_until_complete:
+            return "in_progress"
+
+        if batch["results"] is None:
+            batch["results"] = self._run(batch["input_file_path"])
+        return "completed"
+
+    def get_results(self, batch_id: str) -> List[Dict[str, Any]]:
+        results = self._batches[batch_id]["results"]
+        if results is None:
+            raise ValueError(f"Batch {batch_id} has not completed yet")
+        return results
+
+    def _run(self, input_file_path: str) -> List[Dict[str, Any]]:
+        results = []
+        with open(input_file_path, "r") as file:
+            for line in file:
+                if not line.strip():
+                    continue
+                request = json.loads(line)
+                try:
+                    content = self._respond(request["body"])
+                    response = {"status_code": 200, "body": {"choices": [{"index": 0, "message": {"role": "assistant", "content": content}}]}}
+                    error = None
+                except Exception as e:
+                    response = None
+                    error = {"code": "local_batch_error", "message": str(e)}
+                results.append({"id": f"batch_req_{uuid.uuid4().hex}", "custom_id": request["custom_id"],
+                                "response": response, "error": error})
+        return results
@@ -0,0 +1,198 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from enum import Enum
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel
+
+from ..data_types import ConversationContext, EntitySpeaking, LLMCallTelemetry, LLMResponse, ToolCall
+from ..interfaces import LLMInterface
+from ..telemetry import TelemetryRecorder
+
+DEFAULT_CACHE_PATH = ".cache/llm_responses.sqlite"
+# Running the eviction after every write would make recording slower than the LLM calls it saves
+EVICTION_INTERVAL_WRITES = 100
+
+
+class CacheMode(Enum):
+    """How a CachedLLMProvider uses its cache"""
+    READ_THROUGH = "read_through"  # serve hits from the cache, call the LLM and store on misses
+    RECORD = "record"  # always call the LLM and overwrite the stored response
+    REPLAY = "replay"  # only serve from the cache, a miss raises CacheMissError
+
+
+class CacheMissError(Exception):
+    """Raised in replay mode when a request was never recorded"""
+
+
+class LLMResponseCache:
+    """SQLite store of serialized LLM responses with TTL and size-based eviction of the least recently used entries"""
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl_seconds: Optional[float] = None,
+                 max_entries: Optional[int] = None, max_size_bytes: Optional[int] = None):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_size_bytes = max_size_bytes
+        self._writes_since_eviction = 0
+        # A single connection shared by all threads, serialized through the lock
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("""CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_accessed REAL NOT NULL
+        )""")
+        self._connection.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+
+            value, created_at = row
+            if self.ttl_seconds is not None and now - created_at > self.ttl_seconds:
+                self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._connection.commit()
+                return None
+
+            self._connection.execute("UPDATE responses SET last_accessed = ? WHERE key = ?", (now, key))
+            self._connection.commit()
+            return value
+
+    def set(self, key: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._connection.execute("INSERT OR REPLACE INTO responses (key, value, created_at, last_accessed) VALUES (?, ?, ?, ?)",
+                                     (key, value, now, now))
+            self._connection.commit()
+            self._writes_since_eviction += 1
+            if self._writes_since_eviction >= EVICTION_INTERVAL_WRITES:
+                self._evict()
+
+    def evict(self):
+        """Remove expired entries, then the least recently used ones until the size limits are met"""
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        self._writes_since_eviction = 0
+        if self.ttl_seconds is not None:
+            self._connection.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+
+        if self.max_entries is not None:
+            self._connection.execute("""DELETE FROM responses WHERE key IN (
+                SELECT key FROM responses ORDER BY last_accessed DESC LIMIT -1 OFFSET ?)""", (self.max_entries,))
+
+        if self.max_size_bytes is not None:
+            total_size = self._connection.execute("SELECT COALESCE(SUM(LENGTH(value)), 0) FROM responses").fetchone()[0]
+            if total_size > self.max_size_bytes:
+                rows = self._connection.execute("SELECT key, LENGTH(value) FROM responses ORDER BY last_accessed ASC")
+                keys_to_delete = []
+                for key, size in rows:
+                    if total_size <= self.max_size_bytes:
+                        break
+                    keys_to_delete.append((key,))
+                    total_size -= size
+                self._connection.executemany("DELETE FROM responses WHERE key = ?", keys_to_delete)
+
+        self._connection.commit()
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute("DELETE FROM responses")
+            self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+def _serialize_tool_calls(tools_called) -> Optional[List[Dict[str, Any]]]:
+    if not tools_called:
+        return None
+    return [ToolCall.from_tool_call(tool_call).to_dict() for tool_call in tools_called]
+
+
+class CachedLLMProvider(LLMInterface):
+    """
+    Wraps any LLMInterface and stores its responses keyed by a hash of the model, messages, tools and response format,
+    so that re-running a test suite replays identical turns from disk instead of regenerating them.
+    """
+    def __init__(self, llm: LLMInterface, cache: LLMResponseCache, mode: CacheMode = CacheMode.READ_THROUGH,
+                 model: Optional[str] = None, telemetry_recorder: Optional[TelemetryRecorder] = None):
+        self.llm = llm
+        self.cache = cache
+        self.mode = mode
+        self.model = model or getattr(llm, "model", type(llm).__name__)
+        # Misses are recorded by the wrapped provider, hits are recorded here
+        self.telemetry_recorder = telemetry_recorder
+
+    def _cache_key(self, kind: str, messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]] = None,
+                   response_format: Optional[type] = None) -> str:
+        payload = {
+            "kind": kind,
+            "model": self.model,
+            "messages": messages,
+            "tools": tools or None,
+            "response_format": response_format.model_json_schema() if response_format else None,
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def _lookup(self, key: str) -> Optional[str]:
+        if self.mode == CacheMode.RECORD:
+            return None
+
+        value = self.cache.get(key)
+        if value is None and self.mode == CacheMode.REPLAY:
+            raise CacheMissError(f"No cached response for request {key} of model {self.model}")
+        return value
+
+    def _record_hit(self, started_at: float) -> LLMCallTelemetry:
+        telemetry = LLMCallTelemetry(model=self.model, wall_time=time.perf_counter() - started_at, from_cache=True)
+        if self.telemetry_recorder:
+            self.telemetry_recorder.record(telemetry)
+        return telemetry
+
+    def generate_response_with_conversation_history(self, context: ConversationContext,
+                                                     entity_speaking: EntitySpeaking,
+                                                     tools: Optional[List[Dict[str, Any]]] = None,
+                                                     user_input: str = None) -> LLMResponse:
+        return self.generate_response(context.to_messages(entity_speaking, user_input), tools)
+
+    def generate_response_with_structured_output(self, messages: List[Dict[str, Any]], response_format: BaseModel):
+        started_at = time.perf_counter()
+        key = self._cache_key("structured_output", messages, response_format=response_format)
+        cached_value = self._lookup(key)
+        if cached_value is not None:
+            self._record_hit(started_at)
+            return response_format.model_validate_json(cached_value)
+
+        response = self.llm.generate_response_with_structured_output(messages, response_format)
+        self.cache.set(key, response.model_dump_json())
+        return response
+
+    def generate_response(self, messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]] = None) -> LLMResponse:
+        started_at = time.perf_counter()
+        key = self._cache_key("response", messages, tools)
+        cached_value = self._lookup(key)
+        if cached_value is not None:
+            data = json.loads(cached_value)
+            tools_called = [ToolCall.from_dict(tool_call) for tool_call in data["tools_called"]] if data["tools_called"] else None
+            return LLMResponse(data["response_content"], tools_called, telemetry=self._record_hit(started_at))
+
+        response = self.llm.generate_response(messages, tools)
+        self.cache.set(key, json.dumps({
+            "response_content": response.response_content,
+            "tools_called": _serialize_tool_calls(response.tools_called),
+        }))
+        return response
@@ -0,0 +1,44 @@
+import asyncio
+import threading
+import weakref
+from typing import Optional
+
+import httpx
+
+# Generous limits so that concurrent conversations reuse warm keep-alive connections instead of opening new ones
+HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=50, keepalive_expiry=60)
+HTTP_TIMEOUT = httpx.Timeout(600, connect=10)
+
+_lock = threading.Lock()
+_sync_client: Optional[httpx.Client] = None
+# httpx.AsyncClient is bound to the event loop it was first used in, so keep one pool per running loop
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def get_shared_http_client() -> httpx.Client:
+    """Returns the process-wide HTTP/2 connection pool used by all synchronous providers"""
+    global _sync_client
+    with _lock:
+        if _sync_client is None or _sync_client.is_closed:
+            _sync_client = httpx.Client(http2=True, limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+        return _sync_client
+
+
+def get_shared_async_http_client() -> httpx.AsyncClient:
+    """Returns the HTTP/2 connection pool shared by all async providers running in the current event loop"""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        client = _async_clients.get(loop)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(http2=True, limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+            _async_clients[loop] = client
+        return client
+
+
+async def close_shared_async_http_client():
+    """Closes the connection pool of the current event loop, call before the loop shuts down"""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        client = _async_clients.pop(loop, None)
+    if client is not None:
+        await client.aclose()
@@ -0,0 +1,300 @@
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+import time
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from ..data_types import (ConversationContext, EntitySpeaking, EvaluationResponse, FunctionCall, LLMCallTelemetry,
+                          LLMResponse, MetricResult, ResponseDelta, TokenUsage, ToolCall)
+from ..interfaces import AsyncLLMInterface, LLMInterface
+from ..metrics_registry import RANGE_SCORE_MAX
+from ..telemetry import TelemetryRecorder
+
+MOCK_VOCABULARY = ("sure", "I", "can", "help", "with", "that", "the", "booking", "is", "confirmed", "for", "tomorrow",
+                   "could", "you", "please", "repeat", "your", "name", "thanks", "a", "lot", "one", "moment")
+# Matches the metrics rendered into the evaluator system prompt by MetricDefinition.to_prompt
+METRIC_PROMPT_PATTERN = re.compile(r"Metric: (?P<name>.+)\n(?:.*\n)*?Output type: (?P<output>\w+)\n(?:Success threshold: (?P<threshold>\d+)\n)?")
+
+
+@dataclass
+class LatencyDistribution:
+    """Simulated latency in seconds, `constant`, `uniform` between low and high, or `lognormal` around a median"""
+    kind: str = "constant"
+    value: float = 0.0
+    low: float = 0.0
+    high: float = 0.0
+    median: float = 0.0
+    sigma: float = 0.5
+
+    @classmethod
+    def constant(cls, value: float) -> "LatencyDistribution":
+        return cls(kind="constant", value=value)
+
+    @classmethod
+    def uniform(cls, low: float, high: float) -> "LatencyDistribution":
+        return cls(kind="uniform", low=low, high=high)
+
+    @classmethod
+    def lognormal(cls, median: float, sigma: float = 0.5) -> "LatencyDistribution":
+        """Long-tailed like real API latencies, p99 is about median * e^(2.3 * sigma)"""
+        return cls(kind="lognormal", median=median, sigma=sigma)
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "constant":
+            return self.value
+        if self.kind == "uniform":
+            return rng.uniform(self.low, self.high)
+        if self.kind == "lognormal":
+            return self.median * math.exp(rng.gauss(0, self.sigma)) if self.median > 0 else 0.0
+        raise ValueError(f"Unknown latency distribution {self.kind}")
+
+
+def _estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def stub_evaluation_response(messages: List[Dict[str, Any]], rng: random.Random) -> EvaluationResponse:
+    """Evaluation of every metric listed in the evaluator system prompt, with random but well-formed scores"""
+    system_prompt = next((message["content"] for message in messages if message["role"] == "system"), "")
+    results = []
+    for match in METRIC_PROMPT_PATTERN.finditer(system_prompt):
+        threshold = int(match["threshold"]) if match["threshold"] else 0
+        if match["output"] == "range_score":
+            eval_output = str(rng.randint(0, RANGE_SCORE_MAX))
+        else:
+            eval_output = str(rng.random() < 0.8).lower()
+        results.append(MetricResult(name=match["name"].strip(), eval_output_type=match["output"], eval_output=eval_output,
+                                    eval_output_success_threshold=threshold, reasoning="Mock evaluation", evidence=""))
+    return EvaluationResponse(summary="Mock evaluation of the conversation", evaluation_results=results)
+
+
+def stub_structured_output(response_format: type, rng: random.Random) -> BaseModel:
+    """Fill every required field of a pydantic model with a placeholder of its type"""
+    def placeholder(annotation) -> Any:
+        origin = getattr(annotation, "__origin__", None)
+        if origin in (list, List):
+            return [placeholder(annotation.__args__[0])]
+        if origin is not None and type(None) in getattr(annotation, "__args__", ()):
+            return None
+        if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+            return stub_structured_output(annotation, rng)
+        if annotation is bool:
+            return rng.random() < 0.5
+        if annotation is int:
+            return rng.randint(0, RANGE_SCORE_MAX)
+        if annotation is float:
+            return rng.random()
+        if isinstance(annotation, type) and issubclass(annotation, Enum):
+            return rng.choice(list(annotation))
+        return "mock"
+
+    return response_format(**{name: placeholder(field.annotation)
+                              for name, field in response_format.model_fields.items() if field.is_required()})
+
+
+def _split_into_deltas(response: LLMResponse) -> List[ResponseDelta]:
+    """Word-sized content deltas, or a single delta per tool call, like a streaming provider would send"""
+    if response.tools_called:
+        return [ResponseDelta(tool_call_index=index, tool_call_id=tool_call.id, tool_name=tool_call.function.name,
+                              tool_arguments=tool_call.function.arguments)
+                for index, tool_call in enumerate(response.tools_called)]
+    words = response.response_content.split(" ")
+    return [ResponseDelta(content=word if index == 0 else f" {word}") for index, word in enumerate(words)]
+
+
+class MockLLMProvider(LLMInterface):
+    """
+    Deterministic, offline LLMInterface for load testing and profiling the test harness without tokens or network.
+
+    Responses are derived from a hash of the request, so the same conversation always gets the same responses
+    regardless of call order or concurrency. The turn number is the count of non-system messages, which keeps the
+    provider stateless and safe to share between threads and runners.
+    """
+    def __init__(self, responses: Optional[List[str]] = None, model: str = "mock", seed: int = 0,
+                 latency: Optional[LatencyDistribution] = None,
+                 time_to_first_token: Optional[LatencyDistribution] = None,
+                 end_conversation_after_turns: Optional[int] = None, end_tool_name: str = "end_conversation",
+                 end_tool_arguments: Optional[Dict[str, Any]] = None,
+                 structured_output: Optional[Callable[[List[Dict[str, Any]], type], BaseModel]] = None,
+                 telemetry_recorder: Optional[TelemetryRecorder] = None):
+        """
+        Args:
+            responses: Scripted responses, picked by turn number. Random words from MOCK_VOCABULARY if None.
+            latency: Total time of a call, no delay if None
+            time_to_first_token: Delay before the first streamed delta, a fifth of the latency if None
+            end_conversation_after_turns: Call `end_tool_name` once the conversation has this many turns,
+                if the tool is offered in the request
+            structured_output: Builds structured output responses, EvaluationResponse and placeholder stubs by default
+        """
+        self.responses = responses
+        self.model = model
+        self.seed = seed
+        self.latency = latency or LatencyDistribution.constant(0.0)
+        self.time_to_first_token = time_to_first_token
+        self.end_conversation_after_turns = end_conversation_after_turns
+        self.end_tool_name = end_tool_name
+        self.end_tool_arguments = end_tool_arguments or {"reason": "Mock conversation finished",
+                                                         "who_ended_conversation": "agent",
+                                                         "termination_evidence": "Turn limit of the mock provider"}
+        self.structured_output = structured_output
+        self.telemetry_recorder = telemetry_recorder
+
+    def _rng(self, kind: str, messages: List[Dict[str, Any]]) -> random.Random:
+        digest = hashlib.sha256(json.dumps([self.seed, kind, messages], sort_keys=True, default=str).encode("utf-8")).digest()
+        return random.Random(digest)
+
+    def _sample_delays(self, rng: random.Random) -> Tuple[float, float]:
+        """Returns the time to first token and the remaining generation time of a call"""
+        total = self.latency.sample(rng)
+        first_token = self.time_to_first_token.sample(rng) if self.time_to_first_token else total / 5
+        return min(first_token, total), max(0.0, total - first_token)
+
+    def _create_response(self, messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]],
+                         rng: random.Random) -> LLMResponse:
+        turn = sum(1 for message in messages if message["role"] != "system")
+        offered_tools = {tool["function"]["name"] for tool in tools or [] if tool.get("type") == "function"}
+        if self.end_conversation_after_turns and turn >= self.end_conversation_after_turns and self.end_tool_name in offered_tools:
+            tool_call = ToolCall(id=f"call_mock_{rng.getrandbits(64):016x}",
+                                 function=FunctionCall(name=self.end_tool_name, arguments=json.dumps(self.end_tool_arguments)))
+            return LLMResponse(None, [tool_call])
+
+        if self.responses:
+            content = self.responses[turn % len(self.responses)]
+        else:
+            content = " ".join(rng.choice(MOCK_VOCABULARY) for _ in range(rng.randint(5, 30))).capitalize() + "."
+        return LLMResponse(content, None)
+
+    def _create_structured_output(self, messages: List[Dict[str, Any]], response_format: type, rng: random.Random) -> BaseModel:
+        if self.structured_output:
+            return self.structured_output(messages, response_format)
+        if response_format is EvaluationResponse:
+            return stub_evaluation_response(messages, rng)
+        return stub_structured_output(response_format, rng)
+
+    def _finish(self, response: Optional[LLMResponse], messages: List[Dict[str, Any]], output: str, wall_time: float,
+                time_to_first_token: Optional[float] = None) -> LLMCallTelemetry:
+        usage = TokenUsage(prompt_tokens=_estimate_tokens(json.dumps(messages, default=str)),
+                           completion_tokens=_estimate_tokens(output))
+        telemetry = LLMCallTelemetry(model=self.model, usage=usage, wall_time=wall_time,
+                                     time_to_first_token=time_to_first_token)
+        if self.telemetry_recorder:
+            self.telemetry_recorder.record(telemetry)
+        if response:
+            response.usage = usage
+            response.telemetry = telemetry
+        return telemetry
+
+    @staticmethod
+    def _output_text(response: LLMResponse) -> str:
+        return response.response_content or "".join(tool_call.function.arguments for tool_call in response.tools_called or [])
+
+    def plain_call(self, system_prompt: str, messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]] = None) -> LLMResponse:
+        return self.generate_response([{"role": "system", "content": system_prompt}] + messages, tools)
+
+    def generate_response_with_conversation_history(self, context: ConversationContext,
+                                                     entity_speaking: EntitySpeaking,
+                                                     tools: Optional[List[Dict[str, Any]]] = None,
+                                                     user_input: str = None) -> LLMResponse:
+        return self.generate_response(context.to_messages(entity_speaking, user_input), tools)
+
+    def generate_response_with_structured_output(self, messages: List[Dict[str, Any]], response_format: BaseModel):
+        started_at = time.perf_counter()
+        rng = self._rng("structured_output", messages)
+        first_token, generation = self._sample_delays(rng)
+        time.sleep(first_token + generation)
+        parsed = self._create_structured_output(messages, response_format, rng)
+        self._finish(None, messages, parsed.model_dump_json(), time.perf_counter() - started_at)
+        return parsed
+
+    def generate_response(self, messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]] = None) -> LLMResponse:
+        started_at = time.perf_counter()
+        rng = self._rng("response", messages)
+        first_token, generation = self._sample_delays(rng)
+        time.sleep(first_token + generation)
+        response = self._create_response(messages, tools, rng)
+        self._finish(response, messages, self._output_text(response), time.perf_counter() - started_at)
+        return response
+
+    def stream_response(self, messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]] = None) -> Iterator[ResponseDelta]:
+        started_at = time.perf_counter()
+        rng = self._rng("response", messages)
+        first_token, generation = self._sample_delays(rng)
+        response = self._create_response(messages, tools, rng)
+        deltas = _split_into_deltas(response)
+
+        time.sleep(first_token)
+        first_token_at = time.perf_counter()
+        for index, delta in enumerate(deltas):
+            if index:
+                time.sleep(generation / len(deltas))
+            yield delta
+
+        telemetry = self._finish(None, messages, self._output_text(response), time.perf_counter() - started_at,
+                                 first_token_at - started_at)
+        yield ResponseDelta(usage=telemetry.usage, telemetry=telemetry)
+
+    async def analyze_image(self, image_path: str, prompt: str, response_format: BaseModel):
+        """Placeholder answer of the requested format, the image isn't read"""
+        return stub_structured_output(response_format, self._rng("image", [{"role": "user", "content": prompt}]))
+
+
+class AsyncMockLLMProvider(AsyncLLMInterface):
+    """AsyncLLMInterface counterpart of MockLLMProvider, delays are awaited so thousands of calls can share one loop"""
+    def __init__(self, *args, **kwargs):
+        self._mock = MockLLMProvider(*args, **kwargs)
+        self.model = self._mock.model
+
+    async def plain_call(self, system_prompt: str, messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]] = None) -> LLMResponse:
+        return await self.generate_response([{"role": "system", "content": system_prompt}] + messages, tools)
+
+    async def generate_response_with_conversation_history(self, context: ConversationContext,
+                                                           entity_speaking: EntitySpeaking,
+                                                           tools: Optional[List[Dict[str, Any]]] = None,
+                                                           user_input: str = None) -> LLMResponse:
+        return await self.generate_response(context.to_messages(entity_speaking, user_input), tools)
+
+    async def generate_response_with_structured_output(self, messages: List[Dict[str, Any]], response_format: BaseModel):
+        started_at = time.perf_counter()
+        rng = self._mock._rng("structured_output", messages)
+        first_token, generation = self._mock._sample_delays(rng)
+        await asyncio.sleep(first_token + generation)
+        parsed = self._mock._create_structured_output(messages, response_format, rng)
+        self._mock._finish(None, messages, parsed.model_dump_json(), time.perf_counter() - started_at)
+        return parsed
+
+    async def generate_response(self, messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]] = None) -> LLMResponse:
+        started_at = time.perf_counter()
+        rng = self._mock._rng("response", messages)
+        first_token, generation = self._mock._sample_delays(rng)
+        await asyncio.sleep(first_token + generation)
+        response = self._mock._create_response(messages, tools, rng)
+        self._mock._finish(response, messages, self._mock._output_text(response), time.perf_counter() - started_at)
+        return response
+
+    async def stream_response(self, messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]] = None) -> AsyncIterator[ResponseDelta]:
+        started_at = time.perf_counter()
+        rng = self._mock._rng("response", messages)
+        first_token, generation = self._mock._sample_delays(rng)
+        response = self._mock._create_response(messages, tools, rng)
+        deltas = _split_into_deltas(response)
+
+        await asyncio.sleep(first_token)
+        first_token_at = time.perf_counter()
+        for index, delta in enumerate(deltas):
+            if index:
+                await asyncio.sleep(generation / len(deltas))
+            yield delta
+
+        telemetry = self._mock._finish(None, messages, self._mock._output_text(response), time.perf_counter() - started_at,
+                                       first_token_at - started_at)
+        yield ResponseDelta(usage=telemetry.usage, telemetry=telemetry)
+
+    async def analyze_image(self, image_path: str, prompt: str, response_format: BaseModel):
+        return await self._mock.analyze_image(image_path, prompt, response_format)
@@ -1,16 +1,157 @@
+import asyncio
 import base64
-from typing import Any, Dict, List, Optional
+import json
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
 import openai
 from pydantic import BaseModel
-from ..interfaces import LLMInterface
-from ..data_types import ConversationContext, EntitySpeaking, LLMResponse
+from ..interfaces import AsyncLLMInterface, LLMInterface
+from ..data_types import ConversationContext, EntitySpeaking, LLMCallTelemetry, LLMResponse, ResponseDelta, TokenUsage
+from ..rate_limiter import Priority, RateLimiter, RetryPolicy, get_rate_limiter, parse_reset_duration
+from ..telemetry import TelemetryRecorder
+from .http_client import get_shared_async_http_client, get_shared_http_client
+
+RETRYABLE_STATUS_CODES = (408, 409, 429, 500, 502, 503, 504)
+
+
+def _build_image_messages(image_path: str, prompt: str) -> List[Dict[str, Any]]:
+    with open(image_path, "rb") as image_file:
+        base64_image = base64.b64encode(image_file.read()).decode("utf-8")
+
+    return [{
+            "role": "user",
+            "content": [
+                {
+                    "type": "text",
+                    "text": prompt
+                },
+                {
+                    "type": "image_url",
+                    "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"},
+                },
+            ],
+        }
+    ]
+
+
+def parse_usage(usage) -> Optional[TokenUsage]:
+    """Convert the usage field of an OpenAI response, including the prompt tokens served from the prompt cache"""
+    if usage is None:
+        return None
+
+    prompt_tokens_details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = getattr(prompt_tokens_details, "cached_tokens", None) or 0
+    return TokenUsage(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens,
+                      cached_tokens=cached_tokens)
+
+
+def parse_stream_chunk(chunk) -> List[ResponseDelta]:
+    """Convert a streamed chat completion chunk into deltas, the last chunk only carries the usage"""
+    deltas = []
+    if chunk.choices:
+        delta = chunk.choices[0].delta
+        if delta.content:
+            deltas.append(ResponseDelta(content=delta.content))
+        for tool_call in delta.tool_calls or []:
+            deltas.append(ResponseDelta(tool_call_index=tool_call.index, tool_call_id=tool_call.id,
+                                        tool_name=tool_call.function.name if tool_call.function else None,
+                                        tool_arguments=tool_call.function.arguments if tool_call.function else None))
+    if getattr(chunk, "usage", None):
+        deltas.append(ResponseDelta(usage=parse_usage(chunk.usage)))
+    return deltas
+
+
+def create_telemetry(model: str, telemetry_recorder: Optional[TelemetryRecorder], usage: Optional[TokenUsage],
+                     started_at: float, first_token_at: Optional[float] = None, retries: int = 0) -> LLMCallTelemetry:
+    """Build the telemetry of a finished call and hand it to the recorder, if any"""
+    telemetry = LLMCallTelemetry(
+        model=model,
+        usage=usage or TokenUsage(),
+        wall_time=time.perf_counter() - started_at,
+        time_to_first_token=first_token_at - started_at if first_token_at is not None else None,
+        retries=retries,
+    )
+    if telemetry_recorder:
+        telemetry_recorder.record(telemetry)
+    return telemetry
+
+
+def is_first_token(delta: ResponseDelta) -> bool:
+    return bool(delta.content) or delta.tool_call_index is not None
+
+
+def estimate_tokens(messages: List[Dict[str, Any]]) -> int:
+    """Rough prompt size used to reserve tokens per minute before the request is sent, about 4 characters per token"""
+    return len(json.dumps(messages, default=str)) // 4
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code in RETRYABLE_STATUS_CODES
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """Seconds the server asked to wait before retrying, None if it didn't say"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+
+    headers = response.headers
+    retry_after_ms = parse_reset_duration(headers.get("retry-after-ms"))
+    if retry_after_ms is not None:
+        return retry_after_ms / 1000
+    retry_after = parse_reset_duration(headers.get("retry-after"))
+    if retry_after is not None:
+        return retry_after
+    resets = [parse_reset_duration(headers.get(name)) for name in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens")]
+    resets = [reset for reset in resets if reset is not None]
+    return max(resets) if resets else None
 
 
 class OpenAIProvider(LLMInterface):
-    def __init__(self, api_key: str, model: str = "gpt-4o-mini"):
+    def __init__(self, api_key: str, model: str = "gpt-4o-mini", rate_limiter: Optional[RateLimiter] = None,
+                 telemetry_recorder: Optional[TelemetryRecorder] = None, priority: Priority = Priority.AGENT,
+                 retry_policy: Optional[RetryPolicy] = None, base_url: Optional[str] = None):
+        """
+        Args:
+            rate_limiter: Limiter of the model, defaults to the one shared by every provider of the process
+            priority: Evaluator providers should use Priority.EVALUATOR so conversations are served first
+            retry_policy: Backoff for 429s, 5xx and connection errors, retries are done here instead of in the SDK
+            base_url: OpenAI-compatible endpoint, e.g. a local stand-in server
+        """
         self.model = model
-        openai.api_key = api_key
-        self.client = openai.OpenAI(api_key=api_key)
+        # All providers share one keep-alive connection pool instead of opening their own
+        self.client = openai.OpenAI(api_key=api_key, base_url=base_url, http_client=get_shared_http_client(),
+                                    max_retries=0)
+        self.rate_limiter = rate_limiter or get_rate_limiter(model)
+        self.telemetry_recorder = telemetry_recorder
+        self.priority = priority
+        self.retry_policy = retry_policy or RetryPolicy()
+
+    def _request(self, create: Callable[[], Any], estimated_tokens: int) -> Tuple[Any, int]:
+        """Send a raw-response request through the rate limiter and retry it, returns the parsed result and the retries"""
+        for attempt in range(self.retry_policy.max_retries + 1):
+            self.rate_limiter.acquire(estimated_tokens, self.priority)
+            try:
+                raw_response = create()
+            except Exception as e:
+                if attempt == self.retry_policy.max_retries or not is_retryable(e):
+                    raise
+                delay = self.retry_policy.delay(attempt, get_retry_after(e))
+                if getattr(e, "status_code", None) == 429:
+                    # Back off every request of the model, the next acquire waits for the pause to end
+                    self.rate_limiter.pause(delay)
+                else:
+                    time.sleep(delay)
+                continue
+
+            self.rate_limiter.update_from_headers(raw_response.headers)
+            return raw_response.parse(), attempt
+
+    def _reconcile(self, estimated_tokens: int, usage: Optional[TokenUsage]):
+        if usage:
+            self.rate_limiter.reconcile(estimated_tokens, usage.prompt_tokens + usage.completion_tokens)
 
     def plain_call(self, system_prompt: str, messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]] = None) -> LLMResponse:
         return self.generate_response([{"role": "system", "content": system_prompt}] + messages, tools)
@@ -19,67 +160,186 @@ class OpenAIProvider(LLMInterface):
                                                      entity_speaking: EntitySpeaking,
                                                      tools: Optional[List[Dict[str, Any]]] = None,
                                                      user_input: str = None) -> List[Dict[str, Any]]:
-        messages = [{"role": "system", "content": context.system_prompt}]
-        for msg in context.conversation_history:
-            role = "assistant" if msg["speaker"] == entity_speaking.value else "user"
-            messages.append({"role": role, "content": msg["text"]})
-
-        if user_input:
-            messages.append({"role": "user", "content": user_input})
-
-        return self.generate_response(messages, tools)
+        return self.generate_response(context.to_messages(entity_speaking, user_input), tools)
 
     def generate_response_with_structured_output(self, messages: List[Dict[str, Any]], response_format: BaseModel):
-        try:
-            chat_completion = self.client.beta.chat.completions.parse(
-                messages=messages,
-                model=self.model,
-                response_format=response_format,
-            )
-
-            return chat_completion.choices[0].message.parsed
-        except Exception as e:
-            raise Exception(f"OpenAI API error: {str(e)}")
+        estimated_tokens = estimate_tokens(messages)
+        started_at = time.perf_counter()
+        chat_completion, retries = self._request(lambda: self.client.beta.chat.completions.with_raw_response.parse(
+            messages=messages,
+            model=self.model,
+            response_format=response_format,
+        ), estimated_tokens)
+
+        usage = parse_usage(chat_completion.usage)
+        self._reconcile(estimated_tokens, usage)
+        create_telemetry(self.model, self.telemetry_recorder, usage, started_at, retries=retries)
+        return chat_completion.choices[0].message.parsed
         
     def generate_response(self, messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]] = None) -> str:        
-        try:
-            chat_completion = self.client.chat.completions.create(
-                messages=messages,
-                model=self.model,
-                tools=tools
-            )
-            
-            response_msg = chat_completion.choices[0].message
-            return LLMResponse(response_msg.content, response_msg.tool_calls)
-        except Exception as e:
-            raise Exception(f"OpenAI API error: {str(e)}")
+        estimated_tokens = estimate_tokens(messages)
+        started_at = time.perf_counter()
+        chat_completion, retries = self._request(lambda: self.client.chat.completions.with_raw_response.create(
+            messages=messages,
+            model=self.model,
+            tools=tools
+        ), estimated_tokens)
+        
+        response_msg = chat_completion.choices[0].message
+        usage = parse_usage(chat_completion.usage)
+        self._reconcile(estimated_tokens, usage)
+        return LLMResponse(response_msg.content, response_msg.tool_calls, usage,
+                           create_telemetry(self.model, self.telemetry_recorder, usage, started_at, retries=retries))
+
+    def stream_response(self, messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]] = None) -> Iterator[ResponseDelta]:
+        estimated_tokens = estimate_tokens(messages)
+        started_at = time.perf_counter()
+        # Only opening the stream is retried, a stream failing midway can't be resumed
+        stream, retries = self._request(lambda: self.client.chat.completions.with_raw_response.create(
+            messages=messages,
+            model=self.model,
+            tools=tools,
+            stream=True,
+            stream_options={"include_usage": True}
+        ), estimated_tokens)
+
+        usage = None
+        first_token_at = None
+        for chunk in stream:
+            for delta in parse_stream_chunk(chunk):
+                if first_token_at is None and is_first_token(delta):
+                    first_token_at = time.perf_counter()
+                usage = delta.usage or usage
+                yield delta
+
+        self._reconcile(estimated_tokens, usage)
+        yield ResponseDelta(telemetry=create_telemetry(self.model, self.telemetry_recorder, usage, started_at,
+                                                       first_token_at, retries))
     
     async def analyze_image(self, image_path: str, prompt: str, response_format: BaseModel) -> str:
-        def encode_image(image_path):
-            with open(image_path, "rb") as image_file:
-                return base64.b64encode(image_file.read()).decode("utf-8")
+        chat_completion, _ = self._request(lambda: self.client.beta.chat.completions.with_raw_response.parse(
+            model=self.model,
+            messages=_build_image_messages(image_path, prompt),
+            response_format=response_format,
+            ), 0)
+
+        return chat_completion.choices[0].message.parsed
+
+
+class AsyncOpenAIProvider(AsyncLLMInterface):
+    """OpenAI provider whose calls can be awaited, all instances share the event loop's HTTP/2 connection pool"""
+    def __init__(self, api_key: str, model: str = "gpt-4o-mini", rate_limiter: Optional[RateLimiter] = None,
+                 telemetry_recorder: Optional[TelemetryRecorder] = None, priority: Priority = Priority.AGENT,
+                 retry_policy: Optional[RetryPolicy] = None, base_url: Optional[str] = None):
+        self.api_key = api_key
+        self.model = model
+        self.base_url = base_url
+        self.rate_limiter = rate_limiter or get_rate_limiter(model)
+        self.telemetry_recorder = telemetry_recorder
+        self.priority = priority
+        self.retry_policy = retry_policy or RetryPolicy()
+        self._client = None
+        self._client_loop = None
+
+    @property
+    def client(self) -> openai.AsyncOpenAI:
+        # The connection pool belongs to the running event loop, rebind if the provider is reused in a new loop
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            self._client = openai.AsyncOpenAI(api_key=self.api_key, base_url=self.base_url,
+                                              http_client=get_shared_async_http_client(), max_retries=0)
+            self._client_loop = loop
+        return self._client
+
+    async def _request(self, create: Callable[[], Awaitable[Any]], estimated_tokens: int) -> Tuple[Any, int]:
+        for attempt in range(self.retry_policy.max_retries + 1):
+            await self.rate_limiter.acquire_async(estimated_tokens, self.priority)
+            try:
+                raw_response = await create()
+            except Exception as e:
+                if attempt == self.retry_policy.max_retries or not is_retryable(e):
+                    raise
+                delay = self.retry_policy.delay(attempt, get_retry_after(e))
+                if getattr(e, "status_code", None) == 429:
+                    self.rate_limiter.pause(delay)
+                else:
+                    await asyncio.sleep(delay)
+                continue
+
+            self.rate_limiter.update_from_headers(raw_response.headers)
+            return raw_response.parse(), attempt
+
+    def _reconcile(self, estimated_tokens: int, usage: Optional[TokenUsage]):
+        if usage:
+            self.rate_limiter.reconcile(estimated_tokens, usage.prompt_tokens + usage.completion_tokens)
 
-        base64_image = encode_image(image_path)
-        chat_completion = self.client.beta.chat.completions.parse(
+    async def plain_call(self, system_prompt: str, messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]] = None) -> LLMResponse:
+        return await self.generate_response([{"role": "system", "content": system_prompt}] + messages, tools)
+
+    async def generate_response_with_conversation_history(self, context: ConversationContext,
+                                                           entity_speaking: EntitySpeaking,
+                                                           tools: Optional[List[Dict[str, Any]]] = None,
+                                                           user_input: str = None) -> LLMResponse:
+        return await self.generate_response(context.to_messages(entity_speaking, user_input), tools)
+
+    async def generate_response_with_structured_output(self, messages: List[Dict[str, Any]], response_format: BaseModel):
+        estimated_tokens = estimate_tokens(messages)
+        started_at = time.perf_counter()
+        chat_completion, retries = await self._request(lambda: self.client.beta.chat.completions.with_raw_response.parse(
+            messages=messages,
             model=self.model,
-            messages=[{
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": prompt
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"},
-                        },
-                    ],
-                }
-            ],               
             response_format=response_format,
-            )
+        ), estimated_tokens)
 
+        usage = parse_usage(chat_completion.usage)
+        self._reconcile(estimated_tokens, usage)
+        create_telemetry(self.model, self.telemetry_recorder, usage, started_at, retries=retries)
         return chat_completion.choices[0].message.parsed
-    
 
-      
\ No newline at end of file
+    async def generate_response(self, messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]] = None) -> LLMResponse:
+        estimated_tokens = estimate_tokens(messages)
+        started_at = time.perf_counter()
+        chat_completion, retries = await self._request(lambda: self.client.chat.completions.with_raw_response.create(
+            messages=messages,
+            model=self.model,
+            tools=tools
+        ), estimated_tokens)
+
+        response_msg = chat_completion.choices[0].message
+        usage = parse_usage(chat_completion.usage)
+        self._reconcile(estimated_tokens, usage)
+        return LLMResponse(response_msg.content, response_msg.tool_calls, usage,
+                           create_telemetry(self.model, self.telemetry_recorder, usage, started_at, retries=retries))
+
+    async def stream_response(self, messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]] = None) -> AsyncIterator[ResponseDelta]:
+        estimated_tokens = estimate_tokens(messages)
+        started_at = time.perf_counter()
+        stream, retries = await self._request(lambda: self.client.chat.completions.with_raw_response.create(
+            messages=messages,
+            model=self.model,
+            tools=tools,
+            stream=True,
+            stream_options={"include_usage": True}
+        ), estimated_tokens)
+
+        usage = None
+        first_token_at = None
+        async for chunk in stream:
+            for delta in parse_stream_chunk(chunk):
+                if first_token_at is None and is_first_token(delta):
+                    first_token_at = time.perf_counter()
+                usage = delta.usage or usage
+                yield delta
+
+        self._reconcile(estimated_tokens, usage)
+        yield ResponseDelta(telemetry=create_telemetry(self.model, self.telemetry_recorder, usage, started_at,
+                                                       first_token_at, retries))
+
+    async def analyze_image(self, image_path: str, prompt: str, response_format: BaseModel) -> str:
+        chat_completion, _ = await self._request(lambda: self.client.beta.chat.completions.with_raw_response.parse(
+            model=self.model,
+            messages=_build_image_messages(image_path, prompt),
+            response_format=response_format,
+        ), 0)
+
+        return chat_completion.choices[0].message.parsed
@@ -0,0 +1,121 @@
+import json
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+from ..stand_in_server import StandInRequestHandler, StandInServer
+
+
+def _estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+class _ChatCompletionsHandler(StandInRequestHandler):
+    def do_POST(self):
+        server = self.stand_in
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+
+        prompt_tokens = _estimate_tokens(json.dumps(body.get("messages", [])))
+        admission = server._admit(prompt_tokens)
+        if admission["status"] != 200:
+            error = {"error": {"message": "Rate limit reached" if admission["status"] == 429 else "Server overloaded",
+                               "type": "requests", "code": str(admission["status"])}}
+            self.send_json(admission["status"], error, admission["headers"])
+            return
+
+        if server.latency_sec:
+            time.sleep(server.latency_sec)
+        content = server.responder(body)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": _estimate_tokens(content),
+                 "total_tokens": prompt_tokens + _estimate_tokens(content)}
+        common = {"id": completion_id, "created": int(time.time()), "model": body.get("model", "stand-in")}
+
+        if body.get("stream"):
+            chunks = [
+                {**common, "object": "chat.completion.chunk",
+                 "choices": [{"index": 0, "delta": {"role": "assistant", "content": content}, "finish_reason": None}]},
+                {**common, "object": "chat.completion.chunk",
+                 "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]},
+                {**common, "object": "chat.completion.chunk", "choices": [], "usage": usage},
+            ]
+            events = "".join(f"data: {json.dumps(chunk)}\n\n" for chunk in chunks) + "data: [DONE]\n\n"
+            self.send_body(200, events.encode(), "text/event-stream", admission["headers"])
+            return
+
+        completion = {**common, "object": "chat.completion", "usage": usage,
+                      "choices": [{"index": 0, "finish_reason": "stop",
+                                   "message": {"role": "assistant", "content": content}}]}
+        self.send_json(200, completion, admission["headers"])
+
+
+class StandInOpenAIServer(StandInServer):
+    """
+    Local OpenAI-compatible /v1/chat/completions endpoint with its own requests and tokens per minute quota.
+    Requests over the quota get a 429 with retry-after and x-ratelimit-* headers like the real API, so the rate limiter
+    and retries of OpenAIProvider can be exercised without an API key, e.g.
+
+        with StandInOpenAIServer(requests_per_minute=30) as server:
+            llm = OpenAIProvider("test", "stand-in", base_url=server.base_url)
+    """
+    handler_class = _ChatCompletionsHandler
+    base_path = "/v1"
+
+    def __init__(self, requests_per_minute: int = 60, tokens_per_minute: int = 100_000,
+                 responder: Optional[Callable[[Dict[str, Any]], str]] = None, latency_sec: float = 0.0,
+                 fail_first: int = 0, port: int = 0):
+        """
+        Args:
+            responder: Returns the completion content of a request body, a fixed message by default.
+                Structured output requests need a responder returning JSON matching the requested schema.
+            latency_sec: Delay before each successful response
+            fail_first: Number of initial requests answered with a 503 to exercise retries of server errors
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.responder = responder or (lambda body: "Hello from the stand-in server")
+        self.latency_sec = latency_sec
+        self.fail_first = fail_first
+        self.requests_received = 0
+        self.requests_rate_limited = 0
+        self._window = deque()  # (timestamp, tokens) of the requests accepted in the last minute
+        self._lock = threading.Lock()
+        super().__init__(port)
+
+    def _admit(self, tokens: int) -> Dict[str, Any]:
+        """Account for a request against the quota, returns its status code and rate limit headers"""
+        with self._lock:
+            self.requests_received += 1
+            now = time.monotonic()
+            while self._window and now - self._window[0][0] >= 60:
+                self._window.popleft()
+
+            used_tokens = sum(window_tokens for _, window_tokens in self._window)
+            rate_limited = len(self._window) >= self.requests_per_minute or used_tokens + tokens > self.tokens_per_minute
+            status = 200
+            if self.requests_received <= self.fail_first:
+                status = 503
+            elif rate_limited:
+                status = 429
+                self.requests_rate_limited += 1
+            else:
+                self._window.append((now, tokens))
+                used_tokens += tokens
+
+            reset = 60 - (now - self._window[0][0]) if self._window else 0.0
+            headers = {
+                "x-ratelimit-limit-requests": str(self.requests_per_minute),
+                "x-ratelimit-limit-tokens": str(self.tokens_per_minute),
+                "x-ratelimit-remaining-requests": str(max(0, self.requests_per_minute - len(self._window))),
+                "x-ratelimit-remaining-tokens": str(max(0, self.tokens_per_minute - used_tokens)),
+                "x-ratelimit-reset-requests": f"{reset:.3f}s",
+                "x-ratelimit-reset-tokens": f"{reset:.3f}s",
+            }
+            if status == 429:
+                headers["retry-after"] = f"{reset:.3f}"
+            return {"status": status, "headers": headers}
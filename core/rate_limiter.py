@@ -0,0 +1,215 @@
+import asyncio
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import Dict, Mapping, Optional
+
+# Evaluator calls leave this share of each bucket to agent and callee turns
+EVALUATOR_RESERVED_FRACTION = 0.2
+# Upper bound for a single sleep so waiting callers re-check the buckets after header updates
+MAX_WAIT_SLICE = 1.0
+
+
+class Priority(IntEnum):
+    """Lower values are served first when the quota runs low"""
+    AGENT = 0  # agent and callee turns, a running conversation waits on them
+    EVALUATOR = 1  # evaluations can be delayed without slowing down any conversation
+
+
+def parse_reset_duration(value: Optional[str]) -> Optional[float]:
+    """Parse an x-ratelimit-reset-* header such as `1s`, `6m0s` or `20ms` into seconds"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    units = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    if not parts:
+        return None
+    return sum(float(amount) * units[unit] for amount, unit in parts)
+
+
+class _TokenBucket:
+    """Bucket refilling continuously up to `capacity` per minute, unlimited while the capacity is unknown"""
+    def __init__(self, capacity: Optional[float] = None):
+        self.capacity = capacity
+        self.level = capacity
+        self._updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        if self.capacity is not None:
+            self.level = min(self.capacity, self.level + (now - self._updated_at) * self.capacity / 60.0)
+        self._updated_at = now
+
+    def wait_time(self, amount: float, reserved: float, now: float) -> float:
+        """Seconds until `amount` can be taken while keeping `reserved` of the capacity in the bucket"""
+        self._refill(now)
+        if self.capacity is None:
+            return 0.0
+        # A single request larger than the whole bucket is let through once the bucket is full
+        needed = min(amount + reserved * self.capacity, self.capacity)
+        if self.level >= needed:
+            return 0.0
+        return (needed - self.level) * 60.0 / self.capacity
+
+    def take(self, amount: float):
+        if self.capacity is not None:
+            self.level -= amount
+
+    def update(self, limit: Optional[float], remaining: Optional[float], now: float):
+        """Adopt the limit and remaining quota reported by the server"""
+        self._refill(now)
+        if limit is not None and limit > 0:
+            if self.capacity is None:
+                self.level = limit
+            self.capacity = limit
+        if remaining is not None and self.capacity is not None:
+            self.level = min(self.level, remaining)
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket limiter for the requests and tokens per minute of a model.
+    Limits that aren't configured are learnt from the x-ratelimit-* response headers, and a 429 pauses every caller
+    until the quota resets. Agent turns are served before evaluator calls when the quota runs low.
+    Use `get_rate_limiter` to share one limiter per model across all providers of the process.
+    """
+    def __init__(self, requests_per_minute: Optional[int] = None, tokens_per_minute: Optional[int] = None):
+        if requests_per_minute is not None and requests_per_minute <= 0:
+            raise ValueError("requests_per_minute must be a positive number")
+        if tokens_per_minute is not None and tokens_per_minute <= 0:
+            raise ValueError("tokens_per_minute must be a positive number")
+        self._requests = _TokenBucket(requests_per_minute)
+        self._tokens = _TokenBucket(tokens_per_minute)
+        self._paused_until = 0.0
+        self._waiting_agents = 0
+        self._lock = threading.Lock()
+
+    @property
+    def requests_per_minute(self) -> Optional[float]:
+        return self._requests.capacity
+
+    @property
+    def tokens_per_minute(self) -> Optional[float]:
+        return self._tokens.capacity
+
+    def _try_acquire(self, estimated_tokens: int, priority: Priority) -> float:
+        """Take a request and the estimated tokens if available, otherwise return how long to wait before retrying"""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+
+            reserved = 0.0
+            if priority == Priority.EVALUATOR:
+                if self._waiting_agents:
+                    return 0.05
+                reserved = EVALUATOR_RESERVED_FRACTION
+
+            wait_time = max(self._requests.wait_time(1, reserved, now),
+                            self._tokens.wait_time(estimated_tokens, reserved, now))
+            if wait_time > 0:
+                return wait_time
+
+            self._requests.take(1)
+            self._tokens.take(estimated_tokens)
+            return 0.0
+
+    def _set_waiting(self, priority: Priority, delta: int):
+        if priority == Priority.AGENT:
+            with self._lock:
+                self._waiting_agents += delta
+
+    def acquire(self, estimated_tokens: int = 0, priority: Priority = Priority.AGENT):
+        """Block until the caller is allowed to send a request of about `estimated_tokens` tokens"""
+        wait_time = self._try_acquire(estimated_tokens, priority)
+        if wait_time == 0:
+            return
+
+        self._set_waiting(priority, 1)
+        try:
+            while wait_time > 0:
+                time.sleep(min(wait_time, MAX_WAIT_SLICE))
+                wait_time = self._try_acquire(estimated_tokens, priority)
+        finally:
+            self._set_waiting(priority, -1)
+
+    async def acquire_async(self, estimated_tokens: int = 0, priority: Priority = Priority.AGENT):
+        """Wait without blocking the event loop until the caller is allowed to send the next request"""
+        wait_time = self._try_acquire(estimated_tokens, priority)
+        if wait_time == 0:
+            return
+
+        self._set_waiting(priority, 1)
+        try:
+            while wait_time > 0:
+                await asyncio.sleep(min(wait_time, MAX_WAIT_SLICE))
+                wait_time = self._try_acquire(estimated_tokens, priority)
+        finally:
+            self._set_waiting(priority, -1)
+
+    def reconcile(self, estimated_tokens: int, actual_tokens: int):
+        """Correct the tokens bucket once the real usage of a request is known"""
+        with self._lock:
+            self._tokens.take(actual_tokens - estimated_tokens)
+
+    def update_from_headers(self, headers: Mapping[str, str]):
+        """Sync the buckets with the x-ratelimit-* headers of a response"""
+        def header_value(name: str) -> Optional[float]:
+            try:
+                return float(headers.get(name))
+            except (TypeError, ValueError):
+                return None
+
+        with self._lock:
+            now = time.monotonic()
+            self._requests.update(header_value("x-ratelimit-limit-requests"),
+                                  header_value("x-ratelimit-remaining-requests"), now)
+            self._tokens.update(header_value("x-ratelimit-limit-tokens"),
+                                header_value("x-ratelimit-remaining-tokens"), now)
+
+    def pause(self, seconds: float):
+        """Hold back every caller, e.g. after a 429, so the whole process backs off instead of each request alone"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+_rate_limiters: Dict[str, RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(model: str) -> RateLimiter:
+    """Returns the process-wide limiter of a model, its limits are learnt from response headers until configured"""
+    with _rate_limiters_lock:
+        if model not in _rate_limiters:
+            _rate_limiters[model] = RateLimiter()
+        return _rate_limiters[model]
+
+
+def configure_rate_limit(model: str, requests_per_minute: Optional[int] = None,
+                         tokens_per_minute: Optional[int] = None) -> RateLimiter:
+    """Replace the process-wide limiter of a model with one using known limits"""
+    with _rate_limiters_lock:
+        _rate_limiters[model] = RateLimiter(requests_per_minute, tokens_per_minute)
+        return _rate_limiters[model]
+
+
+@dataclass
+class RetryPolicy:
+    """Exponential backoff with full jitter for rate limited, overloaded and dropped requests"""
+    max_retries: int = 5
+    base_delay: float = 0.5
+    max_delay: float = 60.0
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Delay before retry number `attempt` (0-based), never shorter than the server's retry-after"""
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after is not None:
+            return min(self.max_delay, retry_after + backoff)
+        return backoff
@@ -0,0 +1,66 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Type
+
+
+class StandInRequestHandler(BaseHTTPRequestHandler):
+    """Handler of a StandInServer's requests, `stand_in` is the server it answers for"""
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def stand_in(self) -> "StandInServer":
+        return self.server.stand_in
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, status: int, body: bytes, content_type: str = "application/json",
+                  headers: Optional[Dict[str, str]] = None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        self.send_body(status, json.dumps(body).encode(), headers=headers)
+
+
+class StandInServer:
+    """
+    Local stand-in for a remote API, serving `handler_class` on a background thread so clients can run offline.
+    Use as a context manager, subclasses set `handler_class` and the `base_path` of the API.
+    """
+    handler_class: Type[StandInRequestHandler]
+    base_path = ""
+
+    def __init__(self, port: int = 0):
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self.handler_class)
+        self._server.stand_in = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}{self.base_path}"
+
+    def start(self) -> str:
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,116 @@
+import math
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .data_types import LLMCallTelemetry, TestResult
+
+# USD per 1M tokens: (input, cached input, output). Update when prices change or models are added.
+MODEL_PRICES_PER_MILLION_TOKENS: Dict[str, Tuple[float, float, float]] = {
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4-turbo": (10.00, 10.00, 30.00),
+    "gpt-3.5-turbo": (0.50, 0.50, 1.50),
+    "o1-preview": (15.00, 7.50, 60.00),
+    "o1-mini": (3.00, 1.50, 12.00),
+}
+
+
+def estimate_cost(telemetry: LLMCallTelemetry) -> Optional[float]:
+    """Estimated cost of a call in USD, None if the model's price is unknown. Calls served from a local cache are free."""
+    if telemetry.from_cache:
+        return 0.0
+
+    prices = MODEL_PRICES_PER_MILLION_TOKENS.get(telemetry.model)
+    if prices is None:
+        return None
+
+    input_price, cached_input_price, output_price = prices
+    usage = telemetry.usage
+    uncached_prompt_tokens = usage.prompt_tokens - usage.cached_tokens
+    return (uncached_prompt_tokens * input_price + usage.cached_tokens * cached_input_price +
+            usage.completion_tokens * output_price) / 1_000_000
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """Nearest-rank percentile of a non-empty list"""
+    sorted_values = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+@dataclass
+class ModelTelemetrySummary:
+    """Latency and cost of all calls made to a model"""
+    model: str
+    calls: int
+    cache_hits: int
+    retries: int
+    latency_p50: float
+    latency_p95: float
+    latency_p99: float
+    prompt_tokens: int
+    cached_tokens: int
+    completion_tokens: int
+    # None if the price of the model is unknown
+    cost_usd: Optional[float]
+
+
+def summarize_calls(calls: Iterable[LLMCallTelemetry]) -> Dict[str, ModelTelemetrySummary]:
+    """Aggregate call telemetry per model"""
+    calls_by_model: Dict[str, List[LLMCallTelemetry]] = {}
+    for call in calls:
+        calls_by_model.setdefault(call.model, []).append(call)
+
+    summaries = {}
+    for model, model_calls in sorted(calls_by_model.items()):
+        wall_times = [call.wall_time for call in model_calls]
+        costs = [estimate_cost(call) for call in model_calls]
+        summaries[model] = ModelTelemetrySummary(
+            model=model,
+            calls=len(model_calls),
+            cache_hits=sum(call.from_cache for call in model_calls),
+            retries=sum(call.retries for call in model_calls),
+            latency_p50=percentile(wall_times, 50),
+            latency_p95=percentile(wall_times, 95),
+            latency_p99=percentile(wall_times, 99),
+            prompt_tokens=sum(call.usage.prompt_tokens for call in model_calls),
+            cached_tokens=sum(call.usage.cached_tokens for call in model_calls),
+            completion_tokens=sum(call.usage.completion_tokens for call in model_calls),
+            cost_usd=None if None in costs else sum(costs),
+        )
+
+    return summaries
+
+
+def summarize_test_results(tests_results: Dict[str, Dict[str, Any]]) -> Dict[str, ModelTelemetrySummary]:
+    """Aggregate the turn telemetry of a run_tests result across the whole variation matrix"""
+    test_results: List[TestResult] = [test_result["result"] for test_result in tests_results.values()]
+    return summarize_calls(turn.telemetry for test_result in test_results for turn in test_result.turn_telemetry)
+
+
+def print_telemetry_summary(summaries: Dict[str, ModelTelemetrySummary]):
+    for summary in summaries.values():
+        cost = f"${summary.cost_usd:.4f}" if summary.cost_usd is not None else "unknown cost"
+        print(f"[{summary.model}] {summary.calls} calls ({summary.cache_hits} cached, {summary.retries} retries), "
+              f"latency p50/p95/p99: {summary.latency_p50:.2f}s/{summary.latency_p95:.2f}s/{summary.latency_p99:.2f}s, "
+              f"tokens in/cached/out: {summary.prompt_tokens}/{summary.cached_tokens}/{summary.completion_tokens}, {cost}")
+
+
+class TelemetryRecorder:
+    """Thread-safe collector of every call made by the providers it is passed to, including evaluator calls"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: List[LLMCallTelemetry] = []
+
+    def record(self, telemetry: LLMCallTelemetry):
+        with self._lock:
+            self._calls.append(telemetry)
+
+    @property
+    def calls(self) -> List[LLMCallTelemetry]:
+        with self._lock:
+            return list(self._calls)
+
+    def summarize(self) -> Dict[str, ModelTelemetrySummary]:
+        return summarize_calls(self.calls)
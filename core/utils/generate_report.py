@@ -13,6 +13,13 @@ def get_metric_success_indicator(metric):
         return "✅" if int(metric.eval_output) > metric.eval_output_success_threshold else "❌"
 
 
+def get_evaluation_results(test_result: TestResult):
+    """Metric results of a test, empty if its evaluation failed or never returned, e.g. from a deferred batch"""
+    if test_result.evaluation_result is None:
+        return []
+    return test_result.evaluation_result.evaluation_results
+
+
 def generate_test_results_report(tests_run_result: Dict[str, TestResult]):
     if not tests_run_result:
         return
@@ -108,11 +115,18 @@ def generate_test_results_report(tests_run_result: Dict[str, TestResult]):
     else:
         html += f"<th class='llm-column'>LLM</th>"
 
+    # Streaming latency of the agent's turns, so latency regressions between models show up next to the metrics
+    has_turn_latencies = any(getattr(test_result['result'], 'agent_turn_latencies', None)
+                             for test_result in tests_run_result.values())
+    if has_turn_latencies:
+        html += f"<th class='llm-column'>Agent Avg TTFT (s)</th>"
+        html += f"<th class='llm-column'>Agent Tokens/s</th>"
+
     # Get all unique metric names
     metric_names = set()
     for test_result in tests_run_result.values():
         metric_names.update(
-            m.name for m in test_result['result'].evaluation_result.evaluation_results)
+            m.name for m in get_evaluation_results(test_result['result']))
 
     # Add metric column headers in alphabetical order
     metric_names = sorted(metric_names)
@@ -138,7 +152,7 @@ def generate_test_results_report(tests_run_result: Dict[str, TestResult]):
         html += f"""
         <tr class="test-group test-group-{css_class_name}">
           <td>
-            <div class="test-name">{test_name}</div>
+            <div class="test-name">{test_name}</div>{'<div class="result failure">Evaluation failed</div>' if tests_components_result["result"].evaluation_result is None else ''}
           </td>
           <td>
             <button class="conversation-btn" onclick="showConversation('{test_name.replace("'", "\\'").replace('"', '\\"')}')">
@@ -166,9 +180,18 @@ def generate_test_results_report(tests_run_result: Dict[str, TestResult]):
                                         [0]}</span>' if tests_components_result["tested_component"] else ''}
           </td>"""
 
+        if has_turn_latencies:
+            test_result = tests_components_result["result"]
+            avg_ttft = test_result.avg_time_to_first_token
+            avg_tokens_per_second = test_result.avg_tokens_per_second
+            html += f"""
+          <td>{f'{avg_ttft:.2f}' if avg_ttft is not None else 'N/A'}</td>
+          <td>{f'{avg_tokens_per_second:.1f}' if avg_tokens_per_second is not None else 'N/A'}</td>"""
+
         # Create a dict for quick metric lookup, sorted alphabetically by metric name
         metrics_dict = {
-            m.name: m for m in tests_components_result["result"].evaluation_result.evaluation_results}
+            m.name: m for m in get_evaluation_results(tests_components_result["result"])}
+        evaluation_failed = tests_components_result["result"].evaluation_result is None
 
         # Add data for each metric
         for metric_name in metric_names:
@@ -185,6 +208,9 @@ def generate_test_results_report(tests_run_result: Dict[str, TestResult]):
             <div class="result {success_class}">{symbol} {success}{score}</div>
                 <div class="reasoning">{metric.reasoning.replace('\n', '<br>')}</div>
               </td>"""
+            elif evaluation_failed:
+                html += """
+          <td><div class="result failure">Evaluation failed</div></td>"""
             else:
                 html += """
           <td>N/A</td>"""
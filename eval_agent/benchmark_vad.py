@@ -0,0 +1,124 @@
+"""
+Per-frame CPU cost of the Silero VAD paths and the latency they add to the microphone audio path.
+Run from the eval_agent directory: python benchmark_vad.py [recording.wav]
+"""
+import argparse
+import asyncio
+import time
+import wave
+
+import numpy as np
+import torch
+
+from voice_activity_detector import FRAME_SAMPLES, FRAME_SEC, SAMPLE_RATE, VoiceActivityDetector
+
+
+def create_recording(duration_sec: float, seed: int = 0) -> bytes:
+    """16 kHz int16 PCM alternating voiced bursts and low noise"""
+    rng = np.random.default_rng(seed)
+    samples = rng.normal(0, 100, int(duration_sec * SAMPLE_RATE))
+    time_sec = 0.5
+    while time_sec < duration_sec:
+        end = min(time_sec + rng.uniform(0.5, 3), duration_sec)
+        first, last = int(time_sec * SAMPLE_RATE), int(end * SAMPLE_RATE)
+        t = np.arange(last - first) / SAMPLE_RATE
+        envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 4 * t) ** 2
+        samples[first:last] += 6000 * envelope * (np.sin(2 * np.pi * 140 * t) + 0.5 * np.sin(2 * np.pi * 280 * t))
+        time_sec = end + rng.uniform(0.3, 2)
+    return np.clip(samples, -32768, 32767).astype(np.int16).tobytes()
+
+
+def read_recording(path: str) -> bytes:
+    with wave.open(path, "rb") as file:
+        if file.getframerate() != SAMPLE_RATE or file.getnchannels() != 1 or file.getsampwidth() != 2:
+            raise ValueError("Expected a 16 kHz mono 16-bit WAV file")
+        return file.readframes(file.getnframes())
+
+
+def legacy_is_speech(model, audio_data: bytes, threshold: float = 0.5) -> bool:
+    """The per-frame conversion replaced by VoiceActivityDetector, kept for comparison"""
+    audio_np = np.frombuffer(audio_data, dtype=np.int16)
+    audio_float = audio_np.astype(np.float32) / 32768.0
+    audio_tensor = torch.from_numpy(audio_float)
+    speech_prob = model(audio_tensor, 16000).item()
+    return speech_prob > threshold
+
+
+def time_frames(function, frames) -> tuple:
+    """Wall and CPU milliseconds per frame"""
+    wall_started, cpu_started = time.perf_counter(), time.process_time()
+    for frame in frames:
+        function(frame)
+    return ((time.perf_counter() - wall_started) * 1000 / len(frames),
+            (time.process_time() - cpu_started) * 1000 / len(frames))
+
+
+async def measure_audio_path(vad: VoiceActivityDetector, frames, off_loop: bool) -> tuple:
+    """
+    Frames arrive in real time like microphone reads. Returns the p50 and p99 milliseconds from a frame's arrival to
+    its speech decision, and the worst lateness of a 5 ms ticker standing in for the websocket tasks.
+    """
+    stall = 0.0
+    running = True
+
+    async def ticker():
+        nonlocal stall
+        while running:
+            expected = time.perf_counter() + 0.005
+            await asyncio.sleep(0.005)
+            stall = max(stall, time.perf_counter() - expected)
+
+    ticker_task = asyncio.create_task(ticker())
+    latencies = []
+    for frame in frames:
+        arrived_at = time.perf_counter()
+        if off_loop:
+            await vad.process_async(frame)
+        else:
+            vad.process(frame)
+        latencies.append(time.perf_counter() - arrived_at)
+        await asyncio.sleep(max(0.0, FRAME_SEC - (time.perf_counter() - arrived_at)))
+    running = False
+    await ticker_task
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+    return p50, p99, stall * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("recording", nargs="?", help="16 kHz mono 16-bit WAV, a synthetic minute by default")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--realtime-frames", type=int, default=200, help="Frames of the real-time audio path runs")
+    parser.add_argument("--torch-threads", type=int, default=1, help="torch intra-op threads, 0 leaves torch's default")
+    args = parser.parse_args()
+
+    pcm = read_recording(args.recording) if args.recording else create_recording(60)
+    frames = [pcm[index:index + FRAME_SAMPLES * 2] for index in range(0, len(pcm) - FRAME_SAMPLES * 2 + 1, FRAME_SAMPLES * 2)]
+    vad = VoiceActivityDetector(num_threads=args.torch_threads)
+    print(f"{len(frames)} frames of {FRAME_SAMPLES} samples ({len(frames) * FRAME_SEC:.0f}s), "
+          f"torch threads: {torch.get_num_threads()}")
+    legacy_wall, legacy_cpu = time_frames(lambda frame: legacy_is_speech(vad.model, frame), frames)
+    vad.reset()
+    streaming_wall, streaming_cpu = time_frames(vad.process, frames)
+    vad.reset()
+    wall_started, cpu_started = time.perf_counter(), time.process_time()
+    events = vad.detect_events(pcm, args.batch_size)
+    batched_wall = (time.perf_counter() - wall_started) * 1000 / len(frames)
+    batched_cpu = (time.process_time() - cpu_started) * 1000 / len(frames)
+
+    print(f"\n{'per frame':<34}{'wall ms':>10}{'CPU ms':>10}")
+    print(f"{'legacy is_speech':<34}{legacy_wall:>10.3f}{legacy_cpu:>10.3f}")
+    print(f"{'streaming process':<34}{streaming_wall:>10.3f}{streaming_cpu:>10.3f}")
+    print(f"{f'offline batched ({args.batch_size} frames/call)':<34}{batched_wall:>10.3f}{batched_cpu:>10.3f}")
+    print(f"{sum(event.kind == 'start' for event in events)} speech segments detected offline")
+
+    print(f"\n{'audio path':<34}{'p50 ms':>10}{'p99 ms':>10}{'loop stall ms':>15}")
+    for name, off_loop in (("on the event loop", False), ("off the event loop", True)):
+        vad.reset()
+        p50, p99, stall = asyncio.run(measure_audio_path(vad, frames[:args.realtime_frames], off_loop))
+        print(f"{name:<34}{p50:>10.3f}{p99:>10.3f}{stall:>15.3f}")
+    vad.close()
+
+
+if __name__ == "__main__":
+    main()
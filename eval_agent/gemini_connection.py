@@ -2,16 +2,26 @@ import asyncio
 import os
 import json
 import base64
-import pyaudio
+import time
+from collections import deque
 from websockets import connect
 from concurrent.futures import CancelledError
 
-from voice_activity_detector import VoiceActivityDetector
+from transports import INPUT_RATE, OUTPUT_RATE, AudioSink, AudioSource, MicrophoneSource, SpeakerSink
 
+GEMINI_URI = ("wss://generativelanguage.googleapis.com/ws/"
+              "google.ai.generativelanguage.v1alpha.GenerativeService.BidiGenerateContent")
 
 
 class GeminiConnection:
-    def __init__(self, config=None, cleanup_event=None, on_connect=None):
+    def __init__(self, config=None, cleanup_event=None, on_connect=None, source: AudioSource = None,
+                 sink: AudioSink = None, uri: str = None):
+        """
+        Args:
+            source: Callee audio, the microphone by default. A WavFileSource or GeneratorSource runs headless.
+            sink: Agent audio, the speakers by default. A MemoryRecorder runs headless.
+            uri: WebSocket endpoint, Gemini's by default, e.g. a StandInGeminiServer's uri
+        """
         # Your Gemini API key. Must be set as an environment variable or replace here with a string.
         self.api_key = os.environ.get("GEMINI_API_KEY")
         # The Gemini 2.0 (flash) model name
@@ -24,19 +34,23 @@ class GeminiConnection:
         
         # WebSocket endpoint for Gemini's BidiGenerateContent API
         # Format: wss://generativelanguage.googleapis.com/ws/google.ai.generativelanguage.v1alpha.GenerativeService.BidiGenerateContent?key=API_KEY
-        self.uri = (
-            "wss://generativelanguage.googleapis.com/ws/"
-            "google.ai.generativelanguage.v1alpha.GenerativeService.BidiGenerateContent"
-            f"?key={self.api_key}"
-        )
+        self.uri = uri or f"{GEMINI_URI}?key={self.api_key}"
         self.ws = None
-        self.vad = VoiceActivityDetector()
+        self.source = source
+        self.sink = sink
+        # The VAD mutes background noise of live microphones, file and synthetic sources are sent as they are
+        self.vad = None
+        if self.config.get("use_vad", source is None):
+            from voice_activity_detector import VoiceActivityDetector
+            # torch's thread count is process-wide, it's only changed when the config asks for it
+            self.vad = VoiceActivityDetector(num_threads=self.config.get("vad_num_threads"))
+            # Frames held back while the VAD decides, the speech start event confirms them `min_speech_frames` late
+            self._pre_roll = deque(maxlen=self.vad.min_speech_frames)
 
         # Audio settings
-        self.FORMAT = pyaudio.paInt16
         self.CHANNELS = 1
-        self.INPUT_RATE = 16000   # Gemini expects 16 kHz for input
-        self.OUTPUT_RATE = 24000  # Gemini outputs audio at 24 kHz
+        self.INPUT_RATE = INPUT_RATE
+        self.OUTPUT_RATE = OUTPUT_RATE
         self.CHUNK = 512
 
         # An asyncio.Queue to buffer server audio data
@@ -46,12 +60,19 @@ class GeminiConnection:
         self.running = True
         self.cleanup_event = cleanup_event
         self.on_connect = on_connect
-        self.allow_interruptions = config.get("allow_interruptions", False)
+        self.allow_interruptions = self.config.get("allow_interruptions", False)
+        # Seconds from the end of the callee's speech to the first audio of each agent answer
+        self.response_latencies = []
+        self._answer_started_at = None
+        self._answering = False
+        self.input_finished = False
 
 
     async def cleanup(self):
         """Clean up resources when stopping."""
         self.running = False
+        # Wakes play_responses up if it's waiting for audio
+        self.audio_queue.put_nowait(None)
         if self.ws:
             try:
                 await self.ws.close()
@@ -96,7 +117,7 @@ class GeminiConnection:
             await self.ws.send(json.dumps(setup_message))
 
             first_msg = await self.ws.recv()
-            print("Connected to Gemini. Speak into your microphone.")
+            print("Connected to Gemini. Speak into your microphone." if self.source is None else "Connected to Gemini.")
             
             # Signal successful connection
             if self.on_connect:
@@ -114,47 +135,42 @@ class GeminiConnection:
             await self.cleanup()
 
     async def capture_audio(self):
-        """Capture audio from your Mac's microphone and send to Gemini in realtime."""
-        audio = pyaudio.PyAudio()
-        stream = None
+        """Capture audio from the source, your Mac's microphone by default, and send to Gemini in realtime."""
+        source = None
         try:
-            stream = audio.open(
-                format=self.FORMAT,
-                channels=self.CHANNELS,
-                rate=self.INPUT_RATE,
-                input=True,
-                frames_per_buffer=self.CHUNK
-            )
+            source = self.source or MicrophoneSource(self.INPUT_RATE, self.CHUNK)
 
             while self.running:
                 try:
-                    data = await asyncio.to_thread(stream.read, self.CHUNK, exception_on_overflow=False)
-                    
+                    data = await source.read(self.CHUNK)
+                    if data is None:
+                        # The callee has said everything, the call ends once the agent completes its answer
+                        self.input_finished = True
+                        if not self._awaiting_response() and not self._answering:
+                            self.audio_queue.put_nowait(None)
+                        break
+
                     # Check if we should process input based on interruption settings
                     should_process = (not self.is_playing) or (self.is_playing and self.allow_interruptions)
 
                     if should_process:
-                        if not self.vad.is_speech(data):
-                            if not hasattr(self, '_printed_no_speech'):
-                                print("No speech detected")
-                                self._printed_no_speech = True
-                            data = b'\x00' * len(data)
-                        else:
-                            self._printed_no_speech = False
-                        
-                        encoded_data = base64.b64encode(data).decode("utf-8")
-                        realtime_input_msg = {
-                            "realtime_input": {
-                                "media_chunks": [
-                                    {
-                                        "data": encoded_data,
-                                        "mime_type": "audio/pcm"
-                                    }
-                                ]
+                        chunks = [data] if self.vad is None else await self._gate_speech(data)
+                        for chunk in chunks:
+                            encoded_data = base64.b64encode(chunk).decode("utf-8")
+                            realtime_input_msg = {
+                                "realtime_input": {
+                                    "media_chunks": [
+                                        {
+                                            "data": encoded_data,
+                                            "mime_type": "audio/pcm"
+                                        }
+                                    ]
+                                }
                             }
-                        }
-                        await self.ws.send(json.dumps(realtime_input_msg))
+                            await self.ws.send(json.dumps(realtime_input_msg))
                     else:
+                        if self.vad is not None:
+                            self._pre_roll.clear()
                         if not hasattr(self, '_printed_skip_message'):
                             print("Skipping input while Gemini is speaking")
                             self._printed_skip_message = True
@@ -172,16 +188,35 @@ class GeminiConnection:
         except Exception as e:
             print(f"Unexpected error in capture_audio: {e}")
         finally:
-            if stream is not None and stream.is_active():
+            if source is not None:
                 try:
-                    stream.stop_stream()
-                    stream.close()
-                except OSError:
+                    source.close()
+                except:
                     pass  # Ignore errors during cleanup
-            try:
-                audio.terminate()
-            except:
-                pass  # Ignore errors during cleanup
+            if self.vad is not None:
+                self.vad.close()
+
+    async def _gate_speech(self, data):
+        """
+        Frames to send for the next microphone frame, speech as is and anything else as silence. Frames wait in the
+        pre-roll until the VAD decides, so the start of an utterance is sent instead of muted.
+        """
+        # Inference runs on the detector's thread, the loop keeps sending and receiving meanwhile
+        event = await self.vad.process_async(data)
+        if self.vad.in_speech:
+            self._printed_no_speech = False
+            # The frames before the start event are the beginning of the utterance
+            chunks = [*self._pre_roll, data] if event is not None else [data]
+            self._pre_roll.clear()
+            return chunks
+
+        if not hasattr(self, '_printed_no_speech'):
+            print("No speech detected")
+            self._printed_no_speech = True
+        # A full pre-roll releases its oldest frame, muted, so the stream keeps its pace
+        chunks = [b'\x00' * len(self._pre_roll[0])] if len(self._pre_roll) == self._pre_roll.maxlen else []
+        self._pre_roll.append(data)
+        return chunks
 
     async def receive_server_messages(self):
         async for msg in self.ws:
@@ -195,6 +230,8 @@ class GeminiConnection:
                         # This indicates audio data
                         audio_data_b64 = p["inlineData"]["data"]
                         audio_bytes = base64.b64decode(audio_data_b64)
+                        self._record_response_latency()
+                        self._answering = True
                         self.audio_queue.put_nowait(audio_bytes)
                     elif "text" in p:
                         # If the model also responds with text, you can process it here
@@ -205,47 +242,60 @@ class GeminiConnection:
             # Check if the model ended its turn
             try:
                 turn_complete = response["serverContent"]["turnComplete"]
+                if turn_complete:
+                    self._answering = False
+                if turn_complete and self.input_finished:
+                    # Last answer of a file or generator source, play_responses ends the call once it's played
+                    self.audio_queue.put_nowait(None)
+                    return
                 if turn_complete:
                     # If the user interrupts or the turn is done, any leftover audio is ignored or cleared.
                     while not self.audio_queue.empty():
                         self.audio_queue.get_nowait()
             except KeyError:
                 pass
+        # The server closed the connection
+        await self.cleanup()
+
+    def _awaiting_response(self):
+        """Whether the callee spoke since the agent's last answer started, when the source knows when it speaks"""
+        last_speech_at = getattr(self.source, "last_speech_at", None)
+        return last_speech_at is not None and (self._answer_started_at is None or last_speech_at > self._answer_started_at)
+
+    def _record_response_latency(self):
+        """Latency of the first audio of each answer, from the callee's last speech before it"""
+        if self._answering:
+            return
+        answer_started_at = time.perf_counter()
+        if self._awaiting_response():
+            self.response_latencies.append(answer_started_at - self.source.last_speech_at)
+        self._answer_started_at = answer_started_at
 
     async def play_responses(self):
-        """Pull audio data from the queue and play it through speakers."""
-        audio = pyaudio.PyAudio()
-        stream = audio.open(
-            format=self.FORMAT,
-            channels=self.CHANNELS,
-            rate=self.OUTPUT_RATE,
-            output=True
-        )
+        """Pull audio data from the queue and play it through the sink, your speakers by default."""
+        sink = self.sink or SpeakerSink(self.OUTPUT_RATE)
 
         try:
             while self.running:
                 audio_chunk = await self.audio_queue.get()
+                if audio_chunk is None:
+                    break
                 self.is_playing = True  # Set flag before playing
-                await asyncio.to_thread(stream.write, audio_chunk)
+                await sink.write(audio_chunk)
                 self.is_playing = False  # Clear flag after playing
         except CancelledError:
             print("Playback cancelled")
         except Exception as e:
             print(f"Unexpected error in play_responses: {e}")
         finally:
-            stream.stop_stream()
-            stream.close()
-            audio.terminate()
+            sink.close()
+            if self.input_finished:
+                await self.cleanup()
 
     async def watch_cleanup(self):
         """Watch for cleanup event from main thread"""
         while self.running:
-            if self.cleanup_event.is_set():
+            if self.cleanup_event is not None and self.cleanup_event.is_set():
                 self.running = False
                 break
             await asyncio.sleep(0.1)
-
-
-
-
-
@@ -0,0 +1,115 @@
+"""
+Headless simulated calls: callee audio comes from WAV files or synthetic speech instead of the microphone, the
+agent's answers are recorded in memory instead of played, and many calls run in parallel. Prints the agent's
+response latency, from the end of the callee's speech to the first audio of the answer.
+Run from the eval_agent directory: python simulate.py [callee.wav ...] [--calls 8] [--uri ws://...]
+Without --uri the calls go to a local StandInGeminiServer that echoes the callee.
+"""
+import argparse
+import asyncio
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from gemini_connection import GeminiConnection
+from stand_in_server import StandInGeminiServer
+from transports import INPUT_RATE, AudioSource, GeneratorSource, MemoryRecorder, WavFileSource
+
+DEFAULT_CONFIG = {
+    "system_prompt": "You are a friendly Gemini 2.0 model. Respond verbally in a casual, helpful tone.",
+    "voice": "Puck",
+    "google_search": False,
+    "allow_interruptions": False,
+    "use_vad": False,
+}
+
+
+@dataclass
+class SimulatedCall:
+    recorder: MemoryRecorder
+    response_latencies: List[float] = field(default_factory=list)
+    timed_out: bool = False
+
+
+def synthetic_utterance(duration_sec: float = 1.5, seed: int = 0) -> bytes:
+    """16 kHz int16 PCM of a voiced tone, standing in for a callee sentence"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration_sec * INPUT_RATE)) / INPUT_RATE
+    pitch = rng.uniform(110, 220)
+    envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 4 * t) ** 2
+    samples = 6000 * envelope * (np.sin(2 * np.pi * pitch * t) + 0.5 * np.sin(2 * np.pi * 2 * pitch * t))
+    return samples.astype(np.int16).tobytes()
+
+
+async def simulate_call(source: AudioSource, config: Optional[dict] = None, uri: Optional[str] = None,
+                        recorder: Optional[MemoryRecorder] = None, timeout: float = 60.0) -> SimulatedCall:
+    """Run one call from `source` until the agent completes its answer to the last utterance, or `timeout`"""
+    recorder = recorder or MemoryRecorder()
+    gemini = GeminiConnection({**DEFAULT_CONFIG, **(config or {})}, source=source, sink=recorder, uri=uri)
+    timed_out = False
+    try:
+        await asyncio.wait_for(gemini.start(), timeout)
+    except asyncio.TimeoutError:
+        timed_out = True
+        await gemini.cleanup()
+    return SimulatedCall(recorder, gemini.response_latencies, timed_out)
+
+
+async def simulate_calls(source_factories: List[Callable[[], AudioSource]], config: Optional[dict] = None,
+                         uri: Optional[str] = None, max_concurrent: int = 16,
+                         timeout: float = 60.0) -> List[SimulatedCall]:
+    """Run a call per source factory, at most `max_concurrent` at a time"""
+    semaphore = asyncio.Semaphore(max_concurrent)
+
+    async def run(create_source):
+        async with semaphore:
+            return await simulate_call(create_source(), config, uri, timeout=timeout)
+
+    return await asyncio.gather(*(run(create_source) for create_source in source_factories))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("recordings", nargs="*", help="16 kHz mono 16-bit WAV files of the callee")
+    parser.add_argument("--calls", type=int, default=8, help="Calls per recording, or synthetic calls without any")
+    parser.add_argument("--pace", type=float, default=1.0,
+                        help="Times real time, 0 for as fast as possible. Latencies are wall-clock, above 1 the callee "
+                             "may start the next utterance before the answer and shorten them")
+    parser.add_argument("--max-concurrent", type=int, default=16)
+    parser.add_argument("--uri", help="WebSocket endpoint, a local echoing stand-in by default")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    if args.recordings:
+        factories = [lambda path=path: WavFileSource(path, pace=args.pace)
+                     for path in args.recordings for _ in range(args.calls)]
+    else:
+        factories = [lambda seed=seed: GeneratorSource([synthetic_utterance(seed=seed)], pace=args.pace)
+                     for seed in range(args.calls)]
+
+    server = None
+    uri = args.uri
+    if uri is None:
+        server = StandInGeminiServer()
+        server.start()
+        uri = server.uri
+    try:
+        calls = asyncio.run(simulate_calls(factories, uri=uri, max_concurrent=args.max_concurrent,
+                                           timeout=args.timeout))
+    finally:
+        if server is not None:
+            server.stop()
+
+    latencies = np.asarray([latency for call in calls for latency in call.response_latencies])
+    print(f"\n{len(calls)} calls, {sum(call.timed_out for call in calls)} timed out, "
+          f"{sum(call.recorder.duration for call in calls):.1f}s of agent audio recorded")
+    if len(latencies):
+        p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1000
+        print(f"Response latency over {len(latencies)} answers: p50 {p50:.0f}ms, p90 {p90:.0f}ms, p99 {p99:.0f}ms")
+    else:
+        print("No answers received")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+A local stand-in for Gemini's BidiGenerateContent websocket, so GeminiConnection can run without network access or
+an API key. It answers every callee utterance, detected by silence, with an echo of it or a scripted response.
+"""
+import asyncio
+import base64
+import json
+import threading
+from typing import Callable, Optional
+
+import numpy as np
+from websockets.asyncio.server import serve
+
+from transports import INPUT_RATE, OUTPUT_RATE, is_silent
+
+# Gemini streams its answers in chunks of about 40ms
+RESPONSE_CHUNK_SAMPLES = 960
+
+
+def echo_responder(utterance: np.ndarray) -> np.ndarray:
+    """Repeats the callee's utterance, resampled to the output rate"""
+    duration = len(utterance) / INPUT_RATE
+    output_times = np.arange(int(duration * OUTPUT_RATE)) / OUTPUT_RATE
+    return np.interp(output_times, np.arange(len(utterance)) / INPUT_RATE, utterance).astype(np.int16)
+
+
+class StandInGeminiServer:
+    """
+    Serves on a background thread, use as a context manager and pass `uri` to GeminiConnection.
+
+    Args:
+        responder: Maps each 16 kHz int16 callee utterance to the 24 kHz int16 answer, echo_responder by default
+        response_delay_sec: Time the stand-in model "thinks" before answering
+        silence_sec: Silence that ends a callee utterance
+    """
+    def __init__(self, responder: Optional[Callable[[np.ndarray], np.ndarray]] = None,
+                 response_delay_sec: float = 0.3, silence_sec: float = 0.5, port: int = 0):
+        self.responder = responder or echo_responder
+        self.response_delay_sec = response_delay_sec
+        self.silence_sec = silence_sec
+        self.port = port
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stop: Optional[asyncio.Event] = None
+        self._thread: Optional[threading.Thread] = None
+        self._started = threading.Event()
+
+    @property
+    def uri(self) -> str:
+        return f"ws://127.0.0.1:{self.port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=lambda: asyncio.run(self._serve()), daemon=True)
+        self._thread.start()
+        self._started.wait()
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+            self._thread.join()
+            self._loop = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        async with serve(self._handle, "127.0.0.1", self.port) as server:
+            self.port = server.sockets[0].getsockname()[1]
+            self._started.set()
+            await self._stop.wait()
+
+    async def _handle(self, ws):
+        setup = json.loads(await ws.recv())
+        if "setup" not in setup:
+            await ws.close(1008, "Expected a setup message")
+            return
+        await ws.send(json.dumps({"setupComplete": {}}))
+
+        utterance, silent_samples = [], 0
+        async for message in ws:
+            chunks = json.loads(message).get("realtime_input", {}).get("media_chunks", [])
+            for chunk in chunks:
+                pcm = base64.b64decode(chunk["data"])
+                samples = np.frombuffer(pcm, dtype=np.int16)
+                if not is_silent(pcm):
+                    utterance.append(samples)
+                    silent_samples = 0
+                elif utterance:
+                    silent_samples += len(samples)
+                    if silent_samples >= self.silence_sec * INPUT_RATE:
+                        await self._answer(ws, np.concatenate(utterance))
+                        utterance, silent_samples = [], 0
+
+    async def _answer(self, ws, utterance: np.ndarray):
+        await asyncio.sleep(self.response_delay_sec)
+        answer = np.asarray(self.responder(utterance), dtype=np.int16)
+        for start in range(0, len(answer), RESPONSE_CHUNK_SAMPLES):
+            data = base64.b64encode(answer[start:start + RESPONSE_CHUNK_SAMPLES].tobytes()).decode("utf-8")
+            await ws.send(json.dumps({"serverContent": {"modelTurn": {"parts": [
+                {"inlineData": {"mimeType": f"audio/pcm;rate={OUTPUT_RATE}", "data": data}}]}}}))
+        await ws.send(json.dumps({"serverContent": {"turnComplete": True}}))
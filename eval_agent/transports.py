@@ -0,0 +1,176 @@
+import asyncio
+import time
+import wave
+from abc import ABC, abstractmethod
+from typing import AsyncIterable, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+INPUT_RATE = 16000   # Gemini expects 16 kHz for input
+OUTPUT_RATE = 24000  # Gemini outputs audio at 24 kHz
+SAMPLE_WIDTH = 2     # 16-bit PCM
+# Chunks of int16 audio quieter than this are silence between the callee's utterances
+SILENCE_RMS = 200
+
+
+def is_silent(pcm: bytes) -> bool:
+    samples = np.frombuffer(pcm, dtype=np.int16)
+    return np.sqrt(np.mean(samples.astype(np.float32) ** 2)) < SILENCE_RMS if len(samples) else True
+
+
+class AudioSource(ABC):
+    """Where GeminiConnection reads the callee's 16 kHz int16 mono audio from"""
+    # perf_counter time the last chunk of speech was read, None while the source doesn't know of any speech
+    last_speech_at: Optional[float] = None
+
+    @abstractmethod
+    async def read(self, frames: int) -> Optional[bytes]:
+        """The next `frames` samples, None once the source is exhausted"""
+        pass
+
+    def close(self):
+        pass
+
+
+class AudioSink(ABC):
+    """Where GeminiConnection writes the agent's 24 kHz int16 mono audio to"""
+    @abstractmethod
+    async def write(self, data: bytes):
+        pass
+
+    def close(self):
+        pass
+
+
+class MicrophoneSource(AudioSource):
+    def __init__(self, rate: int = INPUT_RATE, chunk: int = 512):
+        import pyaudio
+        self._audio = pyaudio.PyAudio()
+        self._stream = self._audio.open(format=pyaudio.paInt16, channels=1, rate=rate, input=True,
+                                        frames_per_buffer=chunk)
+
+    async def read(self, frames: int) -> Optional[bytes]:
+        return await asyncio.to_thread(self._stream.read, frames, exception_on_overflow=False)
+
+    def close(self):
+        try:
+            if self._stream.is_active():
+                self._stream.stop_stream()
+            self._stream.close()
+        except OSError:
+            pass  # Ignore errors during cleanup
+        self._audio.terminate()
+
+
+class SpeakerSink(AudioSink):
+    def __init__(self, rate: int = OUTPUT_RATE):
+        import pyaudio
+        self._audio = pyaudio.PyAudio()
+        self._stream = self._audio.open(format=pyaudio.paInt16, channels=1, rate=rate, output=True)
+
+    async def write(self, data: bytes):
+        await asyncio.to_thread(self._stream.write, data)
+
+    def close(self):
+        self._stream.stop_stream()
+        self._stream.close()
+        self._audio.terminate()
+
+
+class GeneratorSource(AudioSource):
+    """
+    Callee audio from an iterable or async iterable of PCM blocks of any size, such as synthetic speech, cut into the
+    requested frames and delivered at `pace` times real time (0 for as fast as possible). `trailing_silence_sec` of
+    silence follow the audio, so the agent's end-of-turn detection sees the callee stop talking. Utterances are
+    separated by silence within the blocks, `last_speech_at` is updated with every chunk of speech read.
+    """
+    def __init__(self, blocks: Union[Iterable[bytes], AsyncIterable[bytes]], rate: int = INPUT_RATE, pace: float = 1.0,
+                 trailing_silence_sec: float = 2.0):
+        self.rate = rate
+        self.pace = pace
+        self._pending = bytearray()
+        self._silence_left = int(trailing_silence_sec * rate) * SAMPLE_WIDTH
+        self._exhausted = False
+        self._started_at: Optional[float] = None
+        self._frames_read = 0
+        self._is_async = isinstance(blocks, AsyncIterable)
+        self._iterator = blocks.__aiter__() if self._is_async else iter(blocks)
+
+    async def _next_block(self) -> Optional[bytes]:
+        if self._is_async:
+            return await anext(self._iterator, None)
+        return next(self._iterator, None)
+
+    async def read(self, frames: int) -> Optional[bytes]:
+        size = frames * SAMPLE_WIDTH
+        while not self._exhausted and len(self._pending) < size:
+            block = await self._next_block()
+            if block is None:
+                self._exhausted = True
+            else:
+                self._pending += block
+        if self._exhausted and not self._pending:
+            if self._silence_left <= 0:
+                return None
+            self._silence_left -= size
+            chunk = bytes(size)
+        else:
+            # The last chunk of audio is padded with silence
+            chunk = bytes(self._pending[:size]).ljust(size, b"\x00")
+            del self._pending[:size]
+
+        # Sleep until the chunk would have been captured live, the clock starts at the first read
+        if self._started_at is None:
+            self._started_at = time.perf_counter()
+        self._frames_read += frames
+        if self.pace > 0:
+            delay = self._started_at + self._frames_read / self.rate / self.pace - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        if not is_silent(chunk):
+            self.last_speech_at = time.perf_counter()
+        return chunk
+
+
+class WavFileSource(GeneratorSource):
+    """Callee audio from a 16 kHz mono 16-bit WAV file"""
+    def __init__(self, path: str, pace: float = 1.0, trailing_silence_sec: float = 2.0):
+        with wave.open(path, "rb") as file:
+            if file.getframerate() != INPUT_RATE or file.getnchannels() != 1 or file.getsampwidth() != SAMPLE_WIDTH:
+                raise ValueError(f"{path} must be a {INPUT_RATE} Hz mono 16-bit WAV file")
+            pcm = file.readframes(file.getnframes())
+        super().__init__([pcm], pace=pace, trailing_silence_sec=trailing_silence_sec)
+        self.path = path
+
+
+class MemoryRecorder(AudioSink):
+    """
+    Keeps the agent's audio in memory with the time each chunk arrived. With `pace` > 0, writes take as long as
+    playing the chunk would at `pace` times real time, so the connection behaves as if it were playing audio.
+    """
+    def __init__(self, rate: int = OUTPUT_RATE, pace: float = 0.0):
+        self.rate = rate
+        self.pace = pace
+        self.audio = bytearray()
+        # (perf_counter time, byte offset into audio) of every chunk
+        self.chunks: List[Tuple[float, int]] = []
+
+    async def write(self, data: bytes):
+        self.chunks.append((time.perf_counter(), len(self.audio)))
+        self.audio += data
+        if self.pace > 0:
+            await asyncio.sleep(len(data) / SAMPLE_WIDTH / self.rate / self.pace)
+
+    @property
+    def duration(self) -> float:
+        return len(self.audio) / SAMPLE_WIDTH / self.rate
+
+    def samples(self) -> np.ndarray:
+        return np.frombuffer(bytes(self.audio), dtype=np.int16)
+
+    def save(self, path: str):
+        with wave.open(path, "wb") as file:
+            file.setnchannels(1)
+            file.setsampwidth(SAMPLE_WIDTH)
+            file.setframerate(self.rate)
+            file.writeframes(bytes(self.audio))
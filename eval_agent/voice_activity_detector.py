@@ -1,24 +1,139 @@
+import asyncio
+import math
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional
+
 import numpy as np
 import torch
 
+SAMPLE_RATE = 16000
+# Silero VAD takes windows of exactly 512 samples at 16 kHz
+FRAME_SAMPLES = 512
+FRAME_SEC = FRAME_SAMPLES / SAMPLE_RATE
+INT16_SCALE = 1 / 32768.0
+
+
+@dataclass
+class VADEvent:
+    kind: str  # "start" or "end"
+    time: float  # seconds since the detector started or was reset
+
 
 class VoiceActivityDetector:
-    def __init__(self):
-        self.model, _ = torch.hub.load(repo_or_dir='snakers4/silero-vad',
-                                     model='silero_vad',
-                                     force_reload=False)
+    """
+    Stateful Silero VAD over 512-sample int16 frames. The model keeps its state across frames, every frame is
+    converted into one preallocated float32 buffer shared with the model's input tensor, and speech start/end
+    events are smoothed: speech starts after `min_speech_frames` frames above the threshold and ends after
+    `hangover_frames` frames below `end_threshold`.
+
+    Args:
+        end_threshold: Probability under which a frame counts as silent during speech, lower than the threshold so
+            speech doesn't flicker on and off around it. Defaults to `threshold - 0.15`, and never below 0.01.
+        num_threads: Sets torch's intra-op threads, which is process-wide, so it's left alone by default. The model
+            is tiny, a single thread avoids synchronization overhead and competing with the audio threads.
+    """
+    def __init__(self, threshold: float = 0.5, min_speech_frames: int = 2, hangover_frames: int = 8,
+                 num_threads: Optional[int] = None, model=None, end_threshold: Optional[float] = None):
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        if model is None:
+            model, _ = torch.hub.load(repo_or_dir='snakers4/silero-vad',
+                                      model='silero_vad',
+                                      force_reload=False)
+        self.model = model
         self.model.eval()
+        self.threshold = threshold
+        self.end_threshold = max(threshold - 0.15, 0.01) if end_threshold is None else end_threshold
+        self.min_speech_frames = min_speech_frames
+        self.hangover_frames = hangover_frames
+
+        self._frame = np.zeros(FRAME_SAMPLES, dtype=np.float32)
+        # Shares memory with the buffer, filling the buffer fills the model input without another copy
+        self._frame_tensor = torch.from_numpy(self._frame)
+        # A single thread keeps frames in order and the model state consistent, off the event loop
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vad")
+        self.reset()
+
+    def reset(self):
+        """Forget the model state and the current speech, e.g. between calls"""
+        self.model.reset_states()
+        self.in_speech = False
+        self._frame_index = 0
+        self._speech_frames = 0
+        self._silent_frames = 0
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    def speech_probability(self, audio_data: bytes) -> float:
+        samples = np.frombuffer(audio_data, dtype=np.int16)
+        if len(samples) != FRAME_SAMPLES:
+            raise ValueError(f"Expected frames of {FRAME_SAMPLES} samples, got {len(samples)}")
+        np.multiply(samples, INT16_SCALE, out=self._frame, casting="unsafe")
+        with torch.inference_mode():
+            return self.model(self._frame_tensor, SAMPLE_RATE).item()
+
+    def is_speech(self, audio_data: bytes, threshold: Optional[float] = None) -> bool:
+        """Raw decision of a single frame, without smoothing"""
+        return self.speech_probability(audio_data) > (self.threshold if threshold is None else threshold)
+
+    def _update(self, probability: float) -> Optional[VADEvent]:
+        frame_index = self._frame_index
+        self._frame_index += 1
+        if not self.in_speech:
+            self._speech_frames = self._speech_frames + 1 if probability > self.threshold else 0
+            if self._speech_frames >= self.min_speech_frames:
+                self.in_speech, self._silent_frames = True, 0
+                return VADEvent("start", (frame_index + 1 - self._speech_frames) * FRAME_SEC)
+        else:
+            self._silent_frames = self._silent_frames + 1 if probability < self.end_threshold else 0
+            if self._silent_frames >= self.hangover_frames:
+                self.in_speech, self._speech_frames = False, 0
+                return VADEvent("end", (frame_index + 1 - self._silent_frames) * FRAME_SEC)
+        return None
+
+    def process(self, audio_data: bytes) -> Optional[VADEvent]:
+        """Feed the next frame, returns the speech start or end it completes if any"""
+        return self._update(self.speech_probability(audio_data))
+
+    async def process_async(self, audio_data: bytes) -> Optional[VADEvent]:
+        """Same as process, run on the detector's own thread so inference never blocks the event loop"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self.process, audio_data)
+
+    def speech_probabilities(self, pcm: bytes, batch_size: int = 32) -> np.ndarray:
+        """
+        Offline speech probability of every full frame of a recording. The recording is split into `batch_size`
+        contiguous sections run as one batch, each section with its own model state, so a single inference call
+        covers `batch_size` frames. Each section starts from a fresh state, like the start of a recording.
+        """
+        samples = np.frombuffer(pcm, dtype=np.int16)
+        frame_count = len(samples) // FRAME_SAMPLES
+        if frame_count == 0:
+            return np.empty(0, dtype=np.float32)
+        sections = min(batch_size, frame_count)
+        frames_per_section = math.ceil(frame_count / sections)
+
+        frames = np.zeros((sections * frames_per_section, FRAME_SAMPLES), dtype=np.float32)
+        np.multiply(samples[:frame_count * FRAME_SAMPLES].reshape(frame_count, FRAME_SAMPLES), INT16_SCALE,
+                    out=frames[:frame_count], casting="unsafe")
+        # (steps, sections, samples): the batch of step i holds the i-th frame of every section, contiguous in memory
+        steps = torch.from_numpy(np.ascontiguousarray(
+            frames.reshape(sections, frames_per_section, FRAME_SAMPLES).transpose(1, 0, 2)))
+
+        probabilities = np.empty((frames_per_section, sections), dtype=np.float32)
+        self.model.reset_states()
+        with torch.inference_mode():
+            for step in range(frames_per_section):
+                probabilities[step] = self.model(steps[step], SAMPLE_RATE).numpy().reshape(sections)
+        self.reset()
+        return probabilities.T.reshape(-1)[:frame_count]
 
-    def is_speech(self, audio_data: bytes, threshold: float = 0.5) -> bool:
-        # Convert raw bytes directly to numpy array of int16
-        audio_np = np.frombuffer(audio_data, dtype=np.int16)
-        
-        # Convert to float32 and normalize to [-1, 1]
-        audio_float = audio_np.astype(np.float32) / 32768.0
-        
-        # Convert to torch tensor
-        audio_tensor = torch.from_numpy(audio_float)
-        
-        # Get speech probability
-        speech_prob = self.model(audio_tensor, 16000).item()
-        return speech_prob > threshold  # Adjust threshold as needed
\ No newline at end of file
+    def detect_events(self, pcm: bytes, batch_size: int = 32) -> List[VADEvent]:
+        """Smoothed speech start and end events of a whole recording, using batched inference"""
+        self.reset()
+        events = [self._update(probability) for probability in self.speech_probabilities(pcm, batch_size).tolist()]
+        if self.in_speech:
+            events.append(VADEvent("end", self._frame_index * FRAME_SEC))
+        self.reset()
+        return [event for event in events if event is not None]
@@ -1,15 +1,25 @@
+from concurrent.futures import ThreadPoolExecutor
 from itertools import product
 import os
 import json
+from typing import Callable, Dict, Optional, Tuple
 
 from core.agent_config import AgentTaskConfig
 from core.personas import CalleePersona
-from core.data_types import TestedComponent, TestedComponentType
+from core.data_types import EvaluationResponse, TestedComponent, TestedComponentType, TestResult
+from core.rate_limiter import Priority, configure_rate_limit
+from core.telemetry import TelemetryRecorder, print_telemetry_summary
 from core.utils.generate_report import get_metric_success_indicator
 from test_runner import GoalBasedTestRunner
-from core.evaluator import LLMConversationEvaluator
+from core.evaluator import BatchConversationEvaluator, LLMConversationEvaluator
+from core.interfaces import LLMInterface
+from core.providers.batch import BatchClient, LocalBatchClient, OpenAIBatchClient
+from core.providers.cached import DEFAULT_CACHE_PATH, CacheMode, CachedLLMProvider, LLMResponseCache
 from core.providers.openai import OpenAIProvider
 
+# Creates the provider of a model, e.g. a MockLLMProvider to run the harness offline
+LLMFactory = Callable[[str, Priority, TelemetryRecorder], LLMInterface]
+
 
 def generate_test_combinations(test_data):
     # Sort underlying LLMs first, system prompts later
@@ -29,72 +39,165 @@ def generate_test_combinations(test_data):
 
     return list(product(sorted_llms, sorted_prompts))    
     
-def run_tests(tests_to_run: list[str] = [], print_verbose: bool = False):
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise ValueError("Please set OPENAI_API_KEY environment variable")
+def _create_variation_config(test_data: dict, tested_component_variation: tuple) -> Tuple[AgentTaskConfig, CalleePersona]:
+    agent_config = test_data["agent"]
+    agent_task_config = AgentTaskConfig(
+        system_prompt=tested_component_variation[1],
+        initial_message=agent_config["initial_message"],
+        tool_calls=agent_config["tool_calls"],
+        success_criteria=agent_config["success_criteria"],
+        additional_context=agent_config["additional_context"]
+    )
+
+    persona = CalleePersona(**test_data["persona"])
+    return agent_task_config, persona
+
+
+def _run_variation(variation_name: str, test_name: str, agent_task_config: AgentTaskConfig, persona: CalleePersona,
+                   tested_component_variation: tuple, llm_factory: LLMFactory, evaluator: LLMConversationEvaluator,
+                   response_cache: Optional[LLMResponseCache] = None, cache_mode: Optional[CacheMode] = None,
+                   evaluate: bool = True, telemetry_recorder: Optional[TelemetryRecorder] = None,
+                   concurrent: bool = False) -> TestResult:
+    agent_model = tested_component_variation[0]
+    agent_llm = _with_cache(llm_factory(agent_model, Priority.AGENT, telemetry_recorder),
+                            response_cache, cache_mode, telemetry_recorder)
+    print(f"\n=== Running Test: {variation_name} - {test_name} ===\n"
+          f"Tested component: [{tested_component_variation[0]}] + [{tested_component_variation[1][:50]}...]\n", end="")
+
+    # Every variation gets its own runner as the conversation history is kept on the runner instance.
+    # Turns of concurrent variations interleave, so they're prefixed with the variation name.
+    runner = GoalBasedTestRunner(agent_llm, evaluator, conversation_name=variation_name if concurrent else None)
+    return runner.run_conversation_test(agent_task_config, persona, max_turns=50, evaluate=evaluate) # TODO: remove max_turns
+
+
+def _with_cache(llm: LLMInterface, response_cache: Optional[LLMResponseCache], cache_mode: Optional[CacheMode],
+                telemetry_recorder: Optional[TelemetryRecorder] = None) -> LLMInterface:
+    if response_cache is None:
+        return llm
+    return CachedLLMProvider(llm, response_cache, cache_mode, telemetry_recorder=telemetry_recorder)
+
+
+def _print_test_result(test_result: TestResult):
+    eval_response = test_result.evaluation_result
+    print("\n=== Evaluation report ===")
+    print(f"Summary: {eval_response.summary}\n")
+    for metric in eval_response.evaluation_results:
+        success_indicator = get_metric_success_indicator(metric)
+        print(f"--> {success_indicator} Metric: [{metric.name}], Output score: [{metric.eval_output}]\nReasoning: {metric.reasoning}\nEvidence: {metric.evidence}\n")
+
+    print("\nConversation History:")
+    for turn in test_result.conversation_history:
+        print(f"{turn['speaker'].upper()}: {turn['text']}")
+
+
+def run_tests(tests_to_run: list[str] = [], print_verbose: bool = False, max_workers: int = 1,
+              rate_limits: Optional[Dict[str, int]] = None, cache_mode: Optional[CacheMode] = None,
+              cache_path: str = DEFAULT_CACHE_PATH, deferred_evaluation: bool = False,
+              batch_client: Optional[BatchClient] = None, token_limits: Optional[Dict[str, int]] = None,
+              base_url: Optional[str] = None, llm_factory: Optional[LLMFactory] = None):
+    """
+    Run every scenario against every (LLM, system prompt) variation.
+
+    Args:
+        tests_to_run: Names of the scenarios to run, all scenarios are run if empty
+        print_verbose: Print the evaluation report and conversation history of each variation
+        max_workers: Number of conversations to run concurrently, 1 runs them one after another
+        rate_limits: Maximum requests per minute per model name, e.g. {"gpt-4o": 500}. Limits that aren't set are
+            learnt from the API's rate limit headers, 429s are retried with backoff either way.
+        cache_mode: Record and/or replay agent, callee and evaluator responses from an on-disk cache, disabled if None
+        cache_path: Location of the SQLite cache used when cache_mode is set
+        deferred_evaluation: Evaluate all conversations in a single Batch API submission once every conversation finished
+        batch_client: Client used for deferred evaluation, defaults to the OpenAI Batch API
+        token_limits: Maximum tokens per minute per model name, e.g. {"gpt-4o": 800000}
+        base_url: OpenAI-compatible endpoint to send requests to, e.g. a StandInOpenAIServer
+        llm_factory: Creates the agent, callee and evaluator providers from a model name, a priority and the run's
+            telemetry recorder. Defaults to OpenAIProvider, which requires OPENAI_API_KEY.
+    """
+    api_key = None
+    if llm_factory is None:
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise ValueError("Please set OPENAI_API_KEY environment variable")
+
+        def llm_factory(model: str, priority: Priority, telemetry_recorder: TelemetryRecorder) -> LLMInterface:
+            return OpenAIProvider(api_key, model, telemetry_recorder=telemetry_recorder, priority=priority,
+                                  base_url=base_url)
+
+    rate_limits = rate_limits or {}
+    token_limits = token_limits or {}
+    # Every provider of a model shares the process-wide limiter configured here
+    for model in set(rate_limits) | set(token_limits):
+        configure_rate_limit(model, rate_limits.get(model), token_limits.get(model))
+    response_cache = LLMResponseCache(cache_path) if cache_mode else None
+    # Collects every agent, callee and evaluator call of the run for the per-model latency and cost summary
+    telemetry_recorder = TelemetryRecorder()
 
     # To choose the best LLM-as-a-Judge, review https://arxiv.org/abs/2410.12784 and https://huggingface.co/spaces/ScalerLab/JudgeBench
-    evaluator_llm = OpenAIProvider(api_key, "gpt-4o-mini")
-    # evaluator_llm = OpenAIProvider(api_key, "gpt-4o")
-    # evaluator_llm = OpenAIProvider(api_key, "o1-preview")
+    evaluator_model = "gpt-4o-mini"
+    # evaluator_model = "gpt-4o"
+    # evaluator_model = "o1-preview"
+    # Evaluations yield the shared quota to running conversations
+    evaluator_llm = _with_cache(llm_factory(evaluator_model, Priority.EVALUATOR, telemetry_recorder),
+                                response_cache, cache_mode, telemetry_recorder)
+    evaluator = LLMConversationEvaluator(evaluator_llm, "llm_testing/config/eval_metrics.json",
+                                         "You are an objective phone agent conversation evaluator who evalutes AI agents calling to businesses. You will be provided a call transcript and score it across the different provided metrics.")
 
     # Load test details from a JSON file
     with open('llm_testing/config/test_scenarios.json', 'r') as file:  # Adjust the path as necessary
         test_scenarios = json.load(file)
 
-    tests_results = {}
+    # Number every variation upfront so results are keyed the same regardless of completion order
+    variations = []
     test_number = 1
     for test_name, test_data in test_scenarios.items():
         if tests_to_run and test_name not in tests_to_run:
             continue
-        
-        print(f"\n=== Running Test: #{test_number} - {test_name} ===")
 
-        agent_config = test_data["agent"]
         # Create a matrix of all tested components and possible combinations
-        tested_components = generate_test_combinations(test_data)   
-
-        for tested_component_variation in tested_components:
-            agent_llm = OpenAIProvider(api_key, tested_component_variation[0])
-            agent_prompt = tested_component_variation[1]
-            print(f"Tested component: [{tested_component_variation[0]}] + [{tested_component_variation[1][:50]}...]")
-
-            agent_task_config = AgentTaskConfig(
-                system_prompt=agent_prompt,
-                initial_message=agent_config["initial_message"],
-                tool_calls=agent_config["tool_calls"],
-                success_criteria=agent_config["success_criteria"],
-                additional_context=agent_config["additional_context"]
-            )
-        
-            persona = CalleePersona(**test_data["persona"])
-
-            evaluator = LLMConversationEvaluator(evaluator_llm, "llm_testing/config/eval_metrics.json",
-                                                 "You are an objective phone agent conversation evaluator who evalutes AI agents calling to businesses. You will be provided a call transcript and score it across the different provided metrics.")
-            runner = GoalBasedTestRunner(agent_llm, evaluator)
-
-            eval_response = runner.run_conversation_test(agent_task_config, persona, max_turns=50) # TODO: remove max_turns
-            tests_results[f"{test_name}_variation_{test_number}"] = {
+        for tested_component_variation in generate_test_combinations(test_data):
+            agent_task_config, persona = _create_variation_config(test_data, tested_component_variation)
+            variations.append((f"{test_name}_variation_{test_number}", test_name, tested_component_variation,
+                               agent_task_config, persona))
+            test_number += 1
+
+    tests_results = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for variation_name, test_name, tested_component_variation, agent_task_config, persona in variations:
+            futures[variation_name] = executor.submit(_run_variation, variation_name, test_name, agent_task_config,
+                                                      persona, tested_component_variation, llm_factory, evaluator,
+                                                      response_cache, cache_mode, evaluate=not deferred_evaluation,
+                                                      telemetry_recorder=telemetry_recorder,
+                                                      concurrent=max_workers > 1)
+
+        for variation_name, _, tested_component_variation, _, _ in variations:
+            tests_results[variation_name] = {
                 "tested_component": tested_component_variation,
-                "result": eval_response
+                "result": futures[variation_name].result()
             }
-            
-            if print_verbose:
-                print("\n=== Evaluation report ===")
-                print(f"Summary: {eval_response.summary}\n")
-                for metric in eval_response.evaluation_results:
-                    success_indicator = get_metric_success_indicator(metric)
-                    print(f"--> {success_indicator} Metric: [{metric.name}], Output score: [{metric.eval_output}]\nReasoning: {metric.reasoning}\nEvidence: {metric.evidence}\n")
-
-                print("\nConversation History:")
-                for turn in runner.conversation_history:
-                    print(f"{turn['speaker'].upper()}: {turn['text']}")
 
-            test_number += 1
+    if deferred_evaluation:
+        if batch_client is None:
+            # Without an API key, e.g. with a mock factory, the batch is answered locally by the evaluator's provider
+            batch_client = OpenAIBatchClient(api_key) if api_key else LocalBatchClient(evaluator_llm, response_format=EvaluationResponse)
+        batch_evaluator = BatchConversationEvaluator(evaluator, evaluator_model, batch_client)
+        for variation_name, _, _, agent_task_config, persona in variations:
+            batch_evaluator.add(variation_name, tests_results[variation_name]["result"].conversation_history,
+                                agent_task_config, persona)
+
+        for variation_name, evaluation_result in batch_evaluator.run().items():
+            tests_results[variation_name]["result"].evaluation_result = evaluation_result
+
+    if print_verbose:
+        for variation_name, test_result in tests_results.items():
+            if test_result["result"].evaluation_result is None:
+                continue
+            print(f"\n=== {variation_name} ===")
+            _print_test_result(test_result["result"])
             print(f"\n{'-' * 100}\n")
 
-    print(f"\n\n=== All tests completed: {test_number - 1} ===")
+    print(f"\n\n=== All tests completed: {len(tests_results)} ===")
+    print_telemetry_summary(telemetry_recorder.summarize())
     return tests_results
 
 
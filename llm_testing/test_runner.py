@@ -1,25 +1,48 @@
 import json
-from typing import List, Dict, Any, Optional
+import time
+from typing import List, Dict, Any, Optional, Union
 
-from core.data_types import ConversationContext, ConversationEvaluation, EntitySpeaking, LLMResponse, TestResult
+from core.data_types import (ConversationContext, ConversationEvaluation, EntitySpeaking, EvaluationResponse, LLMResponse,
+                             StreamedResponse, TestResult, TokenUsage, TurnLatency, TurnTelemetry)
 from core.agent_config import AgentTaskConfig
-from core.interfaces import LLMInterface
+from core.interfaces import AsyncLLMInterface, LLMInterface
 from core.personas import CalleePersona
 from core.evaluator import ConversationEvaluator
 
+CALLEE_RESPONSE_INSTRUCTION = "Generate the next user response as this persona. Respond in character, don't explain or add notes."
+# Recent turns the callee sees by default, the whole conversation is opt-in as it grows the callee's tokens every turn
+DEFAULT_CALLEE_HISTORY_WINDOW = 4
+
 
 class GoalBasedTestRunner:
     def __init__(self, 
-                 llm: LLMInterface,
-                 evaluator: ConversationEvaluator):
+                 llm: Union[LLMInterface, AsyncLLMInterface],
+                 evaluator: ConversationEvaluator,
+                 callee_history_window: Optional[int] = DEFAULT_CALLEE_HISTORY_WINDOW,
+                 conversation_name: Optional[str] = None):
+        """
+        Args:
+            llm: LLM generating both the agent and the callee turns
+            evaluator: Evaluator of the finished conversation
+            callee_history_window: Number of recent turns the callee sees, the whole conversation if None.
+                The window slides in whole blocks, so the callee sees between `window` and `2 * window - 1` turns and
+                the provider's prompt cache can reuse the previous turn's prefix until the next jump.
+            conversation_name: Prefix of every printed line, telling apart conversations run concurrently
+        """
         self.llm = llm
         self.evaluator = evaluator
+        self.callee_history_window = callee_history_window
+        self.conversation_name = conversation_name
         self.conversation_history: List[Dict[str, str]] = []
+        self.turn_telemetry: List[TurnTelemetry] = []
+        self.agent_turn_latencies: List[TurnLatency] = []
+        self._agent_system_prompt = ""
+        self._callee_system_prompt = ""
     
-    def _generate_callee_response(self, persona: CalleePersona, agent_tools: Optional[List[Dict[str, Any]]] = []) -> LLMResponse:
-        """Generate user response based on persona and conversation history"""
+    @staticmethod
+    def _create_callee_system_prompt(persona: CalleePersona) -> str:
         # Create a system prompt for the user simulator
-        system_prompt = f"""You are simulating a {persona.description[:1].lower() + persona.description[1:] if persona.description else 'person'}
+        return f"""You are simulating a {persona.description[:1].lower() + persona.description[1:] if persona.description else 'person'}
 Your mood is {persona.mood} and your communication style is {persona.response_style}.
 You have the following additional context: {persona.additional_context}
 You should respond as this persona would, maintaining consistent behavior and knowledge.
@@ -36,34 +59,112 @@ Remember:
 3. Reflect the specified mood and communication style
 4. Keep responses natural and conversational
 """
-        
-        # Create context with recent conversation history
-        context = ConversationContext(
-            system_prompt=system_prompt,
-            conversation_history=self.conversation_history[-4:] if self.conversation_history else []
+
+    def _create_callee_context(self) -> ConversationContext:
+        """Create the context used to simulate the callee's next response"""
+        history = self.conversation_history
+        if self.callee_history_window:
+            # Slide the window in whole blocks so the prefix stays identical, and cacheable, for `window` turns at a time
+            window_start = max(0, len(history) - self.callee_history_window)
+            history = history[window_start - window_start % self.callee_history_window:]
+
+        return ConversationContext(
+            system_prompt=self._callee_system_prompt,
+            conversation_history=history
         )
-        
-        response = self.llm.generate_response_with_conversation_history(context,
+
+    def _generate_callee_response(self, agent_tools: Optional[List[Dict[str, Any]]] = []) -> LLMResponse:
+        """Generate user response based on persona and conversation history"""
+        return self.llm.generate_response_with_conversation_history(self._create_callee_context(),
                                                             EntitySpeaking.CALLEE,
                                                             tools=agent_tools,
-                                                            user_input="Generate the next user response as this persona. Respond in character, don't explain or add notes.")
-        
+                                                            user_input=CALLEE_RESPONSE_INSTRUCTION)
 
-        
-        return response
+    async def _generate_callee_response_async(self, agent_tools: Optional[List[Dict[str, Any]]] = []) -> LLMResponse:
+        return await self.llm.generate_response_with_conversation_history(self._create_callee_context(),
+                                                                  EntitySpeaking.CALLEE,
+                                                                  tools=agent_tools,
+                                                                  user_input=CALLEE_RESPONSE_INSTRUCTION)
+
+    def _create_agent_context(self) -> ConversationContext:
+        return ConversationContext(
+            system_prompt=self._agent_system_prompt,
+            conversation_history=self.conversation_history
+        )
+
+    def _record_latency(self, turn_count: int, started_at: float, first_token_at: Optional[float],
+                        streamed_response: StreamedResponse):
+        finished_at = time.perf_counter()
+        if streamed_response.telemetry and streamed_response.telemetry.from_cache:
+            # A response replayed from the cache says nothing about the model's latency
+            return
+        self.agent_turn_latencies.append(TurnLatency(
+            turn=turn_count,
+            time_to_first_token=first_token_at - started_at if first_token_at is not None else None,
+            total_time=finished_at - started_at,
+            completion_tokens=streamed_response.usage.completion_tokens if streamed_response.usage else None
+        ))
+
+    def _generate_agent_response(self, task_config: AgentTaskConfig, turn_count: int) -> LLMResponse:
+        """Stream the agent's response to measure time to first token, the latency a voice agent's callee hears"""
+        streamed_response = StreamedResponse()
+        started_at = time.perf_counter()
+        first_token_at = None
+        for delta in self.llm.stream_response_with_conversation_history(self._create_agent_context(),
+                                                                        EntitySpeaking.VOICE_AGENT,
+                                                                        task_config.tool_calls):
+            if first_token_at is None and (delta.content or delta.tool_call_index is not None):
+                first_token_at = time.perf_counter()
+            streamed_response.add(delta)
+
+        self._record_latency(turn_count, started_at, first_token_at, streamed_response)
+        return streamed_response.to_llm_response()
+
+    async def _generate_agent_response_async(self, task_config: AgentTaskConfig, turn_count: int) -> LLMResponse:
+        streamed_response = StreamedResponse()
+        started_at = time.perf_counter()
+        first_token_at = None
+        async for delta in self.llm.stream_response_with_conversation_history(self._create_agent_context(),
+                                                                              EntitySpeaking.VOICE_AGENT,
+                                                                              task_config.tool_calls):
+            if first_token_at is None and (delta.content or delta.tool_call_index is not None):
+                first_token_at = time.perf_counter()
+            streamed_response.add(delta)
+
+        self._record_latency(turn_count, started_at, first_token_at, streamed_response)
+        return streamed_response.to_llm_response()
+
+    def _print(self, message: str):
+        if self.conversation_name:
+            # Written in a single call with its newline so lines of concurrent conversations don't run into each other
+            print(f"[{self.conversation_name}] {message}\n", end="")
+        else:
+            print(message)
 
     def print_last_msg(self, turn_count: int, persona: Optional[CalleePersona] = None):
         last_message = self.conversation_history[-1]
         if last_message["speaker"] == EntitySpeaking.CALLEE.value:
-            print(f"[{turn_count}] {' '.join(persona.role.split('_')).title() if persona else 'Callee'}: {last_message['text']}")
+            self._print(f"[{turn_count}] {' '.join(persona.role.split('_')).title() if persona else 'Callee'}: {last_message['text']}")
         else:
-            print(f"[{turn_count}] Voice Agent: {last_message['text']}")
+            self._print(f"[{turn_count}] Voice Agent: {last_message['text']}")
 
-    def run_conversation_test(self,
-                            task_config: AgentTaskConfig,
-                            persona: CalleePersona,
-                            max_turns: int = 999) -> ConversationEvaluation:
+    def print_usage_summary(self):
+        if self.turn_telemetry:
+            total_usage = sum((turn.telemetry.usage for turn in self.turn_telemetry), TokenUsage())
+            self._print(f"Input tokens: {total_usage.prompt_tokens} ({total_usage.cached_tokens} cached, {total_usage.cached_ratio:.0%}), "
+                  f"output tokens: {total_usage.completion_tokens}")
+        ttfts = [latency.time_to_first_token for latency in self.agent_turn_latencies
+                 if latency.time_to_first_token is not None]
+        if ttfts:
+            self._print(f"Agent avg time to first token: {sum(ttfts) / len(ttfts):.2f}s")
+
+    def _start_conversation(self, task_config: AgentTaskConfig, persona: CalleePersona):
         self.conversation_history = []
+        self.turn_telemetry = []
+        self.agent_turn_latencies = []
+        # Built once per conversation so every turn starts with the same system prompt prefix
+        self._agent_system_prompt = task_config.generate_system_prompt()
+        self._callee_system_prompt = self._create_callee_system_prompt(persona)
         
         self.conversation_history.append({
             "speaker": EntitySpeaking.CALLEE.value,
@@ -71,53 +172,99 @@ Remember:
         })
         
         self.print_last_msg(0, persona)
+
+    def _next_speaker(self) -> EntitySpeaking:
+        # If last message was from callee, the agent responds, otherwise the callee does
+        if self.conversation_history[-1]["speaker"] == EntitySpeaking.CALLEE.value:
+            return EntitySpeaking.VOICE_AGENT
+        return EntitySpeaking.CALLEE
+
+    def _record_response(self, speaker: EntitySpeaking, response: LLMResponse, turn_count: int,
+                         persona: CalleePersona) -> bool:
+        """Add the response to the conversation history and return whether the conversation has ended"""
+        if response.telemetry:
+            self.turn_telemetry.append(TurnTelemetry(turn=turn_count, speaker=speaker.value, telemetry=response.telemetry))
+
+        self.conversation_history.append({
+            "speaker": speaker.value,
+            "text": response.response_content
+        })
+
+        if response.tools_called and response.tools_called[0].function.name == "end_conversation":
+            # remove last message from conversation history as it's None due to the tool call
+            self.conversation_history.pop()
+
+            arguments = json.loads(response.tools_called[0].function.arguments)
+            reason = arguments.get('reason')
+            who_ended_conversation = arguments.get('who_ended_conversation')
+            termination_evidence = arguments.get('termination_evidence')
+            self._print(f"*** Conversation ended by {who_ended_conversation}. Reason: {reason}. Evidence: {termination_evidence}")
+            return True
+
+        self.print_last_msg(turn_count, persona)
+        return False
+
+    def _end_conversation(self, turn_count: int, max_turns: int):
+        if turn_count >= max_turns:
+            self._print(f"Warning: Conversation ended prematurely due to max turn limit of {max_turns}")
+        self.print_usage_summary()
+
+    def _test_result(self, evaluation_result: Optional[EvaluationResponse]) -> TestResult:
+        return TestResult(
+            evaluation_result=evaluation_result,
+            conversation_history=self.conversation_history,
+            turn_telemetry=self.turn_telemetry,
+            agent_turn_latencies=self.agent_turn_latencies
+        )
+
+    def run_conversation_test(self,
+                            task_config: AgentTaskConfig,
+                            persona: CalleePersona,
+                            max_turns: int = 999,
+                            evaluate: bool = True) -> ConversationEvaluation:
+        """
+        Simulate a conversation between the agent and the persona and evaluate it.
+        Set evaluate to False to leave evaluation_result empty, e.g. when evaluations are batched after the run.
+        """
+        self._start_conversation(task_config, persona)
         turn_count = 1
         while turn_count < max_turns:
-            # If last message was from callee, generate agent response
-            if self.conversation_history[-1]["speaker"] == EntitySpeaking.CALLEE.value:
-                context = ConversationContext(
-                    system_prompt=task_config.generate_system_prompt(),
-                    conversation_history=self.conversation_history
-                )
-                
-                response = self.llm.generate_response_with_conversation_history(context, EntitySpeaking.VOICE_AGENT,
-                                                                                 task_config.tool_calls)
-                
-                self.conversation_history.append({
-                    "speaker": EntitySpeaking.VOICE_AGENT.value,
-                    "text": response.response_content
-                })            
-            # If last message was from the agent, generate callee response
+            speaker = self._next_speaker()
+            if speaker == EntitySpeaking.VOICE_AGENT:
+                response = self._generate_agent_response(task_config, turn_count)
             else:
-                response = self._generate_callee_response(persona, task_config.tool_calls)
-                self.conversation_history.append({
-                    "speaker": EntitySpeaking.CALLEE.value,
-                    "text": response.response_content
-                })
-            
-            if response.tools_called and response.tools_called[0].function.name == "end_conversation":
-                # remove last message from conversation history as it's None due to the tool call
-                self.conversation_history.pop()
-
-                arguments = json.loads(response.tools_called[0].function.arguments)
-                reason = arguments.get('reason')
-                who_ended_conversation = arguments.get('who_ended_conversation')
-                termination_evidence = arguments.get('termination_evidence')
-                print(f"\n*** Conversation ended by {who_ended_conversation}. Reason: {reason}. Evidence: {termination_evidence}")
+                response = self._generate_callee_response(task_config.tool_calls)
+
+            if self._record_response(speaker, response, turn_count, persona):
                 break
+
+            turn_count += 1
+        self._end_conversation(turn_count, max_turns)
+
+        evaluation_result = self.evaluator.evaluate(self.conversation_history, task_config, persona) if evaluate else None
+        return self._test_result(evaluation_result)
+
+    async def run_conversation_test_async(self,
+                                          task_config: AgentTaskConfig,
+                                          persona: CalleePersona,
+                                          max_turns: int = 999,
+                                          evaluate: bool = True) -> TestResult:
+        """Same as run_conversation_test for runners created with an AsyncLLMInterface and an evaluator supporting evaluate_async"""
+        self._start_conversation(task_config, persona)
+        turn_count = 1
+        while turn_count < max_turns:
+            speaker = self._next_speaker()
+            if speaker == EntitySpeaking.VOICE_AGENT:
+                response = await self._generate_agent_response_async(task_config, turn_count)
             else:
-                self.print_last_msg(turn_count, persona)
+                response = await self._generate_callee_response_async(task_config.tool_calls)
+
+            if self._record_response(speaker, response, turn_count, persona):
+                break
 
             turn_count += 1
-        
-        if turn_count >= max_turns:
-            print(f"Warning: Conversation ended prematurely due to max turn limit of {max_turns}")
-        
-        return TestResult(
-            evaluation_result=self.evaluator.evaluate(
-                self.conversation_history,
-                task_config,
-                persona
-            ),
-            conversation_history=self.conversation_history
-        )
+        self._end_conversation(turn_count, max_turns)
+
+        evaluation_result = (await self.evaluator.evaluate_async(self.conversation_history, task_config, persona)
+                             if evaluate else None)
+        return self._test_result(evaluation_result)
@@ -0,0 +1,150 @@
+from dataclasses import dataclass
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from .data_types import CallSegment
+
+UNKNOWN_SPEAKER = "Unknown"
+# Words outside every diarization turn go to the closest speaker within this many seconds
+DEFAULT_MAX_GAP_SEC = 0.5
+
+
+@dataclass
+class SpeakerTurns:
+    """Diarization turns as parallel arrays"""
+    starts: np.ndarray
+    ends: np.ndarray
+    speakers: np.ndarray
+
+    @classmethod
+    def from_annotation(cls, diarization) -> "SpeakerTurns":
+        """Convert a pyannote Annotation, or anything with the same itertracks(yield_label=True)"""
+        tracks = [(segment.start, segment.end, label) for segment, _, label in diarization.itertracks(yield_label=True)]
+        if not tracks:
+            return cls(np.empty(0), np.empty(0), np.empty(0, dtype=object))
+        starts, ends, speakers = zip(*tracks)
+        return cls(np.asarray(starts, dtype=float), np.asarray(ends, dtype=float), np.asarray(speakers, dtype=object))
+
+    @classmethod
+    def from_segments(cls, segments: List[Dict[str, Any]]) -> "SpeakerTurns":
+        """Turns of a transcription whose segments carry a speaker, such as the AssemblyAI transcriber's"""
+        return cls(np.asarray([segment["start"] for segment in segments], dtype=float),
+                   np.asarray([segment["end"] for segment in segments], dtype=float),
+                   np.asarray([segment["speaker"] for segment in segments], dtype=object))
+
+
+def _merge_intervals(starts: np.ndarray, ends: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Union of possibly overlapping intervals as sorted, disjoint intervals"""
+    order = np.argsort(starts, kind="stable")
+    starts, ends = starts[order], ends[order]
+    running_end = np.maximum.accumulate(ends)
+    # A new interval begins where the start is past every previous end
+    is_new = np.empty(len(starts), dtype=bool)
+    is_new[0] = True
+    is_new[1:] = starts[1:] > running_end[:-1]
+    group = np.cumsum(is_new) - 1
+    merged_ends = np.zeros(group[-1] + 1)
+    np.maximum.at(merged_ends, group, running_end)
+    return starts[is_new], merged_ends
+
+
+def _covered_time(interval_starts: np.ndarray, interval_ends: np.ndarray, times: np.ndarray) -> np.ndarray:
+    """Total length of the disjoint sorted intervals before each time, i.e. their cumulative coverage"""
+    lengths = interval_ends - interval_starts
+    covered_before = np.concatenate(([0.0], np.cumsum(lengths)))
+    index = np.searchsorted(interval_starts, times, side="right") - 1
+    clamped = np.maximum(index, 0)
+    covered = covered_before[clamped] + np.clip(times - interval_starts[clamped], 0, lengths[clamped])
+    return np.where(index >= 0, covered, 0.0)
+
+
+def _gap_to_intervals(interval_starts: np.ndarray, interval_ends: np.ndarray, times: np.ndarray) -> np.ndarray:
+    """Distance from each time to the closest of the disjoint sorted intervals, 0 inside an interval"""
+    index = np.searchsorted(interval_starts, times, side="right") - 1
+    previous = np.maximum(index, 0)
+    gap_to_previous = np.where(index >= 0, np.maximum(times - interval_ends[previous], 0), np.inf)
+    following = np.minimum(index + 1, len(interval_starts) - 1)
+    gap_to_following = np.where(index + 1 < len(interval_starts), interval_starts[following] - times, np.inf)
+    return np.minimum(gap_to_previous, gap_to_following)
+
+
+def assign_word_speakers(turns: SpeakerTurns, word_starts: np.ndarray, word_ends: np.ndarray,
+                         max_gap: float = DEFAULT_MAX_GAP_SEC) -> np.ndarray:
+    """
+    Speaker of each word by maximum overlap with the diarization turns, in O((words + turns) log turns).
+    Overlap with a speaker is the difference of the speaker's cumulative coverage at the word's end and start.
+    """
+    speaker_labels = np.unique(turns.speakers) if len(turns.speakers) else np.empty(0, dtype=object)
+    if len(word_starts) == 0 or len(speaker_labels) == 0:
+        return np.full(len(word_starts), UNKNOWN_SPEAKER, dtype=object)
+
+    overlaps = np.empty((len(speaker_labels), len(word_starts)))
+    gaps = np.empty((len(speaker_labels), len(word_starts)))
+    midpoints = (word_starts + word_ends) / 2
+    for index, speaker in enumerate(speaker_labels):
+        is_speaker = turns.speakers == speaker
+        interval_starts, interval_ends = _merge_intervals(turns.starts[is_speaker], turns.ends[is_speaker])
+        overlaps[index] = (_covered_time(interval_starts, interval_ends, word_ends) -
+                           _covered_time(interval_starts, interval_ends, word_starts))
+        gaps[index] = _gap_to_intervals(interval_starts, interval_ends, midpoints)
+
+    best_overlap = overlaps.argmax(axis=0)
+    closest = gaps.argmin(axis=0)
+    has_overlap = overlaps.max(axis=0) > 0
+    is_near = gaps.min(axis=0) <= max_gap
+    speakers = speaker_labels[np.where(has_overlap, best_overlap, closest)].astype(object)
+    speakers[~has_overlap & ~is_near] = UNKNOWN_SPEAKER
+    return speakers
+
+
+def _flatten_words(transcription: Dict[str, Any]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, List[str]]:
+    """Word starts, ends, segment indexes and texts. A segment without word timestamps counts as a single word."""
+    starts, ends, segment_indexes, texts = [], [], [], []
+    for segment_index, segment in enumerate(transcription["segments"]):
+        words = segment.get("words") or [{"start": segment["start"], "end": segment["end"], "word": segment["text"]}]
+        for word in words:
+            starts.append(word["start"])
+            ends.append(word["end"])
+            segment_indexes.append(segment_index)
+            texts.append(word["word"])
+    return (np.asarray(starts, dtype=float), np.asarray(ends, dtype=float),
+            np.asarray(segment_indexes, dtype=np.int64), texts)
+
+
+def align_transcription(diarization, transcription: Dict[str, Any],
+                        max_gap: float = DEFAULT_MAX_GAP_SEC) -> List[CallSegment]:
+    """
+    Assign a speaker to every transcribed word and split segments where the speaker changes mid-segment.
+    Segments spoken by a single speaker keep their original timestamps and text.
+
+    Args:
+        diarization: pyannote Annotation or SpeakerTurns
+        transcription: Whisper/stable-ts result with segments and word timestamps
+    """
+    turns = diarization if isinstance(diarization, SpeakerTurns) else SpeakerTurns.from_annotation(diarization)
+    word_starts, word_ends, segment_indexes, word_texts = _flatten_words(transcription)
+    if len(word_starts) == 0:
+        return []
+
+    speakers = assign_word_speakers(turns, word_starts, word_ends, max_gap)
+    is_boundary = np.empty(len(speakers), dtype=bool)
+    is_boundary[0] = True
+    is_boundary[1:] = (speakers[1:] != speakers[:-1]) | (segment_indexes[1:] != segment_indexes[:-1])
+    group_starts = np.flatnonzero(is_boundary)
+    group_ends = np.append(group_starts[1:], len(speakers))
+    # Segments split into several groups have at least one speaker change
+    groups_per_segment = np.bincount(segment_indexes[group_starts], minlength=len(transcription["segments"]))
+
+    call_segments = []
+    for first, last in zip(group_starts, group_ends):
+        segment_index = segment_indexes[first]
+        if groups_per_segment[segment_index] == 1:
+            segment = transcription["segments"][segment_index]
+            start_time, end_time, text = segment["start"], segment["end"], segment["text"]
+        else:
+            start_time, end_time = word_starts[first], word_ends[last - 1]
+            text = "".join(word_texts[first:last])
+        call_segments.append(CallSegment(start_time=float(start_time), end_time=float(end_time),
+                                         speaker=speakers[first], text=text))
+    return call_segments
@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+import tempfile
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from .alignment import SpeakerTurns
+
+DEFAULT_ARTIFACT_CACHE_DIR = ".cache/speech_artifacts"
+# Bump when the stored format or the way artifacts are produced changes, older entries are then ignored
+ARTIFACT_FORMAT_VERSION = 1
+
+
+def hash_audio_file(audio_file_path: str) -> str:
+    with open(audio_file_path, "rb") as file:
+        return hashlib.file_digest(file, "sha256").hexdigest()
+
+
+def write_rttm(turns: SpeakerTurns, path: str, uri: str = "audio"):
+    """Diarization turns in the RTTM format used by pyannote and the diarization benchmarks"""
+    with open(path, "w") as file:
+        for start, end, speaker in zip(turns.starts, turns.ends, turns.speakers):
+            file.write(f"SPEAKER {uri} 1 {start:.3f} {end - start:.3f} <NA> <NA> {speaker} <NA> <NA>\n")
+
+
+def read_rttm(path: str) -> SpeakerTurns:
+    starts, ends, speakers = [], [], []
+    with open(path, "r") as file:
+        for line in file:
+            fields = line.split()
+            if not fields or fields[0] != "SPEAKER":
+                continue
+            start, duration = float(fields[3]), float(fields[4])
+            starts.append(start)
+            ends.append(start + duration)
+            speakers.append(fields[7])
+    return SpeakerTurns(np.asarray(starts, dtype=float), np.asarray(ends, dtype=float),
+                        np.asarray(speakers, dtype=object))
+
+
+def _transcription_to_arrays(transcription: Dict[str, Any]) -> Dict[str, np.ndarray]:
+    segments = transcription["segments"]
+    words = [(segment_index, word) for segment_index, segment in enumerate(segments) for word in segment.get("words") or []]
+    return {
+        "segment_starts": np.asarray([segment["start"] for segment in segments], dtype=float),
+        "segment_ends": np.asarray([segment["end"] for segment in segments], dtype=float),
+        "segment_texts": np.asarray([segment["text"] for segment in segments], dtype=str),
+        "word_segments": np.asarray([segment_index for segment_index, _ in words], dtype=np.int64),
+        "word_starts": np.asarray([word["start"] for _, word in words], dtype=float),
+        "word_ends": np.asarray([word["end"] for _, word in words], dtype=float),
+        "word_texts": np.asarray([word["word"] for _, word in words], dtype=str),
+        "language": np.asarray(transcription.get("language") or ""),
+    }
+
+
+def _arrays_to_transcription(arrays) -> Dict[str, Any]:
+    """Rebuild the segments and word timestamps of a stable-ts result, the only parts later stages use"""
+    segments = [{"start": float(start), "end": float(end), "text": str(text), "words": []}
+                for start, end, text in zip(arrays["segment_starts"], arrays["segment_ends"], arrays["segment_texts"])]
+    for segment_index, start, end, text in zip(arrays["word_segments"], arrays["word_starts"], arrays["word_ends"],
+                                               arrays["word_texts"]):
+        segments[segment_index]["words"].append({"start": float(start), "end": float(end), "word": str(text)})
+    return {"language": str(arrays["language"]) or None, "segments": segments}
+
+
+class SpeechArtifacts:
+    """Diarization and transcription of a recording, each read from disk on first access"""
+    def __init__(self, rttm_path: str, words_path: str, embeddings_path: Optional[str] = None,
+                 speech_path: Optional[str] = None):
+        self.rttm_path = rttm_path
+        self.words_path = words_path
+        self.embeddings_path = embeddings_path
+        self.speech_path = speech_path
+        self._turns: Optional[SpeakerTurns] = None
+        self._transcription: Optional[Dict[str, Any]] = None
+
+    @property
+    def turns(self) -> SpeakerTurns:
+        if self._turns is None:
+            self._turns = read_rttm(self.rttm_path)
+        return self._turns
+
+    @property
+    def transcription(self) -> Dict[str, Any]:
+        if self._transcription is None:
+            with np.load(self.words_path, allow_pickle=False) as arrays:
+                self._transcription = _arrays_to_transcription(arrays)
+        return self._transcription
+
+    @property
+    def speaker_embeddings(self) -> Optional[Dict[str, np.ndarray]]:
+        """Diarization embedding of each speaker label, None when the diarization didn't produce any"""
+        if self.embeddings_path is None or not os.path.exists(self.embeddings_path):
+            return None
+        with np.load(self.embeddings_path, allow_pickle=False) as arrays:
+            return dict(zip(arrays["speakers"].tolist(), arrays["embeddings"]))
+
+    @property
+    def speech_frames(self) -> Optional[np.ndarray]:
+        """Waveform speech decision of every turn-taking VAD frame, None for entries cached before it was stored"""
+        if self.speech_path is None or not os.path.exists(self.speech_path):
+            return None
+        with np.load(self.speech_path, allow_pickle=False) as arrays:
+            return np.unpackbits(arrays["frames"], count=int(arrays["count"])).astype(bool)
+
+
+class ArtifactCache:
+    """
+    On-disk cache of diarization (RTTM) and word-level transcription (npz) per recording, keyed by a hash of the
+    audio bytes and of the models and settings that produced them. Re-scoring with new metric settings or speaker
+    role prompts then skips diarization and transcription entirely.
+    """
+    def __init__(self, directory: str = DEFAULT_ARTIFACT_CACHE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        # Hashing is the only per-file cost of a hit, don't repeat it for an unchanged file within the process
+        self._audio_hashes: Dict[tuple, str] = {}
+
+    def _key(self, audio_file_path: str, config: Dict[str, Any]) -> str:
+        stat = os.stat(audio_file_path)
+        file_id = (os.path.abspath(audio_file_path), stat.st_size, stat.st_mtime_ns)
+        if file_id not in self._audio_hashes:
+            self._audio_hashes[file_id] = hash_audio_file(audio_file_path)
+        config_hash = hashlib.sha256(json.dumps({**config, "format_version": ARTIFACT_FORMAT_VERSION},
+                                                sort_keys=True).encode("utf-8")).hexdigest()
+        return f"{self._audio_hashes[file_id][:32]}-{config_hash[:16]}"
+
+    def _paths(self, key: str):
+        return (os.path.join(self.directory, f"{key}.rttm"), os.path.join(self.directory, f"{key}.words.npz"),
+                os.path.join(self.directory, f"{key}.speakers.npz"), os.path.join(self.directory, f"{key}.speech.npz"))
+
+    def load(self, audio_file_path: str, config: Dict[str, Any]) -> Optional[SpeechArtifacts]:
+        rttm_path, words_path, embeddings_path, speech_path = self._paths(self._key(audio_file_path, config))
+        if not (os.path.exists(rttm_path) and os.path.exists(words_path)):
+            return None
+        return SpeechArtifacts(rttm_path, words_path, embeddings_path, speech_path)
+
+    def save_speech_frames(self, audio_file_path: str, config: Dict[str, Any], speech_frames: np.ndarray):
+        """Store the turn-taking speech frames, bit-packed, e.g. for an entry cached before they were stored"""
+        speech_path = self._paths(self._key(audio_file_path, config))[3]
+        with tempfile.NamedTemporaryFile(dir=self.directory, suffix=".npz", delete=False) as file:
+            np.savez(file, frames=np.packbits(speech_frames), count=len(speech_frames))
+        os.replace(file.name, speech_path)
+
+    def save(self, audio_file_path: str, config: Dict[str, Any], turns: SpeakerTurns, transcription: Dict[str, Any],
+             speaker_embeddings: Optional[Dict[str, np.ndarray]] = None,
+             speech_frames: Optional[np.ndarray] = None) -> SpeechArtifacts:
+        rttm_path, words_path, embeddings_path, speech_path = self._paths(self._key(audio_file_path, config))
+        uri = os.path.splitext(os.path.basename(audio_file_path))[0].replace(" ", "_")
+        # Written to temporary files and renamed, so concurrent workers and crashes never leave partial artifacts
+        with tempfile.NamedTemporaryFile(dir=self.directory, suffix=".npz", delete=False) as file:
+            np.savez_compressed(file, **_transcription_to_arrays(transcription))
+        os.replace(file.name, words_path)
+        if speaker_embeddings:
+            with tempfile.NamedTemporaryFile(dir=self.directory, suffix=".npz", delete=False) as file:
+                np.savez(file, speakers=np.asarray(list(speaker_embeddings), dtype=str),
+                         embeddings=np.stack(list(speaker_embeddings.values())))
+            os.replace(file.name, embeddings_path)
+        if speech_frames is not None:
+            self.save_speech_frames(audio_file_path, config, speech_frames)
+        with tempfile.NamedTemporaryFile(dir=self.directory, suffix=".rttm", delete=False) as file:
+            temporary_rttm_path = file.name
+        write_rttm(turns, temporary_rttm_path, uri)
+        os.replace(temporary_rttm_path, rttm_path)
+
+        # Read back from disk so a fresh run and a cache hit align exactly the same (millisecond-rounded) turns
+        return SpeechArtifacts(rttm_path, words_path, embeddings_path, speech_path)
@@ -0,0 +1,145 @@
+import os
+import subprocess
+import tempfile
+from dataclasses import dataclass
+from typing import Iterator, List, Optional
+
+import numpy as np
+
+from .data_types import REQUIRED_AUDIO_TYPE
+
+SAMPLE_RATE = 16000
+# Recordings larger than this on disk are decoded into a memory-mapped file instead of process memory
+MMAP_THRESHOLD_BYTES = 64 * 1024 * 1024
+
+
+def check_audio(samples: np.ndarray, sample_rate: int = SAMPLE_RATE):
+    """Audio handed to Whisper and pyannote must be mono float32 samples at 16kHz"""
+    if samples.dtype != REQUIRED_AUDIO_TYPE:
+        raise ValueError(f"audio array data type must be {np.dtype(REQUIRED_AUDIO_TYPE)}, got {samples.dtype}")
+    if samples.ndim != 1:
+        raise ValueError(f"audio must be mono, got an array of shape {samples.shape}")
+    if sample_rate != SAMPLE_RATE:
+        raise ValueError(f"audio must be sampled at {SAMPLE_RATE}Hz, got {sample_rate}Hz")
+
+
+@dataclass
+class AudioBuffer:
+    """
+    A recording decoded once, shared by diarization and transcription without copies.
+    Use as a context manager so a memory-mapped buffer's file is removed when done.
+    """
+    samples: np.ndarray
+    sample_rate: int = SAMPLE_RATE
+    mmap_path: Optional[str] = None
+
+    def __post_init__(self):
+        check_audio(self.samples, self.sample_rate)
+
+    @property
+    def duration(self) -> float:
+        return len(self.samples) / self.sample_rate
+
+    def as_pyannote_input(self) -> dict:
+        """pyannote's in-memory input, a (channel, time) tensor viewing the same samples"""
+        import torch
+        return {"waveform": torch.from_numpy(self.samples).unsqueeze(0), "sample_rate": self.sample_rate}
+
+    def close(self):
+        if self.mmap_path is None:
+            return
+        # The memmap has to be released before its file can be removed on Windows
+        self.samples = np.empty(0, dtype=REQUIRED_AUDIO_TYPE)
+        try:
+            os.remove(self.mmap_path)
+        except OSError:
+            pass
+        self.mmap_path = None
+
+    def __enter__(self) -> "AudioBuffer":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _ffmpeg_command(audio_file_path: str, output: str, channels: int = 1) -> list:
+    return ["ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error", "-threads", "0", "-i", audio_file_path,
+            "-f", "f32le", "-ac", str(channels), "-ar", str(SAMPLE_RATE), "-y", output]
+
+
+def probe_channels(audio_file_path: str) -> int:
+    """Number of channels of the first audio stream of a recording"""
+    try:
+        process = subprocess.run(["ffprobe", "-v", "error", "-select_streams", "a:0", "-show_entries", "stream=channels",
+                                  "-of", "csv=p=0", audio_file_path], capture_output=True, check=True, text=True)
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"Failed to probe {audio_file_path}: {e.stderr}") from e
+    return int(process.stdout.strip().splitlines()[0])
+
+
+def load_audio(audio_file_path: str, mmap_threshold_bytes: int = MMAP_THRESHOLD_BYTES) -> AudioBuffer:
+    """
+    Decode and resample a recording with ffmpeg into mono float32 at 16kHz, the format both Whisper and pyannote
+    use internally. Large recordings are decoded into a temporary file and memory-mapped.
+    """
+    if not os.path.exists(audio_file_path):
+        raise FileNotFoundError(audio_file_path)
+
+    if os.path.getsize(audio_file_path) < mmap_threshold_bytes:
+        try:
+            process = subprocess.run(_ffmpeg_command(audio_file_path, "-"), capture_output=True, check=True)
+        except subprocess.CalledProcessError as e:
+            raise RuntimeError(f"Failed to decode {audio_file_path}: {e.stderr.decode(errors='replace')}") from e
+        # A bytearray keeps the samples writable, torch.from_numpy warns about read-only arrays
+        return AudioBuffer(np.frombuffer(bytearray(process.stdout), dtype=REQUIRED_AUDIO_TYPE))
+
+    file_descriptor, mmap_path = tempfile.mkstemp(suffix=".f32")
+    os.close(file_descriptor)
+    try:
+        subprocess.run(_ffmpeg_command(audio_file_path, mmap_path), capture_output=True, check=True)
+    except subprocess.CalledProcessError as e:
+        os.remove(mmap_path)
+        raise RuntimeError(f"Failed to decode {audio_file_path}: {e.stderr.decode(errors='replace')}") from e
+    if os.path.getsize(mmap_path) == 0:
+        os.remove(mmap_path)
+        return AudioBuffer(np.empty(0, dtype=REQUIRED_AUDIO_TYPE))
+    # Copy-on-write, so consumers may modify the samples without touching the file
+    return AudioBuffer(np.memmap(mmap_path, dtype=REQUIRED_AUDIO_TYPE, mode="c"), mmap_path=mmap_path)
+
+
+def load_channels(audio_file_path: str, channels: int = 2) -> List[AudioBuffer]:
+    """Decode each channel of a multi-channel recording separately, e.g. the agent and callee of a stereo call"""
+    if not os.path.exists(audio_file_path):
+        raise FileNotFoundError(audio_file_path)
+    try:
+        process = subprocess.run(_ffmpeg_command(audio_file_path, "-", channels), capture_output=True, check=True)
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"Failed to decode {audio_file_path}: {e.stderr.decode(errors='replace')}") from e
+    interleaved = np.frombuffer(process.stdout, dtype=REQUIRED_AUDIO_TYPE)
+    interleaved = interleaved[:len(interleaved) - len(interleaved) % channels].reshape(-1, channels)
+    # Each channel is copied out of the interleaved samples once, Whisper and pyannote need contiguous arrays
+    return [AudioBuffer(np.ascontiguousarray(interleaved[:, channel])) for channel in range(channels)]
+
+
+def stream_audio(audio_file_path: str, chunk_sec: float = 30.0) -> Iterator[np.ndarray]:
+    """Decode a recording in chunks of mono float32 at 16kHz, holding a single chunk in memory at a time"""
+    if not os.path.exists(audio_file_path):
+        raise FileNotFoundError(audio_file_path)
+
+    chunk_bytes = int(chunk_sec * SAMPLE_RATE) * np.dtype(REQUIRED_AUDIO_TYPE).itemsize
+    process = subprocess.Popen(_ffmpeg_command(audio_file_path, "-"), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    decoded = False
+    try:
+        while data := process.stdout.read(chunk_bytes):
+            yield np.frombuffer(bytearray(data), dtype=REQUIRED_AUDIO_TYPE)
+        decoded = True
+    finally:
+        process.stdout.close()
+        if not decoded:
+            # The consumer stopped early
+            process.kill()
+        stderr = process.stderr.read()
+        process.stderr.close()
+        if process.wait() != 0 and decoded:
+            raise RuntimeError(f"Failed to decode {audio_file_path}: {stderr.decode(errors='replace')}")
@@ -0,0 +1,216 @@
+import asyncio
+import glob
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from core.interfaces import AsyncLLMInterface, LLMInterface
+from .data_types import SpeechTestResult
+from .metrics.turn_taking import corpus_percentiles
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".m4a", ".flac", ".ogg", ".webm")
+DEFAULT_MANIFEST_PATH = ".cache/speech_results_manifest.jsonl"
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+
+def discover_recordings(audio_files: str) -> List[str]:
+    """Audio files of a directory, or the files matching a glob such as `calls/**/*.wav`"""
+    if os.path.isdir(audio_files):
+        paths = [os.path.join(audio_files, name) for name in os.listdir(audio_files)
+                 if name.lower().endswith(AUDIO_EXTENSIONS)]
+    else:
+        paths = [path for path in glob.glob(audio_files, recursive=True) if os.path.isfile(path)]
+    return sorted(os.path.abspath(path) for path in paths)
+
+
+def recordings_root(audio_files: str) -> str:
+    """The directory results are keyed relative to: the directory itself, or the part of a glob before any wildcard"""
+    if os.path.isdir(audio_files):
+        return os.path.abspath(audio_files)
+    root_parts = []
+    for part in os.path.dirname(audio_files).split(os.sep):
+        if glob.has_magic(part):
+            break
+        root_parts.append(part)
+    return os.path.abspath(os.sep.join(root_parts) or ".")
+
+
+class ResultsManifest:
+    """
+    Append-only JSONL record of analyzed recordings, written after every file so an interrupted batch resumes
+    where it stopped. A recording is analyzed again if it failed or changed since it was recorded.
+    """
+    def __init__(self, path: str = DEFAULT_MANIFEST_PATH):
+        self.path = path
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path, "r") as file:
+                for line in file:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries[entry["audio_file"]] = entry
+
+    @staticmethod
+    def _fingerprint(audio_file: str) -> Dict[str, Any]:
+        stat = os.stat(audio_file)
+        return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+    def get_result(self, audio_file: str) -> Optional[SpeechTestResult]:
+        """The stored result of a recording that was analyzed successfully and hasn't changed since"""
+        entry = self._entries.get(audio_file)
+        if not entry or entry["status"] != "ok" or entry["fingerprint"] != self._fingerprint(audio_file):
+            return None
+        return SpeechTestResult.from_dict(entry["result"])
+
+    def record(self, audio_file: str, result: Optional[SpeechTestResult] = None, error: Optional[str] = None,
+               duration_sec: Optional[float] = None):
+        entry = {
+            "audio_file": audio_file,
+            "status": "ok" if error is None else "error",
+            "fingerprint": self._fingerprint(audio_file),
+            "duration_sec": duration_sec,
+            "result": result.to_dict() if result else None,
+            "error": error,
+        }
+        self._entries[audio_file] = entry
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "a") as file:
+            file.write(json.dumps(entry) + "\n")
+
+
+def _init_worker(threads_per_worker: int):
+    """Cap the CPU threads of each worker so the workers together don't oversubscribe the cores"""
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(threads_per_worker)
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(threads_per_worker)
+
+
+def _diarize_and_transcribe(audio_file: str):
+    # Imported in the worker, each worker process loads the models once through its own model pool
+    from .run_tests import diarize_and_transcribe_with_embeddings
+    return diarize_and_transcribe_with_embeddings(audio_file)
+
+
+async def _run_batch(audio_files: List[str], agent_task: str, llm: Optional[Union[LLMInterface, AsyncLLMInterface]],
+                     manifest: ResultsManifest, max_workers: int, threads_per_worker: int, llm_concurrency: int,
+                     process_recording: Callable[[str], Any]) -> Dict[str, SpeechTestResult]:
+    from .run_tests import analyze_call_segments, determine_speakers_async, label_speakers
+
+    loop = asyncio.get_running_loop()
+    # Decoded recordings wait here for their speaker roles, so LLM calls overlap with the decoding of other files
+    queue: asyncio.Queue = asyncio.Queue()
+    results: Dict[str, SpeechTestResult] = {}
+    started_at = {audio_file: time.perf_counter() for audio_file in audio_files}
+    completed = 0
+
+    def report(audio_file: str, status: str):
+        nonlocal completed
+        completed += 1
+        print(f"[{completed}/{len(audio_files)}] {os.path.basename(audio_file)}: {status} "
+              f"({time.perf_counter() - started_at[audio_file]:.1f}s)")
+
+    async def decode(pool: ProcessPoolExecutor, audio_file: str):
+        try:
+            output = await loop.run_in_executor(pool, process_recording, audio_file)
+            await queue.put((audio_file, output, None))
+        except Exception as e:
+            await queue.put((audio_file, None, e))
+
+    async def analyze():
+        while True:
+            audio_file, output, error = await queue.get()
+            try:
+                result = None
+                try:
+                    if error is not None:
+                        raise error
+                    output = output if isinstance(output, tuple) else (output,)
+                    call_segments, speaker_embeddings, speech_frames = output + (None,) * (3 - len(output))
+                    speakers_mapping = await determine_speakers_async(call_segments, agent_task, llm, speaker_embeddings)
+                    result = analyze_call_segments(label_speakers(call_segments, speakers_mapping),
+                                                   speech_frames=speech_frames)
+                    results[audio_file] = result
+                except Exception as e:
+                    error = e
+                # A manifest that can't be written loses the resume point of this file, not the rest of the batch
+                try:
+                    if error is None:
+                        manifest.record(audio_file, result, duration_sec=time.perf_counter() - started_at[audio_file])
+                    else:
+                        manifest.record(audio_file, error=f"{type(error).__name__}: {error}")
+                except Exception as e:
+                    print(f"Could not record {audio_file} in the manifest: {e}")
+                report(audio_file, "ok" if error is None else f"failed - {error}")
+            finally:
+                queue.task_done()
+
+    # Spawned workers don't inherit torch and CUDA state from the parent, which isn't fork-safe
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker, initargs=(threads_per_worker,)) as pool:
+        analyzers = [asyncio.create_task(analyze()) for _ in range(llm_concurrency)]
+        await asyncio.gather(*(decode(pool, audio_file) for audio_file in audio_files))
+        await queue.join()
+        for analyzer in analyzers:
+            analyzer.cancel()
+
+    return results
+
+
+def run_batch(audio_files: str, agent_task: str, llm: Optional[Union[LLMInterface, AsyncLLMInterface]] = None,
+              max_workers: Optional[int] = None, threads_per_worker: int = 2,
+              manifest_path: Optional[str] = None, llm_concurrency: int = 4,
+              process_recording: Optional[Callable[[str], Any]] = None) -> Dict[str, SpeechTestResult]:
+    """
+    Analyze a directory or glob of recordings. Decoding, diarization and transcription run in a process pool,
+    speaker roles are determined as recordings finish decoding, with concurrent LLM calls for the ambiguous ones.
+    The workers are spawned and import the calling script again, so call it under `if __name__ == "__main__":`.
+
+    Args:
+        audio_files: Directory of recordings or a glob pattern
+        llm: LLM determining the speaker roles of ambiguous calls, gpt-4o-mini by default
+        max_workers: Worker processes, by default as many as fit the CPU cores at `threads_per_worker` each
+        threads_per_worker: CPU threads each worker's torch and BLAS may use
+        manifest_path: Results manifest used to skip already-analyzed recordings, DEFAULT_MANIFEST_PATH if None
+        llm_concurrency: Speaker role LLM calls in flight at once
+        process_recording: Picklable function returning the diarized call segments of a recording, optionally
+            with the speaker embeddings and the turn-taking speech frames as a
+            (call_segments, speaker_embeddings[, speech_frames]) tuple
+
+    Returns:
+        Results keyed by the path relative to the directory, or to the glob's root, including the ones loaded from
+        the manifest
+    """
+    manifest = ResultsManifest(manifest_path or DEFAULT_MANIFEST_PATH)
+    recordings = discover_recordings(audio_files)
+    results = {}
+    pending = []
+    for audio_file in recordings:
+        result = manifest.get_result(audio_file)
+        if result is not None:
+            results[audio_file] = result
+        else:
+            pending.append(audio_file)
+
+    print(f"Found {len(recordings)} recordings, {len(recordings) - len(pending)} already analyzed, {len(pending)} to analyze")
+    if pending:
+        max_workers = max_workers or max(1, (os.cpu_count() or 1) // threads_per_worker)
+        results.update(asyncio.run(_run_batch(pending, agent_task, llm, manifest, min(max_workers, len(pending)),
+                                              threads_per_worker, llm_concurrency,
+                                              process_recording or _diarize_and_transcribe)))
+
+    root = recordings_root(audio_files)
+    results = {os.path.relpath(audio_file, root): results[audio_file] for audio_file in recordings if audio_file in results}
+    turn_taking = {name: result.turn_taking for name, result in results.items() if result.turn_taking is not None}
+    if turn_taking:
+        corpus = corpus_percentiles(turn_taking)["corpus"]
+        print(f"Turn-taking latency over {len(turn_taking)} calls: "
+              + ", ".join(f"{name} {value * 1000:.0f}ms" for name, value in corpus.items()))
+    return results
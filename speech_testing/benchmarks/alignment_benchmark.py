@@ -0,0 +1,114 @@
+"""
+Benchmark of the speaker alignment of a synthetic two-hour call with 20k words.
+Run from the repository root: python -m speech_testing.benchmarks.alignment_benchmark
+"""
+import time
+from collections import namedtuple
+from typing import Any, Dict, List
+
+import numpy as np
+
+from speech_testing.alignment import align_transcription
+from speech_testing.data_types import CallSegment
+
+CALL_DURATION_SEC = 2 * 60 * 60
+WORD_COUNT = 20_000
+WORDS_PER_SEGMENT = 12
+# The legacy alignment is quadratic, it is timed on a prefix of the call and extrapolated
+LEGACY_WORD_COUNT = 1_000
+TARGET_SEC = 1.0
+
+Segment = namedtuple("Segment", ["start", "end"])
+
+
+class SyntheticDiarization:
+    """Alternating speaker turns with the itertracks interface of a pyannote Annotation"""
+    def __init__(self, tracks):
+        self.tracks = tracks
+
+    def itertracks(self, yield_label=False):
+        for index, (start, end, label) in enumerate(self.tracks):
+            yield Segment(start, end), index, label
+
+
+def create_call(word_count: int, duration_sec: float, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    word_starts = np.sort(rng.uniform(0, duration_sec, word_count))
+    word_ends = np.minimum(word_starts + rng.uniform(0.1, 0.5, word_count), duration_sec)
+
+    # Turns of 2-20 seconds with occasional overlapping speech between the two speakers
+    tracks = []
+    time_sec, speaker = 0.0, 0
+    while time_sec < duration_sec:
+        end = min(time_sec + rng.uniform(2, 20), duration_sec)
+        tracks.append((time_sec, end, f"SPEAKER_0{speaker}"))
+        time_sec = end + rng.uniform(-0.5, 1.0)
+        speaker = 1 - speaker
+
+    segments = []
+    for first in range(0, word_count, WORDS_PER_SEGMENT):
+        words = [{"start": float(start), "end": float(end), "word": f" word{first + index}"}
+                 for index, (start, end) in enumerate(zip(word_starts[first:first + WORDS_PER_SEGMENT],
+                                                          word_ends[first:first + WORDS_PER_SEGMENT]))]
+        segments.append({"start": words[0]["start"], "end": words[-1]["end"],
+                         "text": "".join(word["word"] for word in words), "words": words})
+
+    return SyntheticDiarization(tracks), {"segments": segments}
+
+
+def legacy_merge_diarization_and_transcription(diarization, transcription) -> List[CallSegment]:
+    """The iterrows implementation replaced by align_transcription, kept for comparison"""
+    import pandas as pd
+
+    diarization_df = pd.DataFrame([{"start": segment.start, "end": segment.end, "speaker": speaker_label}
+                                   for segment, _, speaker_label in diarization.itertracks(yield_label=True)])
+    final_transcriptions = []
+    for segment in transcription["segments"]:
+        for word_info in segment["words"]:
+            speaker = None
+            for idx, row in diarization_df.iterrows():
+                if word_info["end"] > row["start"] and word_info["start"] < row["end"]:
+                    speaker = row["speaker"]
+                    break
+        if not speaker:
+            speaker = "Unknown"
+        final_transcriptions.append(CallSegment(start_time=segment["start"], end_time=segment["end"],
+                                                speaker=speaker, text=segment["text"]))
+    return final_transcriptions
+
+
+def time_call(function, *args, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - started_at)
+    return best
+
+
+def main():
+    diarization, transcription = create_call(WORD_COUNT, CALL_DURATION_SEC)
+    print(f"Synthetic call: {CALL_DURATION_SEC / 3600:.0f}h, {WORD_COUNT} words, "
+          f"{len(transcription['segments'])} segments, {len(diarization.tracks)} speaker turns")
+
+    vectorized_sec = time_call(align_transcription, diarization, transcription)
+    call_segments = align_transcription(diarization, transcription)
+    split_segments = len(call_segments) - len(transcription["segments"])
+    print(f"align_transcription: {vectorized_sec * 1000:.1f} ms, {len(call_segments)} call segments "
+          f"({split_segments} added by speaker changes mid-segment)")
+
+    try:
+        legacy_diarization, legacy_transcription = create_call(LEGACY_WORD_COUNT, CALL_DURATION_SEC * LEGACY_WORD_COUNT / WORD_COUNT)
+        legacy_sec = time_call(legacy_merge_diarization_and_transcription, legacy_diarization, legacy_transcription, repeat=1)
+        # Words × turns, both grow linearly with the call length
+        extrapolated_sec = legacy_sec * (WORD_COUNT / LEGACY_WORD_COUNT) ** 2
+        print(f"legacy iterrows: {legacy_sec:.2f} s for {LEGACY_WORD_COUNT} words, "
+              f"~{extrapolated_sec:.0f} s extrapolated to {WORD_COUNT} words ({extrapolated_sec / vectorized_sec:.0f}x slower)")
+    except ImportError:
+        print("pandas is not installed, skipping the legacy comparison")
+
+    assert vectorized_sec < TARGET_SEC, f"Alignment took {vectorized_sec:.2f}s, expected under {TARGET_SEC}s"
+
+
+if __name__ == "__main__":
+    main()
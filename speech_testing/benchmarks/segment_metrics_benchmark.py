@@ -0,0 +1,76 @@
+"""
+Pause and interruption detection over a synthetic corpus of calls, per CallSegment versus on one SegmentTable.
+Run from the repository root: python -m speech_testing.benchmarks.segment_metrics_benchmark
+"""
+import argparse
+import random
+import time
+from typing import List
+
+from core.data_types import EntitySpeaking
+from speech_testing.data_types import CallSegment
+from speech_testing.metrics.interruptions import InterruptionDetector, detect_interruptions_per_call, find_interruptions
+from speech_testing.metrics.pauses import PauseDetector, detect_pauses_per_call, find_pauses
+from speech_testing.segment_table import SegmentTable
+
+
+def create_call(rng: random.Random, segment_count: int) -> List[CallSegment]:
+    """Alternating agent and callee turns with occasional overlaps, long pauses and repeated speakers"""
+    segments, time_sec = [], 0.0
+    speaker = EntitySpeaking.VOICE_AGENT
+    for index in range(segment_count):
+        duration = rng.uniform(0.5, 8)
+        segments.append(CallSegment(start_time=time_sec, end_time=time_sec + duration, speaker=speaker,
+                                    text=f"segment {index} of a synthetic call"))
+        time_sec += duration + rng.uniform(-1, 3)
+        if rng.random() < 0.85:
+            speaker = EntitySpeaking.CALLEE if speaker == EntitySpeaking.VOICE_AGENT else EntitySpeaking.VOICE_AGENT
+    return segments
+
+
+def detect_per_segment(calls: List[List[CallSegment]]):
+    results = []
+    for call_segments in calls:
+        pause_detector, interruption_detector = PauseDetector(), InterruptionDetector()
+        for call_segment in call_segments:
+            pause_detector.update(call_segment)
+            interruption_detector.update(call_segment)
+        results.append((pause_detector.pauses, interruption_detector.interruptions))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=10_000)
+    parser.add_argument("--segments-per-call", type=int, default=120)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    calls = [create_call(rng, args.segments_per_call) for _ in range(args.calls)]
+    print(f"{args.calls} calls, {args.calls * args.segments_per_call} segments")
+
+    started_at = time.perf_counter()
+    expected = detect_per_segment(calls)
+    print(f"PauseDetector + InterruptionDetector: {time.perf_counter() - started_at:.2f}s")
+
+    started_at = time.perf_counter()
+    table = SegmentTable.concatenate([SegmentTable.from_segments(call_segments) for call_segments in calls])
+    print(f"Converting to a SegmentTable: {time.perf_counter() - started_at:.2f}s")
+
+    started_at = time.perf_counter()
+    pause_indexes, _ = find_pauses(table)
+    interruption_indexes = find_interruptions(table)
+    talk_time, gaps, (overlap_indexes, _) = table.talk_time(), table.gaps(), table.overlaps()
+    print(f"SegmentTable arrays (pauses, interruptions, talk time, gaps, overlaps): {time.perf_counter() - started_at:.2f}s")
+    print(f"{len(pause_indexes)} pauses, {len(interruption_indexes)} interruptions, {len(overlap_indexes)} overlaps, "
+          f"{talk_time.sum() / 3600:.0f}h of speech")
+
+    started_at = time.perf_counter()
+    pauses, interruptions = detect_pauses_per_call(table), detect_interruptions_per_call(table)
+    print(f"SegmentTable with PauseData and InterruptionData per call: {time.perf_counter() - started_at:.2f}s")
+
+    assert list(zip(pauses, interruptions)) == expected, "SegmentTable results differ from the detectors'"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Real-time factor of the ASR backends on a recording, to pick the fastest one viable on the available hardware.
+Run from the repository root: python -m speech_testing.benchmarks.transcriber_benchmark call.wav --device cpu
+"""
+import argparse
+from typing import List
+
+from speech_testing.audio import load_audio
+from speech_testing.transcribers import TRANSCRIBERS, TranscriberConfig, create_transcriber
+
+
+def benchmark_configs(audio_file_path: str, configs: List[TranscriberConfig]):
+    with load_audio(audio_file_path) as audio:
+        print(f"{audio_file_path}: {audio.duration:.1f}s of audio\n")
+        rows = []
+        for config in configs:
+            try:
+                transcriber = create_transcriber(config)
+                if not transcriber.provides_speakers:
+                    # The first run pays for loading the model, the second one is timed
+                    transcriber.transcribe(audio)
+                result = transcriber.transcribe_timed(audio)
+            except (ImportError, ValueError) as e:
+                print(f"Skipping {config.backend}: {e}")
+                continue
+            words = sum(len(segment.get("words") or []) for segment in result.transcription["segments"])
+            rows.append((config, result, words))
+
+    print(f"\n{'backend':<16}{'model':<18}{'compute':<10}{'beam':>5}{'batch':>7}{'seconds':>10}{'RTF':>8}{'words':>8}")
+    for config, result, words in sorted(rows, key=lambda row: row[1].real_time_factor):
+        print(f"{config.backend:<16}{config.model:<18}{config.compute_type:<10}{config.beam_size:>5}{config.batch_size:>7}"
+              f"{result.wall_time:>10.2f}{result.real_time_factor:>8.3f}{words:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("audio_file")
+    parser.add_argument("--backends", nargs="+", default=["stable_ts", "faster_whisper"], choices=list(TRANSCRIBERS))
+    parser.add_argument("--model", default="large-v3-turbo")
+    parser.add_argument("--device", default="auto")
+    parser.add_argument("--compute-types", nargs="+", default=["int8"], help="faster-whisper compute types to compare")
+    parser.add_argument("--beam-size", type=int, default=1)
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[8], help="faster-whisper batch sizes to compare")
+    args = parser.parse_args()
+
+    configs = []
+    for backend in args.backends:
+        if backend == "faster_whisper":
+            configs.extend(TranscriberConfig(backend=backend, model=args.model, device=args.device,
+                                             compute_type=compute_type, beam_size=args.beam_size, batch_size=batch_size)
+                           for compute_type in args.compute_types for batch_size in args.batch_sizes)
+        else:
+            configs.append(TranscriberConfig(backend=backend, model=args.model, device=args.device,
+                                             beam_size=args.beam_size))
+    benchmark_configs(args.audio_file, configs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Benchmark of the speech activity detection of a synthetic one-hour two-channel call.
+Run from the repository root: python -m speech_testing.benchmarks.vad_benchmark
+"""
+import time
+
+import numpy as np
+
+from speech_testing.metrics.vad import VADConfig, detect_speech_channels, pcm_to_samples, webrtc_speech_segments
+
+SAMPLE_RATE = 16000
+CALL_DURATION_SEC = 60 * 60
+# The legacy implementation is timed on a prefix of the call and extrapolated
+LEGACY_DURATION_SEC = 5 * 60
+TARGET_SEC = 5.0
+
+
+def create_call(duration_sec: float, seed: int = 0) -> bytes:
+    """Interleaved 16-bit stereo PCM, the speakers take turns on their own channel over low background noise"""
+    rng = np.random.default_rng(seed)
+    sample_count = int(duration_sec * SAMPLE_RATE)
+    channels = rng.normal(0, 30, (2, sample_count))
+    time_sec, speaker = 0.0, 0
+    while time_sec < duration_sec:
+        end = min(time_sec + rng.uniform(1, 12), duration_sec)
+        first, last = int(time_sec * SAMPLE_RATE), int(end * SAMPLE_RATE)
+        # Voiced harmonics with a syllable-rate envelope
+        t = np.arange(last - first) / SAMPLE_RATE
+        envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 4 * t) ** 2
+        channels[speaker, first:last] += 4000 * envelope * (np.sin(2 * np.pi * 140 * t) + 0.5 * np.sin(2 * np.pi * 280 * t))
+        time_sec = end + rng.uniform(-0.5, 1.5)
+        speaker = 1 - speaker
+    return np.clip(channels.T, -32768, 32767).astype("<i2").tobytes()
+
+
+def legacy_get_speech_activity(audio_segment, frame_duration_ms=30, aggressiveness=3):
+    """The per-frame bytes implementation replaced by detect_speech, kept for comparison"""
+    import webrtcvad
+
+    vad = webrtcvad.Vad(aggressiveness)
+    sample_rate = audio_segment.frame_rate
+    audio = audio_segment.raw_data
+    bytes_per_frame = int(sample_rate * (frame_duration_ms / 1000.0) * audio_segment.sample_width)
+    frames = [audio[i:i+bytes_per_frame] for i in range(0, len(audio), bytes_per_frame)]
+
+    timestamp = 0
+    speech = False
+    segments = []
+    segment_start = 0
+    for frame in frames:
+        if len(frame) < bytes_per_frame:
+            frame += b'\x00' * (bytes_per_frame - len(frame))
+        is_speech = vad.is_speech(frame, sample_rate)
+        if is_speech:
+            if not speech:
+                segment_start = timestamp
+            speech = True
+        elif speech:
+            segment_end = timestamp
+            if audio_segment[segment_start:segment_end].rms > 30:
+                segments.append((segment_start, segment_end))
+            speech = False
+        timestamp += frame_duration_ms
+
+    if speech and audio_segment[segment_start:timestamp].rms > 30:
+        segments.append((segment_start, timestamp))
+    return segments
+
+
+def legacy_speech_activity(pcm: bytes, channel: int):
+    from pydub import AudioSegment
+
+    audio = AudioSegment(data=pcm, sample_width=2, frame_rate=SAMPLE_RATE, channels=2)
+    return legacy_get_speech_activity(audio.split_to_mono()[channel], aggressiveness=3)
+
+
+def time_call(function, *args) -> float:
+    started_at = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - started_at
+
+
+def main():
+    pcm = create_call(CALL_DURATION_SEC)
+    print(f"Synthetic call: {CALL_DURATION_SEC / 3600:.0f}h, 2 channels, {len(pcm) / 1024 ** 2:.0f} MB of PCM")
+
+    # Zero-copy view of the interleaved PCM, each channel is a strided view
+    samples = pcm_to_samples(pcm).reshape(-1, 2)
+    energy_sec = time_call(detect_speech_channels, samples, SAMPLE_RATE)
+    segments = detect_speech_channels(samples, SAMPLE_RATE)
+    speech_sec = sum(float((ends - starts).sum()) for starts, ends in segments)
+    print(f"energy VAD: {energy_sec:.2f} s, {sum(len(starts) for starts, _ in segments)} speech segments, "
+          f"{speech_sec / 60:.1f} min of speech")
+
+    try:
+        webrtc_sec = time_call(detect_speech_channels, samples, SAMPLE_RATE, VADConfig(use_webrtc=True))
+        print(f"energy + webrtcvad: {webrtc_sec:.2f} s")
+        # The same detection as the legacy implementation, which runs webrtcvad on every frame too
+        webrtc_only_sec = sum(time_call(webrtc_speech_segments, np.ascontiguousarray(samples[:, channel]), SAMPLE_RATE)
+                              for channel in (0, 1))
+        print(f"webrtcvad + RMS filter (get_speech_activity): {webrtc_only_sec:.2f} s")
+    except ImportError:
+        webrtc_sec = None
+        print("webrtcvad is not installed, skipping the webrtcvad variants")
+
+    if webrtc_sec is not None:
+        try:
+            legacy_pcm = pcm[:LEGACY_DURATION_SEC * SAMPLE_RATE * 4]
+            legacy_sec = sum(time_call(legacy_speech_activity, legacy_pcm, channel) for channel in (0, 1))
+            extrapolated_sec = legacy_sec * CALL_DURATION_SEC / LEGACY_DURATION_SEC
+            # Compared like for like: both run webrtcvad on every frame
+            print(f"legacy pydub + webrtcvad: {legacy_sec:.2f} s for {LEGACY_DURATION_SEC // 60} min, "
+                  f"~{extrapolated_sec:.0f} s extrapolated to the full call "
+                  f"({extrapolated_sec / webrtc_only_sec:.1f}x get_speech_activity, "
+                  f"{extrapolated_sec / webrtc_sec:.1f}x energy + webrtcvad)")
+        except ImportError:
+            print("pydub is not installed, skipping the legacy comparison")
+
+    assert energy_sec < TARGET_SEC, f"VAD took {energy_sec:.2f}s, expected under {TARGET_SEC}s"
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,28 @@
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass, field
 from enum import Enum
-from typing import List
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Union
 
-from llm_testing.core.data_types import EntitySpeaking
+import numpy as np
+
+from core.data_types import EntitySpeaking, MetricResult
+
+if TYPE_CHECKING:
+    from .metrics.turn_taking import TurnTakingLatency
+
+# Whisper expects mono float32 samples at 16kHz
+REQUIRED_AUDIO_TYPE = np.float32
+
+
+def _speaker_to_json(speaker: Union[EntitySpeaking, str]) -> str:
+    return speaker.value if isinstance(speaker, EntitySpeaking) else speaker
+
+
+def _speaker_from_json(speaker: str) -> Union[EntitySpeaking, str]:
+    """Roles are restored as EntitySpeaking, diarization labels such as SPEAKER_00 stay strings"""
+    try:
+        return EntitySpeaking(speaker)
+    except ValueError:
+        return speaker
 
 @dataclass
 class CallSegment:
@@ -48,3 +68,33 @@ class SpeechTestResult:
     call_segments: List[CallSegment]
     interruptions: List[InterruptionData]
     pauses: List[PauseData]
+    # Results of every metric of the analysis, see speech_testing.metrics.registry
+    metric_results: List[MetricResult] = field(default_factory=list)
+    # Waveform-timed callee-to-agent transitions, kept so a batch can report percentiles over the whole corpus
+    turn_taking: Optional["TurnTakingLatency"] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "call_segments": [{**asdict(segment), "speaker": _speaker_to_json(segment.speaker)} for segment in self.call_segments],
+            "interruptions": [{**asdict(interruption), "interrupted_speaker": _speaker_to_json(interruption.interrupted_speaker)}
+                              for interruption in self.interruptions],
+            "pauses": [asdict(pause) for pause in self.pauses],
+            "metric_results": [metric_result.model_dump() for metric_result in self.metric_results],
+            "turn_taking": {"callee_ends": self.turn_taking.callee_ends.tolist(),
+                            "agent_starts": self.turn_taking.agent_starts.tolist()} if self.turn_taking is not None else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'SpeechTestResult':
+        from .metrics.turn_taking import TurnTakingLatency
+        turn_taking = data.get("turn_taking")
+        return cls(
+            call_segments=[CallSegment(**{**segment, "speaker": _speaker_from_json(segment["speaker"])})
+                           for segment in data["call_segments"]],
+            interruptions=[InterruptionData(**{**interruption, "interrupted_speaker": _speaker_from_json(interruption["interrupted_speaker"])})
+                           for interruption in data["interruptions"]],
+            pauses=[PauseData(**pause) for pause in data["pauses"]],
+            metric_results=[MetricResult(**metric_result) for metric_result in data.get("metric_results", [])],
+            turn_taking=TurnTakingLatency(np.asarray(turn_taking["callee_ends"], dtype=float),
+                                          np.asarray(turn_taking["agent_starts"], dtype=float)) if turn_taking else None,
+        )
@@ -1,39 +1,84 @@
-from typing import List
-from llm_testing.core.data_types import EntitySpeaking
+from typing import Iterable, List, Optional, Union
+
+import numpy as np
+
+from core.data_types import EntitySpeaking
 from ..data_types import CallSegment, InterruptionData
+from ..segment_table import SegmentTable, as_segment_table
 
 # approach one - split into two channels, then run analysis (pauses + interruptions) on each channel
 # approach two - speaker diarization on combined audio, then run analysis (pauses + intterruptions)
 
-def detect_interuptions(call_segments: List[CallSegment]) -> List[InterruptionData]:
-    interruption_segments = []
-    prev_speaker = None
-    prev_end_time = 0
-    # Analyze segments to detect interruption segments
-    for res in call_segments:
-        current_speaker = res.speaker
 
-        if prev_speaker is not None:
+class InterruptionDetector:
+    """Detects interruptions segment by segment, so detection can run while the call is still being transcribed"""
+    def __init__(self):
+        self.interruptions: List[InterruptionData] = []
+        self._prev_speaker: Optional[EntitySpeaking] = None
+        self._prev_end_time = 0
+
+    def update(self, res: CallSegment) -> List[InterruptionData]:
+        """Add the next segment, returns the interruption it starts if any"""
+        current_speaker = res.speaker
+        new_interruptions = []
+        if self._prev_speaker is not None:
             # Check if speaker has changed and if the initial speaker's speech start time is smaller or equal than last end time
-            if current_speaker != prev_speaker:
+            if current_speaker != self._prev_speaker:
                 # Only update prev_end_time when speaker changes
-                if res.start_time <= prev_end_time:
-                    interruption_segments.append(res)
-                prev_end_time = res.end_time
+                if res.start_time <= self._prev_end_time:
+                    # Find who was interrupted by looking at previous speaker
+                    interrupted_speaker = EntitySpeaking.VOICE_AGENT if res.speaker == EntitySpeaking.CALLEE else EntitySpeaking.CALLEE
+                    new_interruptions.append(InterruptionData(
+                        interrupted_speaker=interrupted_speaker,
+                        interrupted_at=res.start_time,
+                        interruption_duration=res.end_time - res.start_time,
+                        interruption_text=res.text
+                    ))
+                self._prev_end_time = res.end_time
 
         # Only update previous speaker
-        prev_speaker = current_speaker
-
-    interruption_data = []
-    for res in interruption_segments:
-        duration = res.end_time - res.start_time
-        # Find who was interrupted by looking at previous speaker
-        interrupted_speaker = EntitySpeaking.VOICE_AGENT if res.speaker == EntitySpeaking.CALLEE else EntitySpeaking.CALLEE    
-        interruption_data.append(InterruptionData(  
-            interrupted_speaker=interrupted_speaker,
-            interrupted_at=res.start_time,
-            interruption_duration=duration,
-            interruption_text=res.text
-        ))
-
-    return interruption_data
\ No newline at end of file
+        self._prev_speaker = current_speaker
+        self.interruptions.extend(new_interruptions)
+        return new_interruptions
+
+
+def find_interruptions(table: SegmentTable) -> np.ndarray:
+    """
+    InterruptionDetector over every call of the table at once. Returns the indexes of the segments where the speaker
+    changes before the previous speaker change's segment ended.
+    """
+    previous = table.previous_codes()
+    is_change = (previous >= 0) & (previous != table.speaker_codes)
+    # End of the latest speaker change before each segment, 0 before the first change of a call like the detector
+    changes = np.where(is_change, np.arange(len(table)), -1)
+    last_change = np.empty(len(table), dtype=np.int64)
+    last_change[:1] = -1
+    last_change[1:] = np.maximum.accumulate(changes)[:-1]
+
+    indexes = np.flatnonzero(is_change)
+    last_change = last_change[indexes]
+    call_starts = table.call_offsets[table.call_ids()[indexes]]
+    previous_end = np.where(last_change >= call_starts, table.ends[np.maximum(last_change, 0)], 0)
+    return indexes[table.starts[indexes] <= previous_end]
+
+
+def interruptions_at(table: SegmentTable, indexes: np.ndarray) -> List[InterruptionData]:
+    callee = table.code_of(EntitySpeaking.CALLEE)
+    return [InterruptionData(
+                interrupted_speaker=EntitySpeaking.VOICE_AGENT if code == callee else EntitySpeaking.CALLEE,
+                interrupted_at=start,
+                interruption_duration=end - start,
+                interruption_text=table.text_at(index))
+            for index, code, start, end in zip(indexes.tolist(), table.speaker_codes[indexes].tolist(),
+                                               table.starts[indexes].tolist(), table.ends[indexes].tolist())]
+
+
+def detect_interuptions(call_segments: Union[Iterable[CallSegment], SegmentTable]) -> List[InterruptionData]:
+    # Analyze segments to detect interruption segments
+    table = as_segment_table(call_segments)
+    return interruptions_at(table, find_interruptions(table))
+
+
+def detect_interruptions_per_call(table: SegmentTable) -> List[List[InterruptionData]]:
+    indexes = find_interruptions(table)
+    return table.split_by_call(indexes, interruptions_at(table, indexes))
@@ -1,126 +1,63 @@
 # TODO: remove entire file if ended up working with combined audio
 # If keeping, add pydub webrtcvad noisereduce to requirements.txt
+# The detection itself is vectorized in vad.py, these are its pydub-facing wrappers in milliseconds
 
 from pydub import AudioSegment
-import webrtcvad
 import numpy as np
-import noisereduce as nr
 
-def get_speech_activity(audio_segment, frame_duration_ms=30, aggressiveness=3):
+from .vad import VADConfig, detect_speech, pcm_to_samples, webrtc_speech_segments
+from .vad import find_overlaps as find_segment_overlaps
+from .vad import merge_close_segments as merge_segments
+from .vad import reduce_noise as reduce_samples_noise
+
+def get_speech_activity(audio_segment, frame_duration_ms=30, aggressiveness=3, energy_vad=False):
     """
-    Returns a list of tuples (start_ms, end_ms) for segments where speech is detected.
+    Returns a list of tuples (start_ms, end_ms) for segments where speech is detected: runs of frames webrtcvad
+    flags as speech with an RMS energy above 30.
+    With energy_vad, frames must also pass the energy hysteresis of vad.detect_speech, which drops bursts under
+    90ms and merges segments less than 300ms apart.
     """
-    vad = webrtcvad.Vad(aggressiveness)
     sample_rate = audio_segment.frame_rate
     assert sample_rate in (8000, 16000, 32000, 48000), "Sample rate must be 8000, 16000, 32000, or 48000 Hz"
 
-    # Convert audio to raw PCM data
-    audio = audio_segment.raw_data
-    bytes_per_frame = int(sample_rate * (frame_duration_ms / 1000.0) * audio_segment.sample_width)
-    frames = [audio[i:i+bytes_per_frame] for i in range(0, len(audio), bytes_per_frame)]
-    
-    speech_frames = []
-    timestamp = 0
-    speech = False
-    segments = []
-    segment_start = 0
-
-    for frame in frames:
-        if len(frame) < bytes_per_frame:
-            # Pad frame with zeros
-            frame += b'\x00' * (bytes_per_frame - len(frame))
-        is_speech = vad.is_speech(frame, sample_rate)
-        start_ms = timestamp
-        end_ms = timestamp + frame_duration_ms
-        if is_speech:
-            if not speech:
-                # Start of a new speech segment
-                segment_start = start_ms
-            speech = True
-        else:
-            if speech:
-                # End of a speech segment
-                segment_end = end_ms - frame_duration_ms  # End at the previous frame
-                # Apply energy threshold to filter out low-energy segments
-                segment_audio = audio_segment[segment_start:segment_end]
-                if is_high_energy(segment_audio):
-                    segments.append((segment_start, segment_end))
-                speech = False
-        timestamp += frame_duration_ms
-
-    # If speech was ongoing at the end of the audio
-    if speech:
-        segment_end = timestamp
-        segment_audio = audio_segment[segment_start:segment_end]
-        if is_high_energy(segment_audio):
-            segments.append((segment_start, segment_end))
-    return segments
-
-def is_high_energy(segment, threshold=30):
-    """
-    Determines if the audio segment has high enough energy to be considered speech.
-    """
-    # Calculate RMS (Root Mean Square) energy
-    rms = segment.rms
-    return rms > threshold
+    # Zero-copy view of the raw PCM data
+    samples = pcm_to_samples(audio_segment.raw_data, audio_segment.sample_width)
+    if energy_vad:
+        starts, ends = detect_speech(samples, sample_rate, VADConfig(frame_ms=frame_duration_ms, use_webrtc=True,
+                                                                     webrtc_aggressiveness=aggressiveness))
+    else:
+        starts, ends = webrtc_speech_segments(samples, sample_rate, frame_duration_ms, aggressiveness)
+    return [(int(round(start * 1000)), int(round(end * 1000))) for start, end in zip(starts, ends)]
 
 def reduce_noise(audio_segment):
     """
     Applies noise reduction to the audio segment.
     """
-    # Convert AudioSegment to numpy array
-    samples = np.array(audio_segment.get_array_of_samples())
-    # Apply noise reduction
-    reduced_noise = nr.reduce_noise(y=samples.astype(np.float32), sr=audio_segment.frame_rate)
-    # Convert back to AudioSegment
-    reduced_audio_segment = audio_segment._spawn(reduced_noise.astype(np.int16).tobytes())
-    return reduced_audio_segment
+    samples = pcm_to_samples(audio_segment.raw_data, audio_segment.sample_width).astype(np.float32)
+    reduced_noise = reduce_samples_noise(samples, audio_segment.frame_rate)
+    return audio_segment._spawn(reduced_noise.astype(np.int16).tobytes())
+
+def _to_arrays(segments):
+    if not segments:
+        return np.empty(0), np.empty(0)
+    starts, ends = zip(*segments)
+    return np.asarray(starts, dtype=float), np.asarray(ends, dtype=float)
 
 def find_overlaps(segments1, segments2):
     """
     Given two lists of speech segments [(start_ms, end_ms)], find overlapping segments.
     Returns a list of overlaps (start_ms, end_ms)
     """
-    overlaps = []
-    idx1, idx2 = 0, 0
-    while idx1 < len(segments1) and idx2 < len(segments2):
-        s1_start, s1_end = segments1[idx1]
-        s2_start, s2_end = segments2[idx2]
-
-        # Check if segments overlap
-        latest_start = max(s1_start, s2_start)
-        earliest_end = min(s1_end, s2_end)
-        overlap = earliest_end - latest_start
-        if overlap > 0:
-            overlaps.append((latest_start, earliest_end))
-
-        # Move to next segment
-        if s1_end <= s2_end:
-            idx1 += 1
-        else:
-            idx2 += 1
-    return overlaps
+    starts, ends, _ = find_segment_overlaps(_to_arrays(segments1), _to_arrays(segments2))
+    order = np.argsort(starts, kind="stable")
+    return [(start, end) for start, end in zip(starts[order].tolist(), ends[order].tolist())]
 
 def merge_close_segments(segments, merge_threshold_ms=1000):
     """
     Merges segments that are within a specified threshold in milliseconds.
     """
-    if not segments:
-        return []
-
-    merged_segments = [segments[0]]
-
-    for current in segments[1:]:
-        prev_start, prev_end = merged_segments[-1]
-        curr_start, curr_end = current
-
-        if curr_start - prev_end <= merge_threshold_ms:
-            # Merge the current segment with the previous one
-            merged_segments[-1] = (prev_start, max(prev_end, curr_end))
-        else:
-            merged_segments.append(current)
-
-    return merged_segments
+    starts, ends = merge_segments(*_to_arrays(segments), merge_threshold_ms)
+    return list(zip(starts.tolist(), ends.tolist()))
 
 def main(audio_file_path):
     audio = AudioSegment.from_file(audio_file_path)
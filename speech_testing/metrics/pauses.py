@@ -1,35 +1,90 @@
-from typing import List
-from llm_testing.core.data_types import EntitySpeaking
+from typing import Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from core.data_types import EntitySpeaking
 from ..data_types import CallSegment, PauseData
+from ..segment_table import SegmentTable, as_segment_table
 
 MIN_PAUSE_DURATION = 2
 
-def detect_pauses(call_segments: List[CallSegment]) -> List[PauseData]:
-    pauses = []
-    prev_segment = call_segments[0]
-    last_callee_segment = call_segments[0] if call_segments[0].speaker == EntitySpeaking.CALLEE else None
-    # Check for pauses longer than min_pause_duration seconds between segments
-    for i in range(1, len(call_segments)):
-        current_segment = call_segments[i]
-        
+
+class PauseDetector:
+    """Detects long pauses segment by segment, so detection can run while the call is still being transcribed"""
+    def __init__(self):
+        self.pauses: List[PauseData] = []
+        self._prev_segment: Optional[CallSegment] = None
+        self._last_callee_segment: Optional[CallSegment] = None
+
+    def update(self, current_segment: CallSegment) -> List[PauseData]:
+        """Add the next segment, returns the pauses it completes"""
+        prev_segment = self._prev_segment
+        self._prev_segment = current_segment
+        if prev_segment is None:
+            self._last_callee_segment = current_segment if current_segment.speaker == EntitySpeaking.CALLEE else None
+            return []
+
         if current_segment.speaker == EntitySpeaking.CALLEE and prev_segment.speaker == EntitySpeaking.VOICE_AGENT:
-            last_callee_segment = current_segment
+            self._last_callee_segment = current_segment
 
         # Only check pauses after callee segments
+        new_pauses = []
         if prev_segment.speaker == EntitySpeaking.CALLEE and current_segment.speaker == EntitySpeaking.VOICE_AGENT:
-            if last_callee_segment:
-                pause_duration = current_segment.start_time - last_callee_segment.end_time
+            if self._last_callee_segment:
+                pause_duration = current_segment.start_time - self._last_callee_segment.end_time
                 if pause_duration > MIN_PAUSE_DURATION:
-                    pauses.append(PauseData(
+                    new_pauses.append(PauseData(
                         duration=pause_duration,
                         start_time=prev_segment.end_time,
                         text_before_pause=prev_segment.text,
                         text_after_pause=current_segment.text,
                     ))
-                    
-                last_callee_segment = None
 
-        prev_segment = current_segment
+                self._last_callee_segment = None
+
+        self.pauses.extend(new_pauses)
+        return new_pauses
+
+
+def find_pauses(table: SegmentTable) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    PauseDetector over every call of the table at once. Returns the indexes of the agent segments that end a long
+    pause after a callee response, and the pause durations.
+    """
+    callee, agent = table.code_of(EntitySpeaking.CALLEE), table.code_of(EntitySpeaking.VOICE_AGENT)
+    previous = table.previous_codes()
+    is_call_start = previous < 0
+    # A callee response starts after the agent or the call start, and is answered when the agent speaks next
+    is_response = (table.speaker_codes == callee) & (is_call_start | (previous == agent))
+    is_answer = (table.speaker_codes == agent) & (previous == callee) & ~is_call_start
+    # Latest response or answer before each segment, a pause is measured from a response not answered yet
+    events = np.where(is_response | is_answer, np.arange(len(table)), -1)
+    last_event = np.empty(len(table), dtype=np.int64)
+    last_event[:1] = -1
+    last_event[1:] = np.maximum.accumulate(events)[:-1]
+
+    answers = np.flatnonzero(is_answer)
+    responses = last_event[answers]
+    call_starts = table.call_offsets[table.call_ids()[answers]]
+    is_measured = (responses >= call_starts) & is_response[np.maximum(responses, 0)]
+    answers, responses = answers[is_measured], responses[is_measured]
+    durations = table.starts[answers] - table.ends[responses]
+    is_long = durations > MIN_PAUSE_DURATION
+    return answers[is_long], durations[is_long]
+
+
+def pauses_at(table: SegmentTable, indexes: np.ndarray, durations: np.ndarray) -> List[PauseData]:
+    return [PauseData(duration=duration, start_time=float(table.ends[index - 1]),
+                      text_before_pause=table.text_at(index - 1), text_after_pause=table.text_at(index))
+            for index, duration in zip(indexes.tolist(), durations.tolist())]
+
+
+def detect_pauses(call_segments: Union[Iterable[CallSegment], SegmentTable]) -> List[PauseData]:
+    # Check for pauses longer than min_pause_duration seconds between segments
+    table = as_segment_table(call_segments)
+    return pauses_at(table, *find_pauses(table))
+
 
-    return pauses
-    
\ No newline at end of file
+def detect_pauses_per_call(table: SegmentTable) -> List[List[PauseData]]:
+    indexes, durations = find_pauses(table)
+    return table.split_by_call(indexes, pauses_at(table, indexes, durations))
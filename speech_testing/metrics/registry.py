@@ -0,0 +1,256 @@
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Optional, Sequence, Type, Union
+
+import numpy as np
+
+from core.data_types import EntitySpeaking, MetricResult
+from ..data_types import CallSegment, InterruptionData, PauseData
+from ..segment_table import SegmentTable, SegmentTableBuilder, as_segment_table
+from .interruptions import find_interruptions, interruptions_at
+from .pauses import find_pauses, pauses_at
+from .vad import merge_close_segments
+
+# Success limits of the built-in metrics
+MAX_AGENT_TALK_RATIO = 0.65
+AGENT_WORDS_PER_MINUTE = (110, 190)
+MAX_RESPONSE_LATENCY_P90 = 1.5
+MAX_SILENCE_RATIO = 0.3
+MAX_OVERLAPS = 3
+MAX_BARGE_IN_RECOVERY = 1.0
+# Worst occurrences quoted in a metric's reasoning
+MAX_REPORTED = 5
+
+
+class SpeechMetric(ABC):
+    """A metric computed with NumPy operations on the SegmentTable of a call, shared by all metrics"""
+    name: str
+
+    @abstractmethod
+    def compute(self, table: SegmentTable) -> MetricResult:
+        pass
+
+
+SPEECH_METRICS: Dict[str, Type[SpeechMetric]] = {}
+
+
+def register_metric(metric_class: Type[SpeechMetric]) -> Type[SpeechMetric]:
+    """Class decorator making a metric available by name to MetricPass"""
+    SPEECH_METRICS[metric_class.name] = metric_class
+    return metric_class
+
+
+def _flag_result(name: str, success: bool, reasoning: str, evidence: str = "") -> MetricResult:
+    return MetricResult(name=name, eval_output_type="success_flag", eval_output="true" if success else "false",
+                        eval_output_success_threshold=1, reasoning=reasoning, evidence=evidence)
+
+
+def interruptions_result(interruptions: List[InterruptionData]) -> MetricResult:
+    return _flag_result("interruptions", len(interruptions) == 0,
+                        f"Had {len(interruptions)} interruptions.\n" + "\n".join(
+                            f"\nInterruption at {interruption.interrupted_at:.2f}s:\nText that interrupted: "
+                            f"{interruption.interruption_text}\n" for interruption in interruptions))
+
+
+def pauses_result(pauses: List[PauseData]) -> MetricResult:
+    return _flag_result("pauses", len(pauses) == 0,
+                        f"Had {len(pauses)} pauses.\n" + "\n".join(
+                            f"Pause at {pause.start_time:.2f}s (duration: {pause.duration:.2f}s). "
+                            f"Text before pause: {pause.text_before_pause}" for pause in pauses))
+
+
+def _role_talk_time(table: SegmentTable, speaker: EntitySpeaking) -> float:
+    code = table.code_of(speaker)
+    return float(table.durations[table.speaker_codes == code].sum()) if code >= 0 else 0.0
+
+
+@register_metric
+class InterruptionsMetric(SpeechMetric):
+    name = "interruptions"
+
+    def __init__(self):
+        self.interruptions: List[InterruptionData] = []
+
+    def compute(self, table: SegmentTable) -> MetricResult:
+        self.interruptions = interruptions_at(table, find_interruptions(table))
+        return interruptions_result(self.interruptions)
+
+
+@register_metric
+class PausesMetric(SpeechMetric):
+    name = "pauses"
+
+    def __init__(self):
+        self.pauses: List[PauseData] = []
+
+    def compute(self, table: SegmentTable) -> MetricResult:
+        self.pauses = pauses_at(table, *find_pauses(table))
+        return pauses_result(self.pauses)
+
+
+@register_metric
+class TalkRatioMetric(SpeechMetric):
+    """Share of the talk time taken by the voice agent"""
+    name = "talk_ratio"
+
+    def __init__(self, max_agent_ratio: float = MAX_AGENT_TALK_RATIO):
+        self.max_agent_ratio = max_agent_ratio
+
+    def compute(self, table: SegmentTable) -> MetricResult:
+        total = float(table.talk_time().sum())
+        if total == 0:
+            return _flag_result(self.name, True, "No speech.")
+        ratio = _role_talk_time(table, EntitySpeaking.VOICE_AGENT) / total
+        return _flag_result(self.name, ratio <= self.max_agent_ratio,
+                            f"The voice agent talked {ratio:.0%} of the time (at most {self.max_agent_ratio:.0%}), "
+                            f"the callee {_role_talk_time(table, EntitySpeaking.CALLEE) / total:.0%}.")
+
+
+@register_metric
+class WordsPerMinuteMetric(SpeechMetric):
+    """Speaking rate of the voice agent while it talks"""
+    name = "words_per_minute"
+
+    def __init__(self, agent_range: Sequence[float] = AGENT_WORDS_PER_MINUTE):
+        self.agent_range = agent_range
+
+    def compute(self, table: SegmentTable) -> MetricResult:
+        minutes = _role_talk_time(table, EntitySpeaking.VOICE_AGENT) / 60
+        if minutes == 0:
+            return _flag_result(self.name, True, "The voice agent didn't speak.")
+        word_counts = table.word_counts()
+        words_per_minute = word_counts[table.speaker_codes == table.code_of(EntitySpeaking.VOICE_AGENT)].sum() / minutes
+        callee_minutes = _role_talk_time(table, EntitySpeaking.CALLEE) / 60
+        callee_words = word_counts[table.speaker_codes == table.code_of(EntitySpeaking.CALLEE)].sum()
+        callee = f", the callee {callee_words / callee_minutes:.0f}" if callee_minutes else ""
+        low, high = self.agent_range
+        return _flag_result(self.name, low <= words_per_minute <= high,
+                            f"The voice agent spoke {words_per_minute:.0f} words per minute (expected {low}-{high}){callee}.")
+
+
+@register_metric
+class ResponseLatencyMetric(SpeechMetric):
+    """Time the voice agent takes to answer each callee turn"""
+    name = "response_latency"
+
+    def __init__(self, max_p90: float = MAX_RESPONSE_LATENCY_P90):
+        self.max_p90 = max_p90
+
+    def compute(self, table: SegmentTable) -> MetricResult:
+        callee = table.code_of(EntitySpeaking.CALLEE)
+        # code_of is -1 without callee segments, which previous_codes also uses for the first segment of a call
+        answers = np.flatnonzero((table.speaker_codes == table.code_of(EntitySpeaking.VOICE_AGENT))
+                                 & (table.previous_codes() == callee)) if callee >= 0 else np.empty(0, dtype=np.int64)
+        if len(answers) == 0:
+            return _flag_result(self.name, True, "The voice agent never answered a callee turn.")
+        # Answers starting before the callee finished have no latency
+        latencies = np.maximum(0.0, table.starts[answers] - table.ends[answers - 1])
+        p50, p90 = np.percentile(latencies, [50, 90])
+        slowest = np.argsort(latencies)[::-1][:MAX_REPORTED]
+        return _flag_result(self.name, p90 <= self.max_p90,
+                            f"{len(latencies)} agent turns, response latency p50 {p50:.2f}s, p90 {p90:.2f}s "
+                            f"(at most {self.max_p90:.2f}s), max {latencies.max():.2f}s.",
+                            "\n".join(f"{latencies[index]:.2f}s before {table.starts[answers[index]]:.2f}s: "
+                                      f"{table.text_at(answers[index])}" for index in slowest.tolist()))
+
+
+@register_metric
+class SilenceRatioMetric(SpeechMetric):
+    """Share of the call where nobody speaks"""
+    name = "silence_ratio"
+
+    def __init__(self, max_ratio: float = MAX_SILENCE_RATIO):
+        self.max_ratio = max_ratio
+
+    def compute(self, table: SegmentTable) -> MetricResult:
+        # From the first segment's start to the last speech, the ringing before the call is answered doesn't count
+        duration = float(table.ends.max() - table.starts.min()) if len(table) else 0.0
+        if duration <= 0:
+            return _flag_result(self.name, True, "No speech.")
+        starts, ends = merge_close_segments(*_sorted_intervals(table), 0.0)
+        ratio = 1 - float((ends - starts).sum()) / duration
+        return _flag_result(self.name, ratio <= self.max_ratio,
+                            f"Silent {ratio:.0%} of the {duration:.0f}s call (at most {self.max_ratio:.0%}).")
+
+
+@register_metric
+class OverlapCountMetric(SpeechMetric):
+    """Segments starting while the previous segment, of another speaker, is still going"""
+    name = "overlap_count"
+
+    def __init__(self, max_overlaps: int = MAX_OVERLAPS):
+        self.max_overlaps = max_overlaps
+
+    def compute(self, table: SegmentTable) -> MetricResult:
+        indexes, _ = table.overlaps()
+        return _flag_result(self.name, len(indexes) <= self.max_overlaps,
+                            f"{len(indexes)} segments overlapped another speaker (at most {self.max_overlaps}).",
+                            "\n".join(f"{table.starts[index]:.2f}s "
+                                      f"{getattr(table.speaker_at(index), 'value', table.speaker_at(index))}: "
+                                      f"{table.text_at(index)}" for index in indexes[:MAX_REPORTED].tolist()))
+
+
+@register_metric
+class BargeInRecoveryMetric(SpeechMetric):
+    """How long the voice agent keeps talking after the callee barges in, i.e. overlaps an agent segment"""
+    name = "barge_in_recovery"
+
+    def __init__(self, max_recovery: float = MAX_BARGE_IN_RECOVERY):
+        self.max_recovery = max_recovery
+
+    def compute(self, table: SegmentTable) -> MetricResult:
+        indexes, _ = table.overlaps()
+        barge_ins = indexes[(table.speaker_codes[indexes] == table.code_of(EntitySpeaking.CALLEE))
+                            & (table.speaker_codes[indexes - 1] == table.code_of(EntitySpeaking.VOICE_AGENT))
+                            & (table.starts[indexes] > table.starts[indexes - 1])]
+        if len(barge_ins) == 0:
+            return _flag_result(self.name, True, "The callee never barged in.")
+        recoveries = table.ends[barge_ins - 1] - table.starts[barge_ins]
+        worst = int(np.argmax(recoveries))
+        return _flag_result(self.name, recoveries[worst] <= self.max_recovery,
+                            f"{len(recoveries)} barge-ins, the voice agent kept talking {recoveries.mean():.2f}s "
+                            f"on average and {recoveries[worst]:.2f}s at most (at most {self.max_recovery:.2f}s).",
+                            f"{table.starts[barge_ins[worst]]:.2f}s: {table.text_at(barge_ins[worst])}")
+
+
+def _sorted_intervals(table: SegmentTable):
+    order = np.argsort(table.starts, kind="stable")
+    return table.starts[order], table.ends[order]
+
+
+DEFAULT_METRICS = tuple(SPEECH_METRICS)
+
+
+class MetricPass:
+    """
+    Collects the segments of a call into one SegmentTable that every metric is computed on, adding metrics doesn't
+    add passes over the segments. Segments may come from a generator such as a streaming transcription, they are
+    kept as compact columns rather than CallSegment objects.
+    """
+    def __init__(self, metrics: Optional[Iterable[Union[str, SpeechMetric]]] = None):
+        self.metrics: Dict[str, SpeechMetric] = {}
+        for metric in DEFAULT_METRICS if metrics is None else metrics:
+            if isinstance(metric, str):
+                if metric not in SPEECH_METRICS:
+                    raise ValueError(f"Unknown speech metric '{metric}', expected one of {list(SPEECH_METRICS)}")
+                metric = SPEECH_METRICS[metric]()
+            self.metrics[metric.name] = metric
+        self.builder = SegmentTableBuilder()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.metrics
+
+    def __getitem__(self, name: str) -> SpeechMetric:
+        return self.metrics[name]
+
+    def update(self, segment: CallSegment):
+        self.builder.append(segment)
+
+    def results(self, table: Optional[SegmentTable] = None) -> List[MetricResult]:
+        """Every metric on the table, the collected segments' by default"""
+        table = self.builder.build() if table is None else table
+        return [metric.compute(table) for metric in self.metrics.values()]
+
+
+def evaluate_segments(call_segments: Union[Iterable[CallSegment], SegmentTable],
+                      metrics: Optional[Iterable[Union[str, SpeechMetric]]] = None) -> List[MetricResult]:
+    return MetricPass(metrics).results(as_segment_table(call_segments))
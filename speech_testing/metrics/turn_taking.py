@@ -0,0 +1,152 @@
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Tuple, Union
+
+import numpy as np
+
+from core.data_types import EntitySpeaking, MetricResult
+from ..alignment import SpeakerTurns
+from ..data_types import CallSegment
+from ..segment_table import SegmentTable, as_segment_table
+from .vad import VADConfig, merge_close_segments, speech_frames, speech_frames_to_segments
+
+# 10ms frames resolve turn boundaries far finer than ASR segment timestamps
+TURN_TAKING_VAD = VADConfig(frame_ms=10, min_speech_ms=60, merge_gap_ms=300)
+# Speech frames this far outside a speaker's diarization turns are still attributed to the speaker
+ATTRIBUTION_PADDING_SEC = 0.3
+PERCENTILES = (50, 90, 99)
+# Voice agents should answer well under a second
+MAX_LATENCY_P90 = 0.8
+
+
+@dataclass
+class TurnTakingLatency:
+    """Callee-to-agent turn transitions, negative latencies are agent answers overlapping the callee's end"""
+    callee_ends: np.ndarray
+    agent_starts: np.ndarray
+
+    @property
+    def latencies(self) -> np.ndarray:
+        return self.agent_starts - self.callee_ends
+
+    def percentiles(self) -> Dict[str, float]:
+        if len(self.callee_ends) == 0:
+            return {f"p{percentile}": float("nan") for percentile in PERCENTILES}
+        return {f"p{percentile}": float(value) for percentile, value in
+                zip(PERCENTILES, np.percentile(self.latencies, PERCENTILES))}
+
+    @classmethod
+    def concatenate(cls, calls: Iterable["TurnTakingLatency"]) -> "TurnTakingLatency":
+        """Transitions of a whole corpus, for corpus-wide percentiles"""
+        calls = list(calls)
+        return cls(np.concatenate([call.callee_ends for call in calls] or [np.empty(0)]),
+                   np.concatenate([call.agent_starts for call in calls] or [np.empty(0)]))
+
+    def to_metric_result(self, max_p90: float = MAX_LATENCY_P90) -> MetricResult:
+        if len(self.callee_ends) == 0:
+            return MetricResult(name="turn_taking_latency", eval_output_type="success_flag", eval_output="true",
+                                eval_output_success_threshold=1, reasoning="No callee-to-agent turn transitions.",
+                                evidence="")
+        percentiles = self.percentiles()
+        slowest = np.argsort(self.latencies)[::-1][:5]
+        return MetricResult(
+            name="turn_taking_latency", eval_output_type="success_flag",
+            eval_output="true" if percentiles["p90"] <= max_p90 else "false", eval_output_success_threshold=1,
+            reasoning=f"{len(self.callee_ends)} agent answers measured on the waveform, latency "
+                      + ", ".join(f"{name} {value * 1000:.0f}ms" for name, value in percentiles.items())
+                      + f" (p90 at most {max_p90 * 1000:.0f}ms), {int((self.latencies < 0).sum())} overlapped the callee.",
+            evidence="\n".join(f"{self.latencies[index] * 1000:.0f}ms after the callee stopped at "
+                               f"{self.callee_ends[index]:.2f}s" for index in slowest))
+
+
+def match_turn_transitions(agent: Tuple[np.ndarray, np.ndarray],
+                           callee: Tuple[np.ndarray, np.ndarray]) -> TurnTakingLatency:
+    """
+    Pair every agent speech segment that takes the turn from the callee with the callee segment it answers: the
+    latest callee segment starting before it, if the agent was silent since that segment started. Agent speech
+    entirely within callee speech is a backchannel, not an answer.
+    """
+    agent_starts, agent_ends = agent
+    callee_starts, callee_ends = callee
+    if len(callee_starts) == 0:
+        return TurnTakingLatency(np.empty(0), np.empty(0))
+    answered = np.searchsorted(callee_starts, agent_starts, side="left") - 1
+    previous_agent_ends = np.concatenate(([-np.inf], agent_ends[:-1]))
+    safe_answered = np.maximum(answered, 0)
+    is_transition = ((answered >= 0) & (previous_agent_ends <= callee_starts[safe_answered])
+                     & (callee_ends[safe_answered] < agent_ends))
+    return TurnTakingLatency(callee_ends[safe_answered[is_transition]], agent_starts[is_transition])
+
+
+def _distance_to_intervals(times: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Distance of each time to the closest of sorted disjoint intervals, 0 inside one"""
+    if len(starts) == 0:
+        return np.full(len(times), np.inf)
+    following = np.searchsorted(starts, times, side="right")
+    previous = following - 1
+    to_previous = np.where(previous >= 0, np.maximum(times - ends[np.maximum(previous, 0)], 0), np.inf)
+    to_following = np.where(following < len(starts), starts[np.minimum(following, len(starts) - 1)] - times, np.inf)
+    return np.minimum(to_previous, to_following)
+
+
+def _role_intervals(turns: SpeakerTurns, labels: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    is_role = np.isin(turns.speakers.astype(str), labels)
+    order = np.argsort(turns.starts[is_role], kind="stable")
+    return merge_close_segments(turns.starts[is_role][order], turns.ends[is_role][order], 0.0)
+
+
+def measure_turn_taking(samples: np.ndarray, sample_rate: int, turns: SpeakerTurns, agent_labels: List[str],
+                        callee_labels: List[str], config: VADConfig = TURN_TAKING_VAD,
+                        padding: float = ATTRIBUTION_PADDING_SEC) -> TurnTakingLatency:
+    """
+    Turn-taking latency of a mono recording. Speech boundaries come from frame energies on the waveform, the
+    diarization turns only attribute each speech frame to the agent or the callee, whichever's turns are closest.
+
+    Args:
+        agent_labels: Diarization labels of the voice agent, e.g. ["SPEAKER_01"]
+        callee_labels: Diarization labels of the callee
+    """
+    return attribute_turn_taking(turn_taking_speech_frames(samples, sample_rate, config), turns, agent_labels, callee_labels,
+                                 config, padding)
+
+
+def turn_taking_speech_frames(samples: np.ndarray, sample_rate: int, config: VADConfig = TURN_TAKING_VAD) -> np.ndarray:
+    """The waveform part of measure_turn_taking, computed while a recording is decoded for diarization"""
+    return speech_frames(samples, sample_rate, config)
+
+
+def attribute_turn_taking(is_speech: np.ndarray, turns: SpeakerTurns, agent_labels: List[str],
+                          callee_labels: List[str], config: VADConfig = TURN_TAKING_VAD,
+                          padding: float = ATTRIBUTION_PADDING_SEC) -> TurnTakingLatency:
+    """measure_turn_taking from turn_taking_speech_frames, the speaker roles are usually only known afterwards"""
+    frame_sec = config.frame_ms / 1000
+    centers = (np.arange(len(is_speech)) + 0.5) * frame_sec
+    agent_distance = _distance_to_intervals(centers, *_role_intervals(turns, agent_labels))
+    callee_distance = _distance_to_intervals(centers, *_role_intervals(turns, callee_labels))
+    # Frames inside both speakers' turns are overlapping speech and count for both
+    is_agent = is_speech & (agent_distance <= padding) & (agent_distance <= callee_distance)
+    is_callee = is_speech & (callee_distance <= padding) & (callee_distance <= agent_distance)
+    return match_turn_transitions(speech_frames_to_segments(is_agent, config),
+                                  speech_frames_to_segments(is_callee, config))
+
+
+def measure_channel_turn_taking(agent_samples: np.ndarray, callee_samples: np.ndarray, sample_rate: int,
+                                config: VADConfig = TURN_TAKING_VAD) -> TurnTakingLatency:
+    """Turn-taking latency of a recording with the agent and the callee on separate channels, no diarization needed"""
+    agent = speech_frames_to_segments(speech_frames(agent_samples, sample_rate, config), config)
+    callee = speech_frames_to_segments(speech_frames(callee_samples, sample_rate, config), config)
+    return match_turn_transitions(agent, callee)
+
+
+def turns_from_call_segments(call_segments: Union[Iterable[CallSegment], SegmentTable]
+                             ) -> Tuple[SpeakerTurns, List[str], List[str]]:
+    """Speaker turns of labeled call segments, with the agent and callee labels measure_turn_taking expects"""
+    table = as_segment_table(call_segments)
+    labels = np.asarray([getattr(speaker, "value", speaker) for speaker in table.speakers], dtype=object)
+    turns = SpeakerTurns(table.starts, table.ends, labels[table.speaker_codes] if len(labels) else labels)
+    return turns, [EntitySpeaking.VOICE_AGENT.value], [EntitySpeaking.CALLEE.value]
+
+
+def corpus_percentiles(calls: Dict[str, TurnTakingLatency]) -> Dict[str, Dict[str, float]]:
+    """Latency percentiles of every call, and of all transitions of the corpus under "corpus\""""
+    return {**{name: call.percentiles() for name, call in calls.items()},
+            "corpus": TurnTakingLatency.concatenate(calls.values()).percentiles()}
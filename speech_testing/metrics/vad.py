@@ -0,0 +1,192 @@
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Frame sizes webrtcvad accepts, 10ms frames give the finest resolution
+WEBRTC_FRAME_MS = (10, 20, 30)
+WEBRTC_SAMPLE_RATES = (8000, 16000, 32000, 48000)
+# Energies are relative to full scale, silence is floored here instead of -inf
+SILENCE_DB = -100.0
+
+
+@dataclass
+class VADConfig:
+    frame_ms: int = 30
+    # Speech starts above noise floor + start_db and lasts while above noise floor + continue_db (hysteresis)
+    start_db: float = 15.0
+    continue_db: float = 9.0
+    # Frames quieter than this are never speech, whatever the noise floor
+    min_speech_db: float = -50.0
+    # Percentile of frame energies taken as the noise floor
+    noise_floor_percentile: float = 10.0
+    min_speech_ms: int = 90
+    # Speech segments separated by less than this are merged
+    merge_gap_ms: int = 300
+    # Combine the energy decision with webrtcvad's, requires the webrtcvad package
+    use_webrtc: bool = False
+    webrtc_aggressiveness: int = 3
+
+
+def pcm_to_samples(pcm: bytes, sample_width: int = 2) -> np.ndarray:
+    """Samples of raw little-endian PCM, viewed without copying"""
+    return np.frombuffer(pcm, dtype=f"<i{sample_width}")
+
+
+def frame_view(samples: np.ndarray, frame_length: int, hop_length: Optional[int] = None) -> np.ndarray:
+    """(frames, frame_length) strided view of the samples, the incomplete last frame is dropped"""
+    hop_length = hop_length or frame_length
+    if len(samples) < frame_length:
+        return np.empty((0, frame_length), dtype=samples.dtype)
+    return sliding_window_view(samples, frame_length)[::hop_length]
+
+
+def frame_energies_db(samples: np.ndarray, sample_rate: int, frame_ms: int = 30) -> np.ndarray:
+    """RMS energy of every frame in dB relative to full scale, in one vectorized pass"""
+    frame_length = sample_rate * frame_ms // 1000
+    frames = frame_view(samples, frame_length)
+    scale = float(np.iinfo(samples.dtype).max) if np.issubdtype(samples.dtype, np.integer) else 1.0
+    # einsum casts the strided frames in buffered blocks, never making a float copy of the whole file
+    mean_square = np.einsum("ij,ij->i", frames, frames, dtype=np.float64) / frame_length
+    with np.errstate(divide="ignore"):
+        energies = 10 * np.log10(mean_square / (scale * scale))
+    return np.maximum(energies, SILENCE_DB)
+
+
+def hysteresis(start: np.ndarray, keep: np.ndarray) -> np.ndarray:
+    """Frames in runs of `keep` that contain at least one `start` frame, i.e. a two-threshold switch"""
+    keep = keep | start
+    if not keep.any():
+        return keep
+    is_run_start = keep & ~np.concatenate(([False], keep[:-1]))
+    # Frames outside of runs get the previous run's id, they are masked out by keep
+    run_ids = np.cumsum(is_run_start) - 1
+    started_runs = np.zeros(int(is_run_start.sum()), dtype=bool)
+    started_runs[run_ids[start]] = True
+    return keep & started_runs[run_ids]
+
+
+def frames_to_segments(is_speech: np.ndarray, frame_sec: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Start and end times in seconds of the runs of speech frames"""
+    edges = np.diff(np.concatenate(([0], is_speech.astype(np.int8), [0])))
+    return np.flatnonzero(edges == 1) * frame_sec, np.flatnonzero(edges == -1) * frame_sec
+
+
+def merge_close_segments(starts: np.ndarray, ends: np.ndarray, max_gap: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Merge sorted segments separated by at most max_gap seconds"""
+    if len(starts) == 0:
+        return starts, ends
+    running_end = np.maximum.accumulate(ends)
+    is_new = np.empty(len(starts), dtype=bool)
+    is_new[0] = True
+    is_new[1:] = starts[1:] - running_end[:-1] > max_gap
+    last = np.append(np.flatnonzero(is_new)[1:] - 1, len(starts) - 1)
+    return starts[is_new], running_end[last]
+
+
+def find_overlaps(first: Tuple[np.ndarray, np.ndarray],
+                  second: Tuple[np.ndarray, np.ndarray]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Overlaps between two channels' sorted disjoint segments, as starts, ends and which channel started speaking
+    last, i.e. the one that interrupted (0 for first, 1 for second).
+    """
+    first_starts, first_ends = first
+    second_starts, second_ends = second
+    # The second channel's segments overlapping each segment of the first are a contiguous range
+    lows = np.searchsorted(second_ends, first_starts, side="right")
+    highs = np.searchsorted(second_starts, first_ends, side="left")
+    counts = np.maximum(highs - lows, 0)
+    first_index = np.repeat(np.arange(len(first_starts)), counts)
+    second_index = np.repeat(lows, counts) + (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts))
+
+    starts = np.maximum(first_starts[first_index], second_starts[second_index])
+    ends = np.minimum(first_ends[first_index], second_ends[second_index])
+    interrupter = (second_starts[second_index] > first_starts[first_index]).astype(int)
+    is_overlap = ends > starts
+    return starts[is_overlap], ends[is_overlap], interrupter[is_overlap]
+
+
+def webrtc_speech_frames(samples: np.ndarray, sample_rate: int, frame_ms: int, aggressiveness: int) -> np.ndarray:
+    """webrtcvad decision per frame. Frames are zero-copy slices of the PCM buffer, only the calls are per frame."""
+    import webrtcvad
+
+    if sample_rate not in WEBRTC_SAMPLE_RATES or frame_ms not in WEBRTC_FRAME_MS:
+        raise ValueError(f"webrtcvad needs a sample rate in {WEBRTC_SAMPLE_RATES} and frames of {WEBRTC_FRAME_MS} ms")
+    if samples.dtype != np.int16:
+        samples = (np.clip(samples, -1.0, 1.0) * 32767).astype(np.int16)
+    vad = webrtcvad.Vad(aggressiveness)
+    frame_bytes = sample_rate * frame_ms // 1000 * 2
+    pcm = memoryview(np.ascontiguousarray(samples)).cast("B")
+    frame_count = len(pcm) // frame_bytes
+    return np.fromiter((vad.is_speech(pcm[index * frame_bytes:(index + 1) * frame_bytes], sample_rate)
+                        for index in range(frame_count)), dtype=bool, count=frame_count)
+
+
+def webrtc_speech_segments(samples: np.ndarray, sample_rate: int, frame_ms: int = 30, aggressiveness: int = 3,
+                           min_rms: float = 30.0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Runs of frames webrtcvad flags as speech, as start and end times in seconds, keeping the runs whose RMS in
+    sample units is above min_rms. No hysteresis, minimum duration or merging, an incomplete last frame is zero-padded.
+    """
+    frame_length = sample_rate * frame_ms // 1000
+    sample_count = len(samples)
+    padding = -sample_count % frame_length
+    if padding:
+        samples = np.concatenate((samples, np.zeros(padding, dtype=samples.dtype)))
+    is_speech = webrtc_speech_frames(samples, sample_rate, frame_ms, aggressiveness)
+    frames = frame_view(samples, frame_length)
+    # Segments are whole frames, so their energies are differences of the cumulative frame energies
+    cumulative = np.concatenate(([0.0], np.cumsum(np.einsum("ij,ij->i", frames, frames, dtype=np.float64))))
+    edges = np.diff(np.concatenate(([0], is_speech.astype(np.int8), [0])))
+    first, last = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    lengths = np.minimum(last * frame_length, sample_count) - first * frame_length
+    rms = np.sqrt((cumulative[last] - cumulative[first]) / np.maximum(lengths, 1))
+    is_loud = rms > min_rms
+    return first[is_loud] * frame_ms / 1000, last[is_loud] * frame_ms / 1000
+
+
+def detect_speech(samples: np.ndarray, sample_rate: int,
+                  config: Optional[VADConfig] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Speech segments of a mono signal, float or integer PCM, as start and end times in seconds.
+    Frame energies go through a two-threshold hysteresis relative to the noise floor, short bursts are dropped and
+    close segments merged.
+    """
+    config = config or VADConfig()
+    return speech_frames_to_segments(speech_frames(samples, sample_rate, config), config)
+
+
+def speech_frames(samples: np.ndarray, sample_rate: int, config: Optional[VADConfig] = None) -> np.ndarray:
+    """Speech decision of every frame_ms frame, before short bursts are dropped and close segments merged"""
+    config = config or VADConfig()
+    energies = frame_energies_db(samples, sample_rate, config.frame_ms)
+    if len(energies) == 0:
+        return np.zeros(0, dtype=bool)
+
+    noise_floor = np.percentile(energies, config.noise_floor_percentile)
+    loud = energies > config.min_speech_db
+    is_speech = hysteresis(loud & (energies > noise_floor + config.start_db),
+                           loud & (energies > noise_floor + config.continue_db))
+    if config.use_webrtc:
+        is_speech &= webrtc_speech_frames(samples, sample_rate, config.frame_ms, config.webrtc_aggressiveness)
+    return is_speech
+
+
+def speech_frames_to_segments(is_speech: np.ndarray, config: VADConfig) -> Tuple[np.ndarray, np.ndarray]:
+    """Segments of speech frames longer than min_speech_ms, merged when closer than merge_gap_ms"""
+    starts, ends = frames_to_segments(is_speech, config.frame_ms / 1000)
+    is_long = ends - starts >= config.min_speech_ms / 1000
+    return merge_close_segments(starts[is_long], ends[is_long], config.merge_gap_ms / 1000)
+
+
+def detect_speech_channels(samples: np.ndarray, sample_rate: int,
+                           config: Optional[VADConfig] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """Speech segments of each channel of interleaved (samples, channels) audio, channels are strided views"""
+    return [detect_speech(samples[:, channel], sample_rate, config) for channel in range(samples.shape[1])]
+
+
+def reduce_noise(samples: np.ndarray, sample_rate: int) -> np.ndarray:
+    """Spectral gating noise reduction of float samples, requires the noisereduce package"""
+    import noisereduce as nr
+    return nr.reduce_noise(y=samples, sr=sample_rate).astype(samples.dtype, copy=False)
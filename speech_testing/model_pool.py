@@ -0,0 +1,186 @@
+import gc
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+GB = 1024 ** 3
+DEFAULT_MEMORY_BUDGET_BYTES = int(float(os.getenv("SPEECH_MODEL_POOL_BUDGET_GB", "8")) * GB)
+DEFAULT_DIARIZATION_PIPELINE = "pyannote/speaker-diarization-3.1"
+# Approximate resident size, used for models whose size can't be measured from their torch parameters
+ESTIMATED_MODEL_SIZES_BYTES = {
+    "tiny": int(0.15 * GB),
+    "base": int(0.3 * GB),
+    "small": int(1 * GB),
+    "medium": int(2.5 * GB),
+    "large-v1": int(4.5 * GB),
+    "large-v2": int(4.5 * GB),
+    "large-v3": int(4.5 * GB),
+    "large-v3-turbo": int(2.5 * GB),
+    DEFAULT_DIARIZATION_PIPELINE: int(0.5 * GB),
+}
+DEFAULT_MODEL_SIZE_BYTES = int(1 * GB)
+
+
+@dataclass(frozen=True)
+class ModelKey:
+    """A loaded model is reused for every request with the same key"""
+    kind: str  # stable_whisper, faster_whisper or pyannote
+    name: str
+    device: str = "cpu"
+    compute_type: str = "default"
+
+
+def estimate_model_size(key: ModelKey, model: Any) -> int:
+    """Size of the torch parameters of the model if it has any, otherwise the estimate of its name"""
+    parameters = getattr(model, "parameters", None)
+    if callable(parameters):
+        try:
+            size = sum(parameter.numel() * parameter.element_size() for parameter in parameters())
+            if size:
+                return size
+        except Exception:
+            pass
+    return ESTIMATED_MODEL_SIZES_BYTES.get(key.name.removesuffix(".en"), DEFAULT_MODEL_SIZE_BYTES)
+
+
+class ModelPool:
+    """
+    Process-wide pool of loaded speech models, so each (model, device, compute_type) is loaded once and reused
+    across files. When the models exceed the memory budget, the least recently used ones are released.
+    Use `ModelPool.get` for the shared pool.
+    """
+    _shared: Optional["ModelPool"] = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, memory_budget_bytes: int = DEFAULT_MEMORY_BUDGET_BYTES):
+        self.memory_budget_bytes = memory_budget_bytes
+        self._models: "OrderedDict[ModelKey, Any]" = OrderedDict()
+        self._sizes: Dict[ModelKey, int] = {}
+        self._lock = threading.Lock()
+        # Loads of the same key wait for each other instead of loading the model twice
+        self._load_locks: Dict[ModelKey, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+        self.load_time = 0.0
+
+    @classmethod
+    def get(cls) -> "ModelPool":
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    @property
+    def used_bytes(self) -> int:
+        with self._lock:
+            return sum(self._sizes.values())
+
+    def get_or_load(self, key: ModelKey, loader: Callable[[], Any]) -> Any:
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                self.hits += 1
+                return self._models[key]
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                if key in self._models:
+                    self._models.move_to_end(key)
+                    self.hits += 1
+                    return self._models[key]
+
+            started_at = time.perf_counter()
+            model = loader()
+            load_time = time.perf_counter() - started_at
+            size = estimate_model_size(key, model)
+            logging.info(f"Loaded {key.name} on {key.device} in {load_time:.1f}s ({size / GB:.2f} GB)")
+
+            with self._lock:
+                self.misses += 1
+                self.load_time += load_time
+                self._models[key] = model
+                self._sizes[key] = size
+                self._evict(keep=key)
+            return model
+
+    def _evict(self, keep: ModelKey):
+        """Release the least recently used models until the pool fits its budget, the model in use is always kept"""
+        evicted = False
+        while sum(self._sizes.values()) > self.memory_budget_bytes and len(self._models) > 1:
+            key = next(iter(self._models))
+            if key == keep:
+                self._models.move_to_end(key)
+                continue
+            del self._models[key]
+            del self._sizes[key]
+            evicted = True
+            logging.info(f"Evicted {key.name} on {key.device} from the model pool")
+
+        if evicted:
+            gc.collect()
+            _empty_cuda_cache()
+
+    def evict(self, key: ModelKey):
+        with self._lock:
+            self._models.pop(key, None)
+            self._sizes.pop(key, None)
+        gc.collect()
+        _empty_cuda_cache()
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+            self._sizes.clear()
+        gc.collect()
+        _empty_cuda_cache()
+
+
+def _empty_cuda_cache():
+    try:
+        import torch
+    except ImportError:
+        return
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+def get_stable_whisper_model(name: str = "large-v3-turbo", device: Optional[str] = None,
+                             pool: Optional[ModelPool] = None):
+    """stable-ts Whisper model, loaded on the default device if none is given"""
+    def load():
+        import stable_whisper
+        return stable_whisper.load_model(name, device=device)
+
+    return (pool or ModelPool.get()).get_or_load(ModelKey("stable_whisper", name, device or "auto"), load)
+
+
+def get_faster_whisper_model(name: str, device: str = "cpu", compute_type: str = "int8",
+                             pool: Optional[ModelPool] = None):
+    def load():
+        from faster_whisper import WhisperModel
+        return WhisperModel(name, device=device, compute_type=compute_type)
+
+    return (pool or ModelPool.get()).get_or_load(ModelKey("faster_whisper", name, device, compute_type), load)
+
+
+def get_diarization_pipeline(name: str = DEFAULT_DIARIZATION_PIPELINE, device: str = "cpu",
+                             pool: Optional[ModelPool] = None):
+    """pyannote diarization pipeline, requires the HUGGING_FACE_TOKEN environment variable"""
+    def load():
+        api_key = os.getenv("HUGGING_FACE_TOKEN")
+        if not api_key:
+            raise ValueError("Please set HUGGING_FACE_TOKEN environment variable")
+
+        from pyannote.audio import Pipeline
+        pipeline = Pipeline.from_pretrained(name, use_auth_token=api_key)
+        if device != "cpu":
+            import torch
+            pipeline.to(torch.device(device))
+        return pipeline
+
+    return (pool or ModelPool.get()).get_or_load(ModelKey("pyannote", name, device), load)
@@ -1,173 +1,289 @@
-import json
 import os
-from typing import Dict, List
+import itertools
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
-from llm_testing.core.data_types import EntitySpeaking
+import numpy as np
 
-from llm_testing.providers.openai import OpenAIProvider
+from core.data_types import EntitySpeaking
+from core.interfaces import AsyncLLMInterface, LLMInterface
 
+from speech_testing.alignment import SpeakerTurns, align_transcription
+from speech_testing.artifact_cache import ArtifactCache
+from speech_testing.audio import SAMPLE_RATE, AudioBuffer, load_audio
 from speech_testing.data_types import CallSegment, SpeechTestResult
-from speech_testing.metrics.interruptions import detect_interuptions
-from speech_testing.metrics.pauses import MIN_PAUSE_DURATION, detect_pauses
+from speech_testing.metrics.pauses import MIN_PAUSE_DURATION
+from speech_testing.metrics.registry import MetricPass, SpeechMetric
+from speech_testing.metrics.turn_taking import attribute_turn_taking, turn_taking_speech_frames, turns_from_call_segments
+from speech_testing.model_pool import DEFAULT_DIARIZATION_PIPELINE, get_diarization_pipeline
+from speech_testing.speaker_roles import get_role_resolver
+from speech_testing.transcribers import Transcriber, TranscriberConfig, create_transcriber
     
 import time
 from typing import List
-from pyannote.audio import Pipeline
 from pyannote.audio.pipelines.utils.hook import ProgressHook
 
-import torchaudio
-import stable_whisper
+NUM_SPEAKERS = 2
+# Segments transcribed before the speaker roles are determined when streaming
+ROLE_DETECTION_SEGMENTS = 40
+# Cosine similarity above which a speaker of a streaming window is the same voice as a speaker of earlier windows
+SAME_SPEAKER_SIMILARITY = 0.5
 
 
-def transcribe_prescise_timestamps(model, audio_file_path: str):
-    return model.refine(audio_file_path, model.transcribe(audio_file_path, suppress_silence=False)).to_dict()
+def artifact_config(transcriber: Transcriber) -> Dict[str, Any]:
+    """Everything that changes the diarization and transcription of a recording, part of the artifact cache key"""
+    diarization = ({"diarization": transcriber.name} if transcriber.provides_speakers else
+                   {"diarization_pipeline": DEFAULT_DIARIZATION_PIPELINE, "num_speakers": NUM_SPEAKERS})
+    return {**diarization, "transcriber": transcriber.config.cache_key(), "sample_rate": SAMPLE_RATE}
 
 def merge_diarization_and_transcription(diarization, transcription) -> List[CallSegment]:
-    from pyannote.core import Segment
-    import pandas as pd
-
-    # Convert diarization result to a DataFrame for easier handling
-    diarization_df = pd.DataFrame(
-        [
-            {
-                "start": segment.start,
-                "end": segment.end,
-                "speaker": speaker_label
-            }
-            for segment, _, speaker_label in diarization.itertracks(yield_label=True)
-        ]
-    )
-    
-    # Prepare a list to hold the final results
-    final_transcriptions = []
-
-    # Iterate over the words from the ASR result
-    for segment in transcription["segments"]:
-        for word_info in segment["words"]:
-            word_start = word_info["start"]
-            word_end = word_info["end"]
-            
-            # Find the speaker for this word
-            # Check which diarization segment the word falls into
-            speaker = None
-            for idx, row in diarization_df.iterrows():
-                if word_end > row["start"] and word_start < row["end"]:
-                    speaker = row["speaker"]
-                    break
-        
-        # If no speaker is found, label as 'Unknown' or skip
-        if not speaker:
-            speaker = "Unknown"
-
-        segment_start = segment["start"]
-        segment_end = segment["end"]
-        segment_text = segment["text"]
-
-        
-        # Append to final transcriptions
-        final_transcriptions.append(
-            CallSegment(
-                start_time=segment_start,
-                end_time=segment_end,
-                speaker=speaker,
-                text=segment_text
-            )
-        )
-
-    return final_transcriptions
-
-
-def diarize_audio(audio_file_path: str) -> List[CallSegment]:
-    api_key = os.getenv("HUGGING_FACE_TOKEN")
-    if not api_key:
-        raise ValueError("Please set HUGGING_FACE_TOKEN environment variable")
-
-    pipeline = Pipeline.from_pretrained("pyannote/speaker-diarization-3.1", use_auth_token=api_key)
-    # pipeline = Pipeline.from_pretrained("pyannote/speaker-diarization", use_auth_token=api_key)
+    # Speakers are assigned per word by maximum overlap, segments are split where the speaker changes
+    return align_transcription(diarization, transcription)
+
+
+def diarize_audio(audio: AudioBuffer, return_embeddings: bool = False):
+    """
+    Args:
+        return_embeddings: Also return the embedding of each speaker label, used to recognize known agent voices
+    """
+    # Loaded once per process, only the first file pays for the model load
+    pipeline = get_diarization_pipeline()
 
     print("Performing speaker diarization...")
     start_time = time.time()
-    waveform, sample_rate = torchaudio.load(audio_file_path)
     with ProgressHook() as hook:
-        diarization = pipeline({"waveform": waveform, "sample_rate": sample_rate}, num_speakers=2, hook=hook)
+        output = pipeline(audio.as_pyannote_input(), num_speakers=NUM_SPEAKERS, hook=hook,
+                          return_embeddings=return_embeddings)
     end_time = time.time()
     print(f"--> ✨ Speaker diarization completed in {end_time - start_time:.2f} seconds")
-    
-    return diarization
 
+    if return_embeddings:
+        diarization, embeddings = output
+        return diarization, dict(zip(diarization.labels(), embeddings))
+    return output
 
-def determine_speakers(transcription: List[CallSegment], agent_task: str) -> Dict[str, EntitySpeaking]:
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise ValueError("Please set OPENAI_API_KEY environment variable")
 
-    provider = OpenAIProvider(api_key, "gpt-4o-mini")
-    system_prompt = f'''I'm building a voice agent that calls people and businesses on my behalf. Here's a call transcript. Your role is to determine who is SPEAKER_00 and who is SPEAKER_01 by looking at the task I gave my voice agent and the transcript.
-Return a json with the following format: {{"speaker_00": "callee" | "voice_agent", "speaker_01": "callee" | "voice_agent"}}
-Return None if you cannot determine who is speaking or if there are more than 2 speakers.
-DON'T RETURN ANYTHING ELSE BUT THE JSON. Format it correctly as I load it into a dictionary in python.
-    
-    # Task
-    {agent_task}'''
-    conversation_history = "\n".join([f"{segment.speaker}: {segment.text}" for segment in transcription])
-    messages = [{"role": "user", "content": conversation_history}]
-    response = provider.plain_call(system_prompt, messages)
-    try:
-        return json.loads(response.response_content)
-    except json.JSONDecodeError:
-        raise ValueError("Could not determine speakers - invalid JSON response")
-
-def transcribe_audio(audio_file_path: str, agent_task: str) -> List[CallSegment]:#
-    diarization = diarize_audio(audio_file_path)
-    if not diarization:
-        raise ValueError("No diarization results found")
-    model = stable_whisper.load_model('large-v3-turbo')
-    transcription = transcribe_prescise_timestamps(model, audio_file_path)
-    diarizated_call_segments = merge_diarization_and_transcription(diarization, transcription)
-    
-    speakers_mapping = determine_speakers(diarizated_call_segments, agent_task)
+def determine_speakers(transcription: List[CallSegment], agent_task: str, llm: Optional[LLMInterface] = None,
+                       speaker_embeddings: Optional[Dict[str, np.ndarray]] = None) -> Dict[str, str]:
+    """
+    Which diarized speaker is the voice agent and which is the callee, e.g. {"speaker_00": "voice_agent", ...}.
+    Resolved from the transcript and known agent voices when possible, the llm (gpt-4o-mini by default) is only
+    asked about the opening segments of calls that remain ambiguous.
+    """
+    return get_role_resolver().resolve(transcription, agent_task, llm, speaker_embeddings).mapping
 
-    # fix speaker names
-    for call_segment in diarizated_call_segments:
-        call_segment.speaker = EntitySpeaking(speakers_mapping.get(call_segment.speaker.lower(), "unknown"))
 
-    return diarizated_call_segments
-
-
-def transcribe_using_assemblyai(audio_file_path: str, agent_task: str) -> List[CallSegment]:
-    api_key = os.getenv("ASSEMBLYAI_API_KEY")
-    if not api_key:
-        raise ValueError("Please set ASSEMBLYAI_API_KEY environment variable")
-    import assemblyai as aai
-
-    aai.settings.api_key = api_key
-    transcriber = aai.Transcriber()
-    transcript = transcriber.transcribe(audio_file_path, 
-                                        config=aai.TranscriptionConfig(speaker_labels=True,
-                                                                       speakers_expected=2,
-                                                                       speech_model=aai.SpeechModel.nano,
-                                                                       disfluencies=True))
-
-    call_segments = []
-    for utt in transcript.utterances:
-        call_segments.append(CallSegment(
-            start_time=utt.start / 1000,  # Convert from ms to seconds
-            end_time=utt.end / 1000,
-            speaker=utt.speaker,
-            text=utt.text
-        ))
-    speakers_mapping = determine_speakers(call_segments, agent_task)
-
-    # fix speaker names
-    for call_segment in call_segments:
-        call_segment.speaker = EntitySpeaking(speakers_mapping[call_segment.speaker])
+async def determine_speakers_async(transcription: List[CallSegment], agent_task: str,
+                                   llm: Optional[Union[LLMInterface, AsyncLLMInterface]] = None,
+                                   speaker_embeddings: Optional[Dict[str, np.ndarray]] = None) -> Dict[str, str]:
+    """Same as determine_speakers without blocking the event loop, synchronous llms run in a thread"""
+    resolution = await get_role_resolver().resolve_async(transcription, agent_task, llm, speaker_embeddings)
+    return resolution.mapping
+
 
+def label_speakers(call_segments: List[CallSegment], speakers_mapping: Dict[str, str]) -> List[CallSegment]:
+    """Replace the diarization labels with the roles returned by determine_speakers"""
+    for call_segment in call_segments:
+        call_segment.speaker = EntitySpeaking(speakers_mapping.get(call_segment.speaker.lower(), "unknown"))
     return call_segments
 
-def analyze_audio(audio_file_path: str, agent_task: str, print_verbose: bool = False) -> SpeechTestResult:
-    call_segments = transcribe_audio(audio_file_path, agent_task)
-    interuptions = detect_interuptions(call_segments)
-    pauses = detect_pauses(call_segments)
+
+def diarize_and_transcribe(audio_file_path: str, artifact_cache: Optional[ArtifactCache] = None,
+                           transcriber: Optional[Transcriber] = None) -> List[CallSegment]:
+    """
+    Call segments labeled with the diarization speakers, e.g. SPEAKER_00.
+    Diarization and transcription are reused from the artifact cache when the same audio was processed before.
+
+    Args:
+        transcriber: ASR backend, configured from the ASR_* environment variables by default
+    """
+    return diarize_and_transcribe_with_embeddings(audio_file_path, artifact_cache, transcriber)[0]
+
+
+def diarize_and_transcribe_with_embeddings(audio_file_path: str, artifact_cache: Optional[ArtifactCache] = None,
+                                           transcriber: Optional[Transcriber] = None
+                                           ) -> Tuple[List[CallSegment], Optional[Dict[str, np.ndarray]], np.ndarray]:
+    """
+    Same as diarize_and_transcribe, with the speaker embeddings of the diarization if it produced any, and the
+    waveform speech frames turn-taking latency is measured on once the speaker roles are known
+    """
+    artifact_cache = artifact_cache or ArtifactCache()
+    transcriber = transcriber or create_transcriber()
+    config = artifact_config(transcriber)
+    artifacts = artifact_cache.load(audio_file_path, config)
+    if artifacts is None:
+        # Decoded once, diarization and transcription share the same 16kHz buffer
+        with load_audio(audio_file_path) as audio:
+            if transcriber.provides_speakers:
+                transcription = transcriber.transcribe_timed(audio).transcription
+                turns = SpeakerTurns.from_segments(transcription["segments"])
+                speaker_embeddings = None
+            else:
+                diarization, speaker_embeddings = diarize_audio(audio, return_embeddings=True)
+                if not diarization:
+                    raise ValueError("No diarization results found")
+                turns = SpeakerTurns.from_annotation(diarization)
+                transcription = transcriber.transcribe_timed(audio).transcription
+            is_speech = turn_taking_speech_frames(audio.samples, audio.sample_rate)
+        artifacts = artifact_cache.save(audio_file_path, config, turns, transcription, speaker_embeddings, is_speech)
+    else:
+        print(f"Loaded cached diarization and transcription of {os.path.basename(audio_file_path)}")
+        is_speech = artifacts.speech_frames
+        if is_speech is None:
+            # Cached before the speech frames were stored, the frame energies are cheap next to diarization
+            with load_audio(audio_file_path) as audio:
+                is_speech = turn_taking_speech_frames(audio.samples, audio.sample_rate)
+            artifact_cache.save_speech_frames(audio_file_path, config, is_speech)
+
+    call_segments = merge_diarization_and_transcription(artifacts.turns, artifacts.transcription)
+    return call_segments, artifacts.speaker_embeddings, is_speech
+
+
+def transcribe_audio(audio_file_path: str, agent_task: str, llm: Optional[LLMInterface] = None) -> List[CallSegment]:
+    diarizated_call_segments, speaker_embeddings, _ = diarize_and_transcribe_with_embeddings(audio_file_path)
+    speakers_mapping = determine_speakers(diarizated_call_segments, agent_task, llm, speaker_embeddings)
+    return label_speakers(diarizated_call_segments, speakers_mapping)
+
+
+def transcribe_using_assemblyai(audio_file_path: str, agent_task: str, llm: Optional[LLMInterface] = None,
+                                base_url: Optional[str] = None) -> List[CallSegment]:
+    transcriber = create_transcriber(TranscriberConfig(backend="assemblyai", base_url=base_url))
+    call_segments = diarize_and_transcribe(audio_file_path, transcriber=transcriber)
+    speakers_mapping = determine_speakers(call_segments, agent_task, llm)
+    return label_speakers(call_segments, speakers_mapping)
+
+def analyze_audio(audio_file_path: str, agent_task: str, print_verbose: bool = False,
+                  llm: Optional[LLMInterface] = None, stereo: bool = False,
+                  agent_channel: Optional[int] = None) -> SpeechTestResult:
+    """
+    Args:
+        stereo: The agent and callee are recorded on separate channels, skips diarization (see speech_testing.stereo)
+        agent_channel: Channel of the voice agent in a stereo recording, determined from the agent task if None
+    """
+    if stereo:
+        from speech_testing.stereo import analyze_stereo_audio
+        return analyze_stereo_audio(audio_file_path, agent_task, agent_channel, print_verbose, llm)
+    call_segments, speaker_embeddings, is_speech = diarize_and_transcribe_with_embeddings(audio_file_path)
+    speakers_mapping = determine_speakers(call_segments, agent_task, llm, speaker_embeddings)
+    return analyze_call_segments(label_speakers(call_segments, speakers_mapping), print_verbose,
+                                 speech_frames=is_speech)
+
+
+class WindowDiarizer:
+    """
+    Diarizes a recording window by window, for streaming transcription. pyannote's labels are arbitrary in every
+    window, so each window's speakers are matched to the speakers of the previous windows by their embeddings.
+    """
+    def __init__(self, num_speakers: int = NUM_SPEAKERS, same_speaker_similarity: float = SAME_SPEAKER_SIMILARITY):
+        self.num_speakers = num_speakers
+        self.same_speaker_similarity = same_speaker_similarity
+        self.pipeline = get_diarization_pipeline()
+        # Sum of the normalized embeddings of each speaker over the windows so far
+        self.centroids: Dict[str, np.ndarray] = {}
+
+    def __call__(self, window_start: float, samples: np.ndarray) -> SpeakerTurns:
+        # A window may hold a single speaker, so the speaker count is only an upper bound
+        diarization, embeddings = self.pipeline(AudioBuffer(samples).as_pyannote_input(), max_speakers=self.num_speakers,
+                                                return_embeddings=True)
+        labels = diarization.labels()
+        mapping = self._link(labels, embeddings[:len(labels)])
+        turns = SpeakerTurns.from_annotation(diarization)
+        return SpeakerTurns(turns.starts + window_start, turns.ends + window_start,
+                            np.asarray([mapping[label] for label in turns.speakers], dtype=object))
+
+    def _link(self, labels: List[str], embeddings: np.ndarray) -> Dict[str, str]:
+        """Speaker of the recording of each window label, most similar pairs first"""
+        embeddings = np.asarray(embeddings, dtype=float).reshape(len(labels), -1)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        # Speakers too short to be embedded come out as NaN, they can't match a known voice
+        is_valid = np.isfinite(norms[:, 0]) & (norms[:, 0] > 0)
+        embeddings = np.where(is_valid[:, None], embeddings / np.where(is_valid[:, None], norms, 1), 0.0)
+        known = list(self.centroids)
+        similarities = np.full((len(labels), len(known)), -np.inf)
+        if known:
+            centroids = np.stack([self.centroids[speaker] for speaker in known])
+            similarities[is_valid] = embeddings[is_valid] @ (centroids / np.linalg.norm(centroids, axis=1, keepdims=True)).T
+
+        mapping: Dict[str, str] = {}
+        for index in np.argsort(similarities, axis=None)[::-1].tolist():
+            label_index, known_index = divmod(index, len(known))
+            label, speaker = labels[label_index], known[known_index]
+            if similarities[label_index, known_index] < self.same_speaker_similarity:
+                break
+            if label not in mapping and speaker not in mapping.values():
+                mapping[label] = speaker
+        for label_index, label in enumerate(labels):
+            if label in mapping:
+                continue
+            if len(self.centroids) < self.num_speakers:
+                mapping[label] = f"SPEAKER_{len(self.centroids):02d}"
+                self.centroids[mapping[label]] = np.zeros(embeddings.shape[1])
+            else:
+                # Every speaker of the call is known, a dissimilar voice is still the closest one not in this window
+                candidates = [speaker for speaker in known if speaker not in mapping.values()] or known
+                mapping[label] = max(candidates, key=lambda speaker: similarities[label_index, known.index(speaker)])
+        for label_index, label in enumerate(labels):
+            if is_valid[label_index]:
+                self.centroids[mapping[label]] = self.centroids[mapping[label]] + embeddings[label_index]
+        return mapping
+
+
+def stream_call_segments(audio_file_path: str, agent_task: str, llm: Optional[LLMInterface] = None,
+                         transcriber=None) -> Iterator[CallSegment]:
+    """
+    Labeled call segments of a recording, yielded as the transcription progresses in overlapping windows. The
+    recording is decoded, diarized and transcribed one window at a time, so memory doesn't grow with its length.
+    Speaker roles are determined from the first ROLE_DETECTION_SEGMENTS segments, the rest are labeled as they come.
+    """
+    from speech_testing.data_types import WhisperModelSize
+    from speech_testing.transcribe import WhisperTranscriber
+
+    transcriber = transcriber or WhisperTranscriber(WhisperModelSize.LARGE_V3)
+    call_segments = transcriber.stream_transcription(audio_file_path, diarize_window=WindowDiarizer())
+    opening_segments = list(itertools.islice(call_segments, ROLE_DETECTION_SEGMENTS))
+    if not opening_segments:
+        return
+    speakers_mapping = determine_speakers(opening_segments, agent_task, llm)
+    for call_segment in itertools.chain(opening_segments, call_segments):
+        yield label_speakers([call_segment], speakers_mapping)[0]
+
+
+def analyze_audio_streaming(audio_file_path: str, agent_task: str, print_verbose: bool = False,
+                            llm: Optional[LLMInterface] = None, keep_segments: bool = False) -> SpeechTestResult:
+    """
+    Like analyze_audio with bounded memory, metrics are updated as segments are transcribed. The segments
+    themselves aren't kept in the result unless `keep_segments` is set.
+    """
+    return analyze_call_segments(stream_call_segments(audio_file_path, agent_task, llm), print_verbose,
+                                 keep_segments=keep_segments)
+
+
+def analyze_call_segments(call_segments: Iterable[CallSegment], print_verbose: bool = False,
+                          metrics: Optional[Iterable[Union[str, SpeechMetric]]] = None,
+                          keep_segments: bool = True, speech_frames: Optional[np.ndarray] = None) -> SpeechTestResult:
+    """
+    Segments may be a generator such as a streaming transcription, they are analyzed as they arrive.
+
+    Args:
+        metrics: Registered metric names or SpeechMetric instances, every metric of the registry by default
+        keep_segments: Keep the segments in the result, a streaming analysis of a long call may leave them out
+        speech_frames: Waveform speech frames of the recording from diarize_and_transcribe_with_embeddings, adds
+            the turn-taking latency, timed on the waveform rather than the segment boundaries
+    """
+    metric_pass = MetricPass(metrics)
+    analyzed_segments = []
+    for call_segment in call_segments:
+        metric_pass.update(call_segment)
+        if keep_segments:
+            analyzed_segments.append(call_segment)
+    table = metric_pass.builder.build()
+    metric_results = metric_pass.results(table)
+    turn_taking = None
+    if speech_frames is not None:
+        # The labeled segments only attribute the waveform's speech to the agent or the callee
+        turn_taking = attribute_turn_taking(speech_frames, *turns_from_call_segments(table))
+        metric_results.append(turn_taking.to_metric_result())
+    interuptions = metric_pass["interruptions"].interruptions if "interruptions" in metric_pass else []
+    pauses = metric_pass["pauses"].pauses if "pauses" in metric_pass else []
 
     if print_verbose:
         print(f"\n\n***** Detected {len(pauses)} long pauses (>{MIN_PAUSE_DURATION}s) after callee responses")
@@ -178,33 +294,34 @@ def analyze_audio(audio_file_path: str, agent_task: str, print_verbose: bool = F
         for interruption in interuptions:
             print(f"Interruption at {interruption.interrupted_at:.2f}s (duration: {interruption.interruption_duration:.2f}s) - {interruption.interrupted_speaker.value} interrupted {interruption.interrupted_speaker.value}")
             print(f"Transcription: {interruption.interruption_text}\n")
+
+        print("\n\n***** Metrics")
+        for metric_result in metric_results:
+            print(f"{metric_result.name}: {metric_result.eval_output} - {metric_result.reasoning.splitlines()[0]}")
             
 
-    # TODO SpeechTestResult abstract - should be a list of test_type and test_result, later interpreted by whoever consumes it
     return SpeechTestResult(
-        call_segments=call_segments,
+        call_segments=analyzed_segments,
         interruptions=interuptions,
         pauses=pauses,
+        metric_results=metric_results,
+        turn_taking=turn_taking,
     )
 
 
 
-def run_tests(audio_files_dir: str, agent_task: str) -> Dict[str, SpeechTestResult]:
-    # TODO Metrics should be intuerrptions, pauses, etc. Refactor accordingly
-    test_number = 1
-    tests_results = {}
-    for audio_file in os.listdir(audio_files_dir):
-        if not audio_file.startswith("11x_outbound"):
-            continue
-
-        print(f"\n\n=== Running speech test {test_number} of {len(os.listdir(audio_files_dir))} with [{audio_file}] ===")
-        test_result = analyze_audio(os.path.join(audio_files_dir, audio_file), agent_task)   
-        tests_results[audio_file] = test_result
-        test_number += 1
-
-        # TODO remove, just for faster debugging
-        break
+def run_tests(audio_files: str, agent_task: str, llm: Optional[Union[LLMInterface, AsyncLLMInterface]] = None,
+              max_workers: Optional[int] = None, threads_per_worker: int = 2, manifest_path: Optional[str] = None,
+              llm_concurrency: int = 4) -> Dict[str, SpeechTestResult]:
+    """
+    Analyze every recording of a directory or glob, see speech_testing.batch.run_batch for the arguments.
+    Recordings already in the results manifest are skipped, so an interrupted run resumes where it stopped.
+    """
+    from speech_testing.batch import run_batch
 
-    print(f"\n\n=== All speech tests completed: {test_number - 1} ===")
+    tests_results = run_batch(audio_files, agent_task, llm=llm, max_workers=max_workers,
+                              threads_per_worker=threads_per_worker, manifest_path=manifest_path,
+                              llm_concurrency=llm_concurrency)
+    print(f"\n\n=== All speech tests completed: {len(tests_results)} ===")
 
     return tests_results
@@ -0,0 +1,189 @@
+from array import array
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from core.data_types import EntitySpeaking
+from .data_types import CallSegment
+
+Speaker = Union[EntitySpeaking, str]
+
+
+@dataclass
+class SegmentTable:
+    """
+    Call segments as columns: start and end times, speaker codes into `speakers` and text offsets into one string.
+    Several calls can share a table, `call_offsets` delimits them, so metrics over a whole corpus are single NumPy
+    operations instead of Python loops over CallSegment objects.
+    """
+    starts: np.ndarray
+    ends: np.ndarray
+    speaker_codes: np.ndarray
+    speakers: Tuple[Speaker, ...]
+    text: str
+    text_offsets: np.ndarray
+    # Segments of call i are call_offsets[i]:call_offsets[i + 1]
+    call_offsets: Optional[np.ndarray] = None
+
+    def __post_init__(self):
+        if self.call_offsets is None:
+            self.call_offsets = np.asarray([0, len(self.starts)], dtype=np.int64)
+
+    @classmethod
+    def from_segments(cls, call_segments: Iterable[CallSegment]) -> "SegmentTable":
+        call_segments = list(call_segments)
+        codes: Dict[Speaker, int] = {}
+        speaker_codes = np.fromiter((codes.setdefault(segment.speaker, len(codes)) for segment in call_segments),
+                                    dtype=np.int32, count=len(call_segments))
+        texts = [segment.text for segment in call_segments]
+        text_offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter(map(len, texts), dtype=np.int64, count=len(texts)), out=text_offsets[1:])
+        return cls(starts=np.fromiter((segment.start_time for segment in call_segments), dtype=float, count=len(call_segments)),
+                   ends=np.fromiter((segment.end_time for segment in call_segments), dtype=float, count=len(call_segments)),
+                   speaker_codes=speaker_codes, speakers=tuple(codes), text="".join(texts), text_offsets=text_offsets)
+
+    @classmethod
+    def concatenate(cls, tables: Sequence["SegmentTable"]) -> "SegmentTable":
+        """One table of several calls, speaker codes are remapped to the union of their speakers"""
+        codes: Dict[Speaker, int] = {}
+        speaker_codes, text_offsets, call_offsets = [], [np.zeros(1, dtype=np.int64)], [np.zeros(1, dtype=np.int64)]
+        segment_count = text_length = 0
+        for table in tables:
+            remap = np.asarray([codes.setdefault(speaker, len(codes)) for speaker in table.speakers], dtype=np.int32)
+            speaker_codes.append(remap[table.speaker_codes] if len(remap) else table.speaker_codes)
+            text_offsets.append(table.text_offsets[1:] + text_length)
+            call_offsets.append(table.call_offsets[1:] + segment_count)
+            segment_count += len(table)
+            text_length += len(table.text)
+        return cls(starts=np.concatenate([table.starts for table in tables] or [np.empty(0)]),
+                   ends=np.concatenate([table.ends for table in tables] or [np.empty(0)]),
+                   speaker_codes=np.concatenate(speaker_codes or [np.empty(0, dtype=np.int32)]),
+                   speakers=tuple(codes), text="".join(table.text for table in tables),
+                   text_offsets=np.concatenate(text_offsets), call_offsets=np.concatenate(call_offsets))
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    @property
+    def call_count(self) -> int:
+        return len(self.call_offsets) - 1
+
+    @property
+    def durations(self) -> np.ndarray:
+        return self.ends - self.starts
+
+    def text_at(self, index: int) -> str:
+        return self.text[self.text_offsets[index]:self.text_offsets[index + 1]]
+
+    def speaker_at(self, index: int) -> Speaker:
+        return self.speakers[self.speaker_codes[index]]
+
+    def code_of(self, speaker: Speaker) -> int:
+        """Code of a speaker, -1 when it never speaks so comparisons match no segment"""
+        try:
+            return self.speakers.index(speaker)
+        except ValueError:
+            return -1
+
+    def to_segments(self) -> List[CallSegment]:
+        texts = [self.text[start:end] for start, end in zip(self.text_offsets[:-1].tolist(), self.text_offsets[1:].tolist())]
+        speakers = [self.speakers[code] for code in self.speaker_codes.tolist()]
+        return [CallSegment(start_time=start, end_time=end, speaker=speaker, text=text)
+                for start, end, speaker, text in zip(self.starts.tolist(), self.ends.tolist(), speakers, texts)]
+
+    def call(self, index: int) -> "SegmentTable":
+        """Table of a single call, the columns are views of this table's"""
+        first, last = self.call_offsets[index], self.call_offsets[index + 1]
+        text_offsets = self.text_offsets[first:last + 1]
+        return SegmentTable(self.starts[first:last], self.ends[first:last], self.speaker_codes[first:last], self.speakers,
+                            self.text[text_offsets[0]:text_offsets[-1]], text_offsets - text_offsets[0])
+
+    def call_ids(self) -> np.ndarray:
+        """Index of the call of every segment"""
+        return np.repeat(np.arange(self.call_count), np.diff(self.call_offsets))
+
+    def is_call_start(self) -> np.ndarray:
+        """Segments without a previous segment in the same call"""
+        is_start = np.zeros(len(self), dtype=bool)
+        is_start[self.call_offsets[:-1][np.diff(self.call_offsets) > 0]] = True
+        return is_start
+
+    def previous_codes(self) -> np.ndarray:
+        """Speaker code of the previous segment of the same call, -1 for the first segment of a call"""
+        previous = np.empty(len(self), dtype=self.speaker_codes.dtype)
+        previous[1:] = self.speaker_codes[:-1]
+        previous[self.is_call_start()] = -1
+        return previous
+
+    def gaps(self) -> np.ndarray:
+        """Time from each segment's end to the next segment's start in the same call, NaN after the last segment.
+        Negative gaps are overlaps."""
+        gaps = np.full(len(self), np.nan)
+        gaps[:-1] = self.starts[1:] - self.ends[:-1]
+        gaps[self.call_offsets[1:][np.diff(self.call_offsets) > 0] - 1] = np.nan
+        return gaps
+
+    def overlaps(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Indexes of the segments starting before the previous segment of another speaker ends, and by how much"""
+        previous = self.previous_codes()
+        # The first segment of a call has no previous code, so indexes - 1 stays within the call
+        indexes = np.flatnonzero((previous >= 0) & (previous != self.speaker_codes))
+        indexes = indexes[self.starts[indexes] < self.ends[indexes - 1]]
+        return indexes, np.minimum(self.ends[indexes], self.ends[indexes - 1]) - self.starts[indexes]
+
+    def talk_time(self) -> np.ndarray:
+        """(calls, speakers) seconds each speaker talks in each call, columns follow `speakers`"""
+        weights = np.bincount(self.call_ids() * len(self.speakers) + self.speaker_codes, weights=self.durations,
+                              minlength=self.call_count * len(self.speakers))
+        return weights.reshape(self.call_count, len(self.speakers))
+
+    def word_counts(self) -> np.ndarray:
+        """Whitespace-separated words of every segment, counted on the shared text buffer"""
+        if not self.text:
+            return np.zeros(len(self), dtype=np.int64)
+        # UTF-32 gives one code point per character, so the text offsets index it directly
+        characters = np.frombuffer(self.text.encode("utf-32-le"), dtype=np.uint32)
+        is_space = np.isin(characters, np.frombuffer(" \t\n\r\f\v".encode("utf-32-le"), dtype=np.uint32))
+        is_word_start = ~is_space
+        is_word_start[1:] &= is_space[:-1]
+        # A word starts at every segment's first character, even if the previous segment's text didn't end in a space
+        segment_starts = self.text_offsets[:-1][np.diff(self.text_offsets) > 0]
+        is_word_start[segment_starts] = ~is_space[segment_starts]
+        return np.diff(np.concatenate(([0], np.cumsum(is_word_start)))[self.text_offsets])
+
+    def split_by_call(self, indexes: np.ndarray, items: List[Any]) -> List[List[Any]]:
+        """Group items found at sorted segment indexes by call"""
+        counts = np.bincount(np.searchsorted(self.call_offsets, indexes, side="right") - 1, minlength=self.call_count)
+        bounds = np.concatenate(([0], np.cumsum(counts))).tolist()
+        return [items[bounds[call]:bounds[call + 1]] for call in range(self.call_count)]
+
+
+class SegmentTableBuilder:
+    """Appends segments to compact columns as they arrive, e.g. from a streaming transcription"""
+    def __init__(self):
+        self._starts = array("d")
+        self._ends = array("d")
+        self._speaker_codes = array("i")
+        self._codes: Dict[Speaker, int] = {}
+        self._texts: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def append(self, segment: CallSegment):
+        self._starts.append(segment.start_time)
+        self._ends.append(segment.end_time)
+        self._speaker_codes.append(self._codes.setdefault(segment.speaker, len(self._codes)))
+        self._texts.append(segment.text)
+
+    def build(self) -> SegmentTable:
+        text_offsets = np.zeros(len(self._texts) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter(map(len, self._texts), dtype=np.int64, count=len(self._texts)), out=text_offsets[1:])
+        return SegmentTable(starts=np.array(self._starts, dtype=float), ends=np.array(self._ends, dtype=float),
+                            speaker_codes=np.array(self._speaker_codes, dtype=np.int32), speakers=tuple(self._codes),
+                            text="".join(self._texts), text_offsets=text_offsets)
+
+
+def as_segment_table(call_segments: Union[Iterable[CallSegment], SegmentTable]) -> SegmentTable:
+    return call_segments if isinstance(call_segments, SegmentTable) else SegmentTable.from_segments(call_segments)
@@ -0,0 +1,264 @@
+import asyncio
+import math
+import os
+import re
+import tempfile
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+from pydantic import BaseModel
+
+from core.data_types import EntitySpeaking
+from core.interfaces import AsyncLLMInterface, LLMInterface
+from .data_types import CallSegment
+
+DEFAULT_VOICEPRINTS_PATH = ".cache/agent_voiceprints.npz"
+# Roles resolved locally below this confidence fall back to the LLM
+MIN_CONFIDENCE = 0.9
+# Cosine similarity of a diarized speaker's embedding to a known agent voice to be taken as the agent
+VOICEPRINT_SIMILARITY = 0.75
+MAX_VOICEPRINTS = 500
+# Opening segments sent to the LLM, the roles are clear from the first exchanges
+LLM_SEGMENTS = 12
+# Segments searched for introductions, greetings and the purpose of the call
+OPENING_SEGMENTS = 6
+
+# Evidence, in log-odds, that a speaker is the voice agent
+INTRODUCTION_EVIDENCE = 3.0
+CALLING_EVIDENCE = 2.0
+ANSWERING_EVIDENCE = 2.0
+TASK_VOCABULARY_EVIDENCE = 1.0
+SPEAKS_SECOND_EVIDENCE = 0.5
+STEADY_RATE_EVIDENCE = 0.5
+
+CALLING_PATTERN = re.compile(r"\b(i'm|i am|we're|we are) calling\b|\bcalling (about|to|regarding|on behalf)\b|"
+                             r"\bon behalf of\b|\bi'?m reaching out\b", re.IGNORECASE)
+ANSWERING_PATTERN = re.compile(r"^\W*(hello|hi|hey|yes|yeah|good (morning|afternoon|evening))\W*$|\bspeaking\b|"
+                               r"\bhow (can|may) i help\b|\bthank you for calling\b", re.IGNORECASE)
+AGENT_NAME_PATTERN = re.compile(r"\b(?:called|named|name is|you are|you're|as)\s+([A-Z][a-z]+)\b")
+WORD_PATTERN = re.compile(r"[a-z']{4,}")
+STOPWORDS = {"that", "this", "with", "have", "from", "they", "your", "will", "would", "there", "their", "about",
+             "what", "when", "which", "were", "been", "just", "like", "know", "yeah", "okay", "right", "call", "calling"}
+
+
+class SpeakerRoles(BaseModel):
+    speaker_00: EntitySpeaking
+    speaker_01: EntitySpeaking
+
+
+@dataclass
+class RoleResolution:
+    """Roles keyed by lowercase diarization label, e.g. {"speaker_00": "voice_agent", "speaker_01": "callee"}"""
+    mapping: Dict[str, str]
+    confidence: float
+    method: str  # heuristics, voiceprint or llm
+
+
+def extract_agent_names(agent_task: str) -> List[str]:
+    """Names the task gives the voice agent, e.g. Jordan in "a voice agent called Jordan\""""
+    return AGENT_NAME_PATTERN.findall(agent_task or "")
+
+
+def _content_words(text: str) -> set:
+    return {word for word in WORD_PATTERN.findall(text.lower()) if word not in STOPWORDS}
+
+
+def _speaking_rate_variation(segments: List[CallSegment]) -> Optional[float]:
+    """Coefficient of variation of the words per second across segments, text-to-speech voices are steadier"""
+    rates = [len(segment.text.split()) / (segment.end_time - segment.start_time) for segment in segments
+             if segment.end_time - segment.start_time > 0.5 and len(segment.text.split()) >= 3]
+    if len(rates) < 3:
+        return None
+    return float(np.std(rates) / np.mean(rates))
+
+
+def heuristic_agent_scores(call_segments: List[CallSegment], agent_task: str) -> Dict[str, float]:
+    """Log-odds evidence that each diarized speaker is the voice agent, from introductions, greetings and wording"""
+    speakers = list(dict.fromkeys(segment.speaker for segment in call_segments))
+    scores = {speaker: 0.0 for speaker in speakers}
+    by_speaker = {speaker: [segment for segment in call_segments if segment.speaker == speaker] for speaker in speakers}
+    names = extract_agent_names(agent_task)
+    introduction = re.compile(rf"\b(this is|i'm|i am|my name is|it's)\s+({'|'.join(map(re.escape, names))})\b",
+                              re.IGNORECASE) if names else None
+    task_words = _content_words(agent_task or "")
+    variations = {speaker: _speaking_rate_variation(segments) for speaker, segments in by_speaker.items()}
+    known_variations = [variation for variation in variations.values() if variation is not None]
+
+    for speaker, segments in by_speaker.items():
+        opening = " ".join(segment.text for segment in segments[:OPENING_SEGMENTS])
+        if introduction and introduction.search(opening):
+            scores[speaker] += INTRODUCTION_EVIDENCE
+        if CALLING_PATTERN.search(opening):
+            scores[speaker] += CALLING_EVIDENCE
+        if segments and ANSWERING_PATTERN.search(segments[0].text):
+            scores[speaker] -= ANSWERING_EVIDENCE
+        if task_words:
+            overlap = len(task_words & _content_words(" ".join(segment.text for segment in segments))) / len(task_words)
+            scores[speaker] += TASK_VOCABULARY_EVIDENCE * overlap
+        if len(known_variations) > 1 and variations[speaker] is not None:
+            scores[speaker] += STEADY_RATE_EVIDENCE if variations[speaker] == min(known_variations) else 0.0
+
+    # The voice agent places the call, so the callee usually answers first
+    if len(speakers) > 1:
+        scores[speakers[1]] += SPEAKS_SECOND_EVIDENCE
+    return scores
+
+
+def _agent_mapping(speakers: List[str], agent: str) -> Dict[str, str]:
+    return {speaker.lower(): (EntitySpeaking.VOICE_AGENT if speaker == agent else EntitySpeaking.CALLEE).value
+            for speaker in speakers}
+
+
+def _normalize(embeddings: np.ndarray) -> np.ndarray:
+    return embeddings / np.maximum(np.linalg.norm(embeddings, axis=-1, keepdims=True), 1e-12)
+
+
+class VoiceprintStore:
+    """
+    Speaker embeddings of voice agents identified in earlier calls, persisted across runs. Agents use the same few
+    voices, so a diarized speaker close to a known agent voice is the agent without looking at the transcript.
+    """
+    def __init__(self, path: str = DEFAULT_VOICEPRINTS_PATH, max_voiceprints: int = MAX_VOICEPRINTS):
+        self.path = path
+        self.max_voiceprints = max_voiceprints
+        self._lock = threading.Lock()
+        self.embeddings: Optional[np.ndarray] = None
+        if os.path.exists(path):
+            with np.load(path, allow_pickle=False) as data:
+                self.embeddings = data["embeddings"]
+
+    def __len__(self) -> int:
+        return 0 if self.embeddings is None else len(self.embeddings)
+
+    def similarity(self, embedding: np.ndarray) -> float:
+        """Cosine similarity to the closest known agent voice"""
+        with self._lock:
+            if self.embeddings is None or np.isnan(embedding).any():
+                return 0.0
+            return float((self.embeddings @ _normalize(np.asarray(embedding, dtype=np.float32))).max())
+
+    def add(self, embedding: np.ndarray):
+        if np.isnan(embedding).any():
+            return
+        with self._lock:
+            embedding = _normalize(np.asarray(embedding, dtype=np.float32))[np.newaxis]
+            embeddings = embedding if self.embeddings is None else np.concatenate((self.embeddings, embedding))
+            # The oldest voiceprints go first
+            self.embeddings = embeddings[-self.max_voiceprints:]
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=os.path.dirname(self.path) or ".", suffix=".npz", delete=False) as file:
+                np.savez(file, embeddings=self.embeddings)
+            os.replace(file.name, self.path)
+
+
+class SpeakerRoleResolver:
+    """
+    Decides which diarized speaker is the voice agent in layers, from cheapest to most expensive:
+    transcript heuristics, then known agent voiceprints, then an LLM on the opening segments only.
+    """
+    def __init__(self, voiceprints: Optional[VoiceprintStore] = None, min_confidence: float = MIN_CONFIDENCE,
+                 llm_segments: int = LLM_SEGMENTS):
+        self.voiceprints = voiceprints
+        self.min_confidence = min_confidence
+        self.llm_segments = llm_segments
+        self.resolutions = Counter()
+        # gpt-4o-mini providers, only created once a call needs the LLM
+        self._default_llms: Dict[bool, Union[LLMInterface, AsyncLLMInterface]] = {}
+
+    def resolve_locally(self, call_segments: List[CallSegment], agent_task: str,
+                        speaker_embeddings: Optional[Dict[str, np.ndarray]] = None) -> Optional[RoleResolution]:
+        """Roles from heuristics or voiceprints, None when neither is confident enough"""
+        speakers = list(dict.fromkeys(segment.speaker for segment in call_segments))
+        if len(speakers) != 2:
+            return None
+
+        scores = heuristic_agent_scores(call_segments, agent_task)
+        agent = max(speakers, key=scores.get)
+        margin = abs(scores[speakers[0]] - scores[speakers[1]])
+        confidence = 1 / (1 + math.exp(-margin))
+        if confidence >= self.min_confidence:
+            return RoleResolution(_agent_mapping(speakers, agent), confidence, "heuristics")
+
+        if self.voiceprints is not None and speaker_embeddings and len(self.voiceprints):
+            similarities = {speaker: self.voiceprints.similarity(speaker_embeddings[speaker])
+                            for speaker in speakers if speaker in speaker_embeddings}
+            matches = [speaker for speaker, similarity in similarities.items() if similarity >= VOICEPRINT_SIMILARITY]
+            if len(matches) == 1:
+                return RoleResolution(_agent_mapping(speakers, matches[0]), similarities[matches[0]], "voiceprint")
+        return None
+
+    def _create_llm_messages(self, call_segments: List[CallSegment], agent_task: str) -> List[Dict[str, str]]:
+        system_prompt = f'''I'm building a voice agent that calls people and businesses on my behalf. Here's the beginning of a call transcript. Determine who is SPEAKER_00 and who is SPEAKER_01 by looking at the task I gave my voice agent and the transcript. Use "unknown" for a speaker you cannot determine.
+
+    # Task
+    {agent_task}'''
+        conversation_history = "\n".join(f"{segment.speaker}: {segment.text}" for segment in call_segments[:self.llm_segments])
+        return [{"role": "system", "content": system_prompt}, {"role": "user", "content": conversation_history}]
+
+    def _finish(self, resolution: RoleResolution, speaker_embeddings: Optional[Dict[str, np.ndarray]]) -> RoleResolution:
+        self.resolutions[resolution.method] += 1
+        # Only agent voices confidently confirmed by the transcript teach the voiceprint layer for later calls, a
+        # wrong LLM answer would otherwise store a callee's voice as an agent voiceprint for good
+        if (self.voiceprints is not None and speaker_embeddings and resolution.method != "voiceprint"
+                and resolution.confidence >= self.min_confidence):
+            agents = [speaker for speaker, role in resolution.mapping.items() if role == EntitySpeaking.VOICE_AGENT.value]
+            embeddings = {speaker.lower(): embedding for speaker, embedding in speaker_embeddings.items()}
+            if len(agents) == 1 and agents[0] in embeddings:
+                self.voiceprints.add(embeddings[agents[0]])
+        return resolution
+
+    @staticmethod
+    def _from_llm(roles: SpeakerRoles) -> RoleResolution:
+        return RoleResolution({"speaker_00": roles.speaker_00.value, "speaker_01": roles.speaker_01.value}, 0.0, "llm")
+
+    def resolve(self, call_segments: List[CallSegment], agent_task: str, llm: Optional[LLMInterface] = None,
+                speaker_embeddings: Optional[Dict[str, np.ndarray]] = None) -> RoleResolution:
+        resolution = self.resolve_locally(call_segments, agent_task, speaker_embeddings)
+        if resolution is None:
+            llm = llm or self._default_llm(asynchronous=False)
+            roles = llm.generate_response_with_structured_output(self._create_llm_messages(call_segments, agent_task),
+                                                                 SpeakerRoles)
+            resolution = self._from_llm(roles)
+        return self._finish(resolution, speaker_embeddings)
+
+    async def resolve_async(self, call_segments: List[CallSegment], agent_task: str,
+                            llm: Optional[Union[LLMInterface, AsyncLLMInterface]] = None,
+                            speaker_embeddings: Optional[Dict[str, np.ndarray]] = None) -> RoleResolution:
+        """Same as resolve without blocking the event loop, synchronous llms run in a thread"""
+        resolution = self.resolve_locally(call_segments, agent_task, speaker_embeddings)
+        if resolution is None:
+            llm = llm or self._default_llm(asynchronous=True)
+            messages = self._create_llm_messages(call_segments, agent_task)
+            if isinstance(llm, AsyncLLMInterface):
+                roles = await llm.generate_response_with_structured_output(messages, SpeakerRoles)
+            else:
+                roles = await asyncio.to_thread(llm.generate_response_with_structured_output, messages, SpeakerRoles)
+            resolution = self._from_llm(roles)
+        return self._finish(resolution, speaker_embeddings)
+
+    def _default_llm(self, asynchronous: bool) -> Union[LLMInterface, AsyncLLMInterface]:
+        if asynchronous not in self._default_llms:
+            api_key = os.getenv("OPENAI_API_KEY")
+            if not api_key:
+                raise ValueError("Please set OPENAI_API_KEY environment variable")
+            from core.providers.openai import AsyncOpenAIProvider, OpenAIProvider
+            provider = AsyncOpenAIProvider if asynchronous else OpenAIProvider
+            self._default_llms[asynchronous] = provider(api_key, "gpt-4o-mini")
+        return self._default_llms[asynchronous]
+
+
+_shared_resolver: Optional[SpeakerRoleResolver] = None
+_shared_resolver_lock = threading.Lock()
+
+
+def get_role_resolver() -> SpeakerRoleResolver:
+    """Process-wide resolver learning agent voiceprints in DEFAULT_VOICEPRINTS_PATH"""
+    global _shared_resolver
+    with _shared_resolver_lock:
+        if _shared_resolver is None:
+            _shared_resolver = SpeakerRoleResolver(VoiceprintStore())
+        return _shared_resolver
@@ -0,0 +1,117 @@
+import io
+import json
+import threading
+import uuid
+import wave
+from typing import Any, Callable, Dict, List, Optional
+
+from core.stand_in_server import StandInRequestHandler, StandInServer
+
+UTTERANCE_SEC = 5.0
+WORDS_PER_UTTERANCE = 8
+
+
+def _audio_duration(audio: bytes) -> float:
+    """Duration of an uploaded WAV, 0 for audio in other formats"""
+    try:
+        with wave.open(io.BytesIO(audio), "rb") as wav:
+            return wav.getnframes() / wav.getframerate()
+    except (wave.Error, EOFError):
+        return 0.0
+
+
+def alternating_utterances(duration_sec: float) -> List[Dict[str, Any]]:
+    """Speakers A and B taking turns every UTTERANCE_SEC seconds, with evenly spaced words"""
+    utterances = []
+    start = 0.0
+    while start < duration_sec:
+        end = min(start + UTTERANCE_SEC, duration_sec)
+        speaker = "AB"[len(utterances) % 2]
+        word_sec = (end - start) / WORDS_PER_UTTERANCE
+        words = [{"text": f"word{index}", "start": int((start + index * word_sec) * 1000),
+                  "end": int((start + (index + 0.8) * word_sec) * 1000), "confidence": 0.9, "speaker": speaker}
+                 for index in range(WORDS_PER_UTTERANCE)]
+        utterances.append({"text": " ".join(word["text"] for word in words), "start": words[0]["start"],
+                           "end": words[-1]["end"], "confidence": 0.9, "speaker": speaker, "words": words})
+        start = end
+    return utterances
+
+
+class _AssemblyAIHandler(StandInRequestHandler):
+    def _read_body(self) -> bytes:
+        if self.headers.get("Transfer-Encoding", "").lower() != "chunked":
+            return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        chunks = []
+        while size := int(self.rfile.readline().strip(), 16):
+            chunks.append(self.rfile.read(size))
+            self.rfile.readline()
+        self.rfile.readline()
+        return b"".join(chunks)
+
+    def do_POST(self):
+        server = self.stand_in
+        body = self._read_body()
+        if self.path == "/v2/upload":
+            upload_id = uuid.uuid4().hex
+            with server._lock:
+                server._uploads[upload_id] = body
+            self.send_json(200, {"upload_url": f"{server.base_url}/v2/uploads/{upload_id}"})
+        elif self.path == "/v2/transcript":
+            self.send_json(200, server._create_transcript(json.loads(body or b"{}")))
+        else:
+            self.send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_GET(self):
+        server = self.stand_in
+        transcript_id = self.path.removeprefix("/v2/transcript/")
+        with server._lock:
+            transcript = server._transcripts.get(transcript_id)
+        if transcript is None:
+            self.send_json(404, {"error": f"Unknown transcript {transcript_id}"})
+        else:
+            self.send_json(200, transcript)
+
+
+class StandInAssemblyAIServer(StandInServer):
+    """
+    Local endpoint for the upload and transcript routes of the AssemblyAI API, so the AssemblyAI transcriber can run
+    offline, e.g.
+
+        with StandInAssemblyAIServer() as server:
+            transcriber = create_transcriber(TranscriberConfig(backend="assemblyai", base_url=server.base_url))
+    """
+    handler_class = _AssemblyAIHandler
+
+    def __init__(self, responder: Optional[Callable[[float], List[Dict[str, Any]]]] = None, port: int = 0):
+        """
+        Args:
+            responder: Returns the utterances, in AssemblyAI's format, of an upload of the given duration in seconds.
+                Speakers alternate every few seconds by default.
+        """
+        self.responder = responder or alternating_utterances
+        self.transcripts_created = 0
+        self._uploads: Dict[str, bytes] = {}
+        self._transcripts: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        super().__init__(port)
+
+    def _create_transcript(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Transcripts complete immediately, so clients polling for them get the result on the first poll"""
+        upload_id = request.get("audio_url", "").rsplit("/", 1)[-1]
+        with self._lock:
+            audio = self._uploads.pop(upload_id, None)
+            self.transcripts_created += 1
+        if audio is None:
+            transcript = {"id": uuid.uuid4().hex, "status": "error", "audio_url": request.get("audio_url", ""),
+                          "error": "Unknown upload, only audio uploaded to the stand-in server can be transcribed"}
+        else:
+            duration = _audio_duration(audio)
+            utterances = self.responder(duration)
+            words = [word for utterance in utterances for word in utterance["words"]]
+            transcript = {"id": uuid.uuid4().hex, "status": "completed", "audio_url": request["audio_url"],
+                          "speaker_labels": request.get("speaker_labels"), "audio_duration": int(duration),
+                          "text": " ".join(utterance["text"] for utterance in utterances),
+                          "utterances": utterances, "words": words, "confidence": 0.9}
+        with self._lock:
+            self._transcripts[transcript["id"]] = transcript
+        return transcript
@@ -0,0 +1,127 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from core.data_types import EntitySpeaking
+from core.interfaces import LLMInterface
+from .audio import AudioBuffer, load_channels, probe_channels
+from .data_types import CallSegment, InterruptionData, SpeechTestResult
+from .metrics.registry import DEFAULT_METRICS, MetricPass, interruptions_result
+from .metrics.turn_taking import measure_channel_turn_taking
+from .metrics.vad import find_overlaps, merge_close_segments
+from .segment_table import SegmentTable
+from .transcribers import Transcriber, create_transcriber
+
+# Words of the same channel closer than this are one stretch of speech
+SPEECH_MERGE_GAP_SEC = 0.3
+# Overlaps shorter than this are word boundary jitter or backchannels, not interruptions
+MIN_INTERRUPTION_SEC = 0.3
+# Overlaps closer than this are the same interruption
+INTERRUPTION_MERGE_GAP_SEC = 1.0
+
+
+def is_stereo(audio_file_path: str) -> bool:
+    return probe_channels(audio_file_path) == 2
+
+
+def speech_intervals(transcription: Dict[str, Any], max_gap: float = SPEECH_MERGE_GAP_SEC) -> Tuple[np.ndarray, np.ndarray]:
+    """Speech activity of a channel from the word timestamps of its transcription"""
+    words = [word for segment in transcription["segments"] for word in segment.get("words") or []]
+    starts = np.asarray([word["start"] for word in words], dtype=float)
+    ends = np.asarray([word["end"] for word in words], dtype=float)
+    order = np.argsort(starts, kind="stable")
+    return merge_close_segments(starts[order], ends[order], max_gap)
+
+
+def _channel_call_segments(transcription: Dict[str, Any], speaker) -> List[CallSegment]:
+    return [CallSegment(start_time=segment["start"], end_time=segment["end"], speaker=speaker, text=segment["text"])
+            for segment in transcription["segments"]]
+
+
+def detect_channel_interruptions(transcriptions: List[Dict[str, Any]], speakers: List[EntitySpeaking],
+                                 call_segments: List[CallSegment]) -> List[InterruptionData]:
+    """Interruptions are where both channels speak at once, attributed to the channel that started last"""
+    starts, ends, interrupters = find_overlaps(speech_intervals(transcriptions[0]), speech_intervals(transcriptions[1]))
+    interruptions = []
+    # Close overlaps of the same interrupter are one interruption
+    for interrupter in (0, 1):
+        is_interrupter = interrupters == interrupter
+        merged_starts, merged_ends = merge_close_segments(starts[is_interrupter], ends[is_interrupter],
+                                                           INTERRUPTION_MERGE_GAP_SEC)
+        for start, end in zip(merged_starts, merged_ends):
+            if end - start < MIN_INTERRUPTION_SEC:
+                continue
+            text = " ".join(segment.text.strip() for segment in call_segments
+                            if segment.speaker == speakers[interrupter] and segment.start_time < end
+                            and segment.end_time > start)
+            interruptions.append(InterruptionData(
+                interrupted_speaker=speakers[1 - interrupter],
+                interrupted_at=float(start),
+                interruption_duration=float(end - start),
+                interruption_text=text,
+            ))
+    return sorted(interruptions, key=lambda interruption: interruption.interrupted_at)
+
+
+def transcribe_channels(channels: List[AudioBuffer], transcriber: Transcriber,
+                        parallel: bool = True) -> List[Dict[str, Any]]:
+    """Transcribe each channel on its own, in parallel threads since inference releases the GIL"""
+    if not parallel:
+        return [transcriber.transcribe_timed(channel).transcription for channel in channels]
+    with ThreadPoolExecutor(max_workers=len(channels)) as executor:
+        return [result.transcription for result in executor.map(transcriber.transcribe_timed, channels)]
+
+
+def analyze_stereo_audio(audio_file_path: str, agent_task: Optional[str] = None, agent_channel: Optional[int] = 0,
+                         print_verbose: bool = False, llm: Optional[LLMInterface] = None,
+                         transcriber: Optional[Transcriber] = None, parallel: bool = True) -> SpeechTestResult:
+    """
+    Analyze a call recorded with the agent and the callee on separate channels. Each channel is transcribed on its
+    own, speakers come from the channel instead of diarization and interruptions from where the channels overlap.
+
+    Args:
+        agent_channel: Channel of the voice agent, None to have determine_speakers find it from the agent task
+        parallel: Transcribe both channels at once
+    """
+    transcriber = transcriber or create_transcriber()
+    channels = load_channels(audio_file_path)
+    transcriptions = transcribe_channels(channels, transcriber, parallel)
+
+    if agent_channel is None:
+        from .run_tests import determine_speakers
+        labeled = [segment for channel, transcription in enumerate(transcriptions)
+                   for segment in _channel_call_segments(transcription, f"SPEAKER_0{channel}")]
+        speakers_mapping = determine_speakers(sorted(labeled, key=lambda segment: segment.start_time), agent_task, llm)
+        speakers = [EntitySpeaking(speakers_mapping.get(f"speaker_0{channel}", "unknown")) for channel in (0, 1)]
+    else:
+        speakers = [EntitySpeaking.CALLEE, EntitySpeaking.CALLEE]
+        speakers[agent_channel] = EntitySpeaking.VOICE_AGENT
+
+    # Each channel has a single speaker, so the waveform alone times the turn transitions
+    agent_index = speakers.index(EntitySpeaking.VOICE_AGENT) if EntitySpeaking.VOICE_AGENT in speakers else 0
+    turn_taking = measure_channel_turn_taking(channels[agent_index].samples, channels[1 - agent_index].samples,
+                                              channels[agent_index].sample_rate)
+    # The decoded channels aren't needed past here, release them before the analysis
+    del channels
+
+    call_segments = sorted((segment for channel, transcription in enumerate(transcriptions)
+                            for segment in _channel_call_segments(transcription, speakers[channel])),
+                           key=lambda segment: segment.start_time)
+    interruptions = detect_channel_interruptions(transcriptions, speakers, call_segments)
+    # Interruptions come from the channel overlaps instead of the segments
+    metric_pass = MetricPass(name for name in DEFAULT_METRICS if name != "interruptions")
+    metric_results = metric_pass.results(SegmentTable.from_segments(call_segments))
+    pauses = metric_pass["pauses"].pauses
+
+    if print_verbose:
+        print(f"\n\n***** Detected {len(pauses)} long pauses after callee responses")
+        print(f"***** Channel overlaps: {len(interruptions)}")
+        for interruption in interruptions:
+            print(f"Interruption at {interruption.interrupted_at:.2f}s (duration: {interruption.interruption_duration:.2f}s) - "
+                  f"{interruption.interrupted_speaker.value} was interrupted: {interruption.interruption_text}")
+
+    return SpeechTestResult(call_segments=call_segments, interruptions=interruptions, pauses=pauses,
+                            metric_results=[interruptions_result(interruptions), *metric_results,
+                                            turn_taking.to_metric_result()],
+                            turn_taking=turn_taking)
@@ -1,16 +1,23 @@
 from contextlib import contextmanager
 import os
 import sys
-from faster_whisper import WhisperModel
+from typing import Callable, Iterator, Optional, Tuple, Union
 from pyannote.core.annotation import Annotation
-import stable_whisper
 
 import numpy as np
-from data_types import REQUIRED_AUDIO_TYPE, WhisperModelSize
+from .alignment import SpeakerTurns, align_transcription
+from .audio import SAMPLE_RATE, check_audio, load_audio, stream_audio
+from .data_types import REQUIRED_AUDIO_TYPE, CallSegment, WhisperModelSize
+from .model_pool import get_faster_whisper_model, get_stable_whisper_model
 import logging
 
-from pyannote_utils import assign_speakers
-from utils import extract_speaker_id, format_transcription
+from .pyannote_utils import assign_speakers
+from .utils import extract_speaker_id, format_transcription
+
+STREAMING_WINDOW_SEC = 30.0
+STREAMING_OVERLAP_SEC = 5.0
+# Characters of the preceding transcription conditioning the next window
+PROMPT_CHARACTERS = 200
 
 
 @contextmanager
@@ -22,28 +29,6 @@ def suppress_stdout():
             yield
         finally:
             sys.stdout = old_stdout
-            
-class ModelCache:
-    _downloaded_models = {}
-
-    @classmethod
-    def add_downloaded_model(cls, model_size: WhisperModelSize, model: WhisperModel):
-        cls._downloaded_models[model_size] = model
-        logging.info(f"{model_size} added to cache")
-
-    @classmethod
-    def is_model_downloaded(cls, model_size: WhisperModelSize):
-        return model_size in cls._downloaded_models.keys()
-
-    @classmethod
-    def get_model(cls, model_size: WhisperModelSize):
-        try:
-            model = cls._downloaded_models[model_size]
-            logging.info(f"{model_size} retrieved from cache")
-            return model
-        except KeyError:
-            return None
-
 
 
 class WhisperTranscriber:
@@ -58,20 +43,14 @@ class WhisperTranscriber:
 
     @staticmethod
     def initialize_model(model_size: WhisperModelSize, device: str, compute_type: str):
-        model_in_cache = ModelCache.is_model_downloaded(model_size=model_size)
-        if not model_in_cache:
-            model = WhisperModel(model_size, device=device, compute_type=compute_type)
-            ModelCache.add_downloaded_model(model_size=model_size, model=model)
-            return model
-        else:
-            model = ModelCache.get_model(model_size=model_size)
-        return model
+        # Shared with every other transcriber of the process using the same model, device and compute type
+        return get_faster_whisper_model(WhisperModelSize(model_size).value, device, compute_type)
 
     def inference(self, audio: np.ndarray, **kwargs):
         """
         Inference function for stable-ts to stabilize timestamps with Whisper transcription.
         """
-        assert audio.dtype == REQUIRED_AUDIO_TYPE, f"audio array data type must be {REQUIRED_AUDIO_TYPE}"
+        check_audio(audio)
         self.current_transcription = self.get_transcription(audio)
         return self.current_transcription
 
@@ -79,7 +58,7 @@ class WhisperTranscriber:
         """Transcribe audio using Whisper"""
         # Pad/trim audio to fit 30 seconds as required by Whisper
         # Transcribe the given audio while suppressing logs
-        assert audio.dtype == REQUIRED_AUDIO_TYPE, f"audio array data type must be {REQUIRED_AUDIO_TYPE}"
+        check_audio(audio)
         with suppress_stdout():
             segments, info = self.model.transcribe(
                 audio,
@@ -95,13 +74,18 @@ class WhisperTranscriber:
             self.counter += 1
         return transcription
 
-    def transcribe(self, audio_file_path: str):
+    def transcribe(self, audio: Union[str, np.ndarray]):
+        """Transcribe a recording, or its samples as decoded by load_audio"""
+        if isinstance(audio, str):
+            with load_audio(audio) as buffer:
+                return self.transcribe(buffer.samples)
+        check_audio(audio)
         # The inferenced transcription can fail when suppressing silent parts, defaulting to the original transcription
         try:
             # aligned_transcription = stable_whisper.transcribe_any(inference_func=self.inference, audio=audio, input_sr=16000).to_dict()
             # aligned_transcription = stable_whisper.transcribe(audio_file_path).to_dict()
-            model = stable_whisper.load_model('large-v3')
-            result = model.transcribe(audio_file_path)
+            model = get_stable_whisper_model('large-v3')
+            result = model.transcribe(audio)
             aligned_transcription = result.to_dict()
         except Exception as e:
             logging.info(f"Transcription alignment failed, defaulting to original. Error: {e}")
@@ -109,9 +93,65 @@ class WhisperTranscriber:
 
         return aligned_transcription
 
+    def _transcribe_window(self, window: np.ndarray, offset: float, keep_from: float, keep_until: float) -> dict:
+        """
+        Transcribe a window, keeping the words whose midpoint falls in [keep_from, keep_until). Each boundary lies in
+        the middle of an overlap, so a word cut off at one window's edge is kept whole from the other window.
+        """
+        with suppress_stdout():
+            segments, info = self.model.transcribe(
+                window,
+                initial_prompt=self._buffer,
+                **({"language": self.language} if self.language is not None else {}),
+                word_timestamps=True,
+                beam_size=self.beam_size
+            )
+            kept_segments = []
+            # Consumed lazily, only the words of the current window are ever held
+            for segment in segments:
+                words = [{"start": offset + word.start, "end": offset + word.end, "word": word.word}
+                         for word in segment.words or []
+                         if keep_from <= offset + (word.start + word.end) / 2 < keep_until]
+                if words:
+                    kept_segments.append({"start": words[0]["start"], "end": words[-1]["end"],
+                                          "text": "".join(word["word"] for word in words), "words": words})
+        return {"language": info.language, "segments": kept_segments}
+
+    def stream_transcription(self, audio: Union[str, np.ndarray], speaker_turns: Optional[SpeakerTurns] = None,
+                             window_sec: float = STREAMING_WINDOW_SEC,
+                             overlap_sec: float = STREAMING_OVERLAP_SEC,
+                             diarize_window: Optional[Callable[[float, np.ndarray], SpeakerTurns]] = None
+                             ) -> Iterator[CallSegment]:
+        """
+        Transcribe a recording in overlapping windows, yielding call segments as each window is done. Memory stays
+        bounded by the window size regardless of the call length, and a file path is decoded in window-sized chunks.
+
+        Args:
+            audio: Audio file path, or samples as decoded by load_audio
+            speaker_turns: Diarization of the recording, speakers are Unknown without it
+            diarize_window: Called with the start time and samples of each window, returns the window's speaker turns
+                in recording time. Replaces speaker_turns, so the recording never has to be diarized as a whole.
+        """
+        if overlap_sec * 2 >= window_sec:
+            raise ValueError("overlap_sec must be less than half of window_sec")
+        speaker_turns = speaker_turns or SpeakerTurns(np.empty(0), np.empty(0), np.empty(0, dtype=object))
+        keep_from = 0.0
+        for window_start, window, is_last in _iter_windows(audio, window_sec, overlap_sec):
+            check_audio(window)
+            # The next window starts overlap_sec before this one ends, the boundary is in the middle of the overlap
+            keep_until = float("inf") if is_last else window_start + len(window) / SAMPLE_RATE - overlap_sec / 2
+            transcription = self._transcribe_window(window, window_start, keep_from, keep_until)
+            self.counter += 1
+            if transcription["segments"]:
+                text = "".join(segment["text"] for segment in transcription["segments"])
+                self._buffer = (self._buffer + text)[-PROMPT_CHARACTERS:]
+                turns = diarize_window(window_start, window) if diarize_window else speaker_turns
+                yield from align_transcription(turns, transcription)
+
+            keep_from = keep_until
 
     def sequential_transcription(self, audio: np.ndarray, diarization: Annotation):
-        assert audio.dtype == REQUIRED_AUDIO_TYPE, f"audio array data type must be {REQUIRED_AUDIO_TYPE}"
+        check_audio(audio)
         # Step 1: Transcribe
         transcription = self.transcribe(audio)
         # Step 2: Assign speakers
@@ -121,3 +161,24 @@ class WhisperTranscriber:
         for (segment, speaker, transcription) in diarizated_transcription:
             transcriptions.append({"speaker": extract_speaker_id(speaker), "text": transcription})
         return transcriptions
+
+
+def _iter_windows(audio: Union[str, np.ndarray], window_sec: float,
+                  overlap_sec: float) -> Iterator[Tuple[float, np.ndarray, bool]]:
+    """(start time, samples, is last) of windows overlapping by overlap_sec"""
+    step = int((window_sec - overlap_sec) * SAMPLE_RATE)
+    overlap = int(overlap_sec * SAMPLE_RATE)
+    chunks = (stream_audio(audio, window_sec - overlap_sec) if isinstance(audio, str)
+              else (audio[start:start + step] for start in range(0, len(audio), step)))
+
+    # A window is the tail of the previous chunk followed by the next one, a chunk is read ahead to know the last
+    tail = np.empty(0, dtype=REQUIRED_AUDIO_TYPE)
+    consumed = 0
+    chunk = next(chunks, None)
+    while chunk is not None:
+        next_chunk = next(chunks, None)
+        window = np.concatenate((tail, chunk)) if len(tail) else chunk
+        yield (consumed - len(tail)) / SAMPLE_RATE, window, next_chunk is None
+        consumed += len(chunk)
+        tail = window[len(window) - overlap:]
+        chunk = next_chunk
@@ -0,0 +1,188 @@
+import io
+import os
+import time
+import wave
+from abc import ABC, abstractmethod
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from .audio import AudioBuffer
+from .model_pool import get_faster_whisper_model, get_stable_whisper_model
+from .utils import format_transcription
+
+
+@dataclass
+class TranscriberConfig:
+    """Which ASR backend transcribes recordings and how, see TRANSCRIBERS for the backends"""
+    backend: str = "stable_ts"
+    model: str = "large-v3-turbo"
+    device: str = "auto"
+    # faster-whisper only, int8 keeps CPU inference viable
+    compute_type: str = "int8"
+    beam_size: int = 1
+    # faster-whisper only, VAD-split chunks transcribed per batch
+    batch_size: int = 8
+    language: Optional[str] = None
+    # stable-ts only, refine the word timestamps after transcribing
+    refine_timestamps: bool = True
+    # AssemblyAI only, e.g. the url of a StandInAssemblyAIServer
+    base_url: Optional[str] = field(default=None, compare=False)
+
+    @classmethod
+    def from_env(cls) -> "TranscriberConfig":
+        """Defaults overridden by ASR_BACKEND, ASR_MODEL, ASR_DEVICE, ASR_COMPUTE_TYPE, ASR_BEAM_SIZE and ASR_BATCH_SIZE"""
+        defaults = cls()
+        return cls(backend=os.getenv("ASR_BACKEND", defaults.backend),
+                   model=os.getenv("ASR_MODEL", defaults.model),
+                   device=os.getenv("ASR_DEVICE", defaults.device),
+                   compute_type=os.getenv("ASR_COMPUTE_TYPE", defaults.compute_type),
+                   beam_size=int(os.getenv("ASR_BEAM_SIZE", defaults.beam_size)),
+                   batch_size=int(os.getenv("ASR_BATCH_SIZE", defaults.batch_size)))
+
+    def cache_key(self) -> Dict[str, Any]:
+        """The settings that change a transcription, where the backend is reached doesn't"""
+        key = asdict(self)
+        del key["base_url"]
+        return key
+
+
+@dataclass
+class TranscriptionResult:
+    transcription: Dict[str, Any]
+    wall_time: float
+    audio_duration: float
+
+    @property
+    def real_time_factor(self) -> float:
+        """Processing time per second of audio, under 1 is faster than real time"""
+        return self.wall_time / self.audio_duration if self.audio_duration else 0.0
+
+
+class Transcriber(ABC):
+    """
+    ASR backend producing a stable-ts style transcription: segments with start, end, text and timestamped words.
+    Backends that diarize themselves add a speaker to every segment.
+    """
+    name: str = ""
+    provides_speakers: bool = False
+
+    def __init__(self, config: TranscriberConfig):
+        self.config = config
+
+    @abstractmethod
+    def transcribe(self, audio: AudioBuffer) -> Dict[str, Any]:
+        pass
+
+    def transcribe_timed(self, audio: AudioBuffer) -> TranscriptionResult:
+        started_at = time.perf_counter()
+        transcription = self.transcribe(audio)
+        result = TranscriptionResult(transcription, time.perf_counter() - started_at, audio.duration)
+        print(f"--> ✨ Transcription with {self.name} completed in {result.wall_time:.2f} seconds, "
+              f"real-time factor {result.real_time_factor:.3f}")
+        return result
+
+
+class StableTsTranscriber(Transcriber):
+    """stable-ts Whisper with refined word timestamps"""
+    name = "stable_ts"
+
+    def transcribe(self, audio: AudioBuffer) -> Dict[str, Any]:
+        model = get_stable_whisper_model(self.config.model, None if self.config.device == "auto" else self.config.device)
+        options = {"language": self.config.language} if self.config.language else {}
+        if self.config.beam_size > 1:
+            # Greedy decoding otherwise, Whisper's default
+            options["beam_size"] = self.config.beam_size
+        result = model.transcribe(audio.samples, suppress_silence=False, **options)
+        if self.config.refine_timestamps:
+            result = model.refine(audio.samples, result)
+        return result.to_dict()
+
+
+class FasterWhisperTranscriber(Transcriber):
+    """
+    CTranslate2 Whisper. The batched pipeline splits the audio on voice activity and transcribes the chunks in
+    batches, which is several times faster than sequential decoding on CPU.
+    """
+    name = "faster_whisper"
+
+    def transcribe(self, audio: AudioBuffer) -> Dict[str, Any]:
+        model = get_faster_whisper_model(self.config.model, self.config.device, self.config.compute_type)
+        options = {"language": self.config.language} if self.config.language else {}
+        try:
+            from faster_whisper import BatchedInferencePipeline
+        except ImportError:
+            # faster-whisper before 1.1 has no batched pipeline, fall back to sequential VAD-filtered decoding
+            segments, info = model.transcribe(audio.samples, beam_size=self.config.beam_size, word_timestamps=True,
+                                              vad_filter=True, **options)
+        else:
+            pipeline = BatchedInferencePipeline(model=model)
+            segments, info = pipeline.transcribe(audio.samples, batch_size=self.config.batch_size,
+                                                 beam_size=self.config.beam_size, word_timestamps=True, **options)
+        return format_transcription(list(segments), info)
+
+
+def _to_wav_bytes(audio: AudioBuffer) -> bytes:
+    """16-bit PCM WAV of the samples, a quarter of the size of float32 to upload"""
+    pcm = (np.clip(audio.samples, -1.0, 1.0) * 32767).astype("<i2")
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(audio.sample_rate)
+        wav.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+
+class AssemblyAITranscriber(Transcriber):
+    """AssemblyAI with speaker labels, requires the ASSEMBLYAI_API_KEY environment variable"""
+    name = "assemblyai"
+    provides_speakers = True
+
+    def transcribe(self, audio: AudioBuffer) -> Dict[str, Any]:
+        api_key = os.getenv("ASSEMBLYAI_API_KEY")
+        if not api_key:
+            raise ValueError("Please set ASSEMBLYAI_API_KEY environment variable")
+        import assemblyai as aai
+
+        aai.settings.api_key = api_key
+        # The SDK's settings are process-wide, later transcribers without a base_url must not reach this one's
+        previous_base_url = aai.settings.base_url
+        if self.config.base_url:
+            aai.settings.base_url = self.config.base_url
+        try:
+            transcript = aai.Transcriber().transcribe(io.BytesIO(_to_wav_bytes(audio)),
+                                                      config=aai.TranscriptionConfig(speaker_labels=True,
+                                                                                     speakers_expected=2,
+                                                                                     speech_model=aai.SpeechModel.nano,
+                                                                                     disfluencies=True))
+        finally:
+            aai.settings.base_url = previous_base_url
+        if transcript.status == aai.TranscriptStatus.error:
+            raise Exception(f"AssemblyAI transcription error: {transcript.error}")
+
+        # Speakers A, B, ... are named like the diarization labels SPEAKER_00, SPEAKER_01, ...
+        segments = []
+        for utterance in transcript.utterances or []:
+            speaker = f"SPEAKER_{ord(utterance.speaker) - ord('A'):02d}"
+            words = [{"start": word.start / 1000, "end": word.end / 1000, "word": f" {word.text}",
+                      "probability": word.confidence} for word in utterance.words]
+            segments.append({"start": utterance.start / 1000, "end": utterance.end / 1000,  # Convert from ms to seconds
+                             "text": utterance.text, "speaker": speaker, "words": words})
+        return {"language": self.config.language, "text": transcript.text, "segments": segments}
+
+
+TRANSCRIBERS = {
+    StableTsTranscriber.name: StableTsTranscriber,
+    FasterWhisperTranscriber.name: FasterWhisperTranscriber,
+    AssemblyAITranscriber.name: AssemblyAITranscriber,
+}
+
+
+def create_transcriber(config: Optional[TranscriberConfig] = None) -> Transcriber:
+    """Transcriber of the configured backend, configured from the environment if no config is given"""
+    config = config or TranscriberConfig.from_env()
+    if config.backend not in TRANSCRIBERS:
+        raise ValueError(f"Unknown ASR backend {config.backend}, expected one of {', '.join(TRANSCRIBERS)}")
+    return TRANSCRIBERS[config.backend](config)
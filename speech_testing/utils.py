@@ -1,6 +1,6 @@
 
 from typing import Any, Dict, List
-from llm_testing.core.data_types import EntitySpeaking
+from core.data_types import EntitySpeaking
 from .data_types import SPEAKER_MAPPING, CallSegment, InterruptionData, PauseData, SpeechTestResult
 
 def jsonify_transcription(transcription):
@@ -11,18 +11,21 @@ from pyppeteer import launch
 
 from core.data_types import TestResult
 from core.evaluator import LLMConversationEvaluator
+from core.interfaces import AsyncLLMInterface
 from core.personas import CalleePersona, Mood
-from core.providers.openai import OpenAIProvider
+from core.providers.http_client import close_shared_async_http_client
+from core.providers.openai import AsyncOpenAIProvider
 from core.utils.generate_report import generate_test_results_report
 
 CHATBOT_REPLY_TIMEOUT_SEC = 60
 FAQS_FOLDER = "faqs"
 
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    raise ValueError("Please set OPENAI_API_KEY environment variable")
 
-agent_llm = OpenAIProvider(api_key, "gpt-4o")
+def create_openai_llm(model: str = "gpt-4o") -> AsyncOpenAIProvider:
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError("Please set OPENAI_API_KEY environment variable")
+    return AsyncOpenAIProvider(api_key, model)
 
 issue_resolved_tool = {
     "type": "function",
@@ -97,8 +100,8 @@ def convert_conv_history_to_openai_format(conversation_history, assistant_role):
     return msgs
 
 
-def eval_test_scenario(scenario, conversation_history):
-    eval_llm = OpenAIProvider(api_key, "gpt-4o")
+async def eval_test_scenario(scenario, conversation_history, eval_llm: Optional[AsyncLLMInterface] = None):
+    eval_llm = eval_llm or create_openai_llm()
     evaluator = LLMConversationEvaluator(eval_llm, "eval_metrics.json",
                                          f"You are an objective conversational AI chatbot evaluator who evalutes customer support AI chatbots that text with customers. You will be provided a chat transcript and score it across the different provided metrics.")
 
@@ -127,7 +130,7 @@ def eval_test_scenario(scenario, conversation_history):
     )
 
     return TestResult(
-        evaluation_result=evaluator.evaluate(
+        evaluation_result=await evaluator.evaluate_async(
             conversation_history,
             None,
             user_persona,
@@ -148,8 +151,10 @@ class ChatMessageWindow(BaseModel):
     placeholder_txt: Optional[str] = None
 
 class ChatSessionManager:
-    def __init__(self, page, chat_input_selector, shadow_root_selector=None):
+    def __init__(self, page, chat_input_selector, shadow_root_selector=None, llm: Optional[AsyncLLMInterface] = None):
         self.page = page
+        # Reads screenshots of the page, must support analyze_image
+        self.llm = llm or create_openai_llm()
         self.shadow_root_selector = shadow_root_selector
 
         # TODO get chat_input_element using VLMs instead of user to provide
@@ -168,7 +173,7 @@ Respond with status unknown otherwise, i.e. if it is not clear whether the chat
         screenshot = await self.page.screenshot({'fullPage': True})
         with tempfile.NamedTemporaryFile(suffix='.png') as temp_file:
             temp_file.write(screenshot)
-            response = await agent_llm.analyze_image(temp_file.name, prompt, ChatStatus)
+            response = await self.llm.analyze_image(temp_file.name, prompt, ChatStatus)
         
         return response
 
@@ -212,7 +217,7 @@ Respond with status unknown otherwise, i.e. if it is not clear whether the chat
         screenshot = await self.page.screenshot({'fullPage': True})
         with tempfile.NamedTemporaryFile(suffix='.png') as temp_file:
             temp_file.write(screenshot)
-            response = await agent_llm.analyze_image(temp_file.name, prompt, ChatMessageWindow)
+            response = await self.llm.analyze_image(temp_file.name, prompt, ChatMessageWindow)
             chat_input_selector = f'input[placeholder="{response.placeholder_txt}"]'
             chat_input = await self.get_element_from_dom(chat_input_selector)
 
@@ -458,7 +463,10 @@ Respond with status unknown otherwise, i.e. if it is not clear whether the chat
 
 
 
-async def run_tests(tests_to_run_count=999, verbose=False):
+async def run_tests(tests_to_run_count=999, verbose=False, agent_llm: Optional[AsyncLLMInterface] = None,
+                    eval_llm: Optional[AsyncLLMInterface] = None):
+    """Pass an AsyncMockLLMProvider as agent_llm and eval_llm to exercise the harness without an API key"""
+    agent_llm = agent_llm or create_openai_llm()
     test_results = []
     browser = await launch(headless=False)
     try:
@@ -480,7 +488,7 @@ Generate your next response for the following conversation so I can send it to t
                 page = await browser.newPage()
 
                 # TODO get chat_input_selector and shadow_root_selector automatically using VLMs and DOM parsing
-                chat_session_manager = ChatSessionManager(page, scenario["chat_input_selector"], scenario["shadow_root_selector"])
+                chat_session_manager = ChatSessionManager(page, scenario["chat_input_selector"], scenario["shadow_root_selector"], agent_llm)
                 msg_input_element = await chat_session_manager.initiate_support_chat(scenario["chatbot_url"])
                 result = await chat_session_manager.send_and_measure(msg_input_element,
                                                 scenario["user_persona"]["initial_message"]
@@ -503,10 +511,10 @@ Generate your next response for the following conversation so I can send it to t
 
                 # TODO add some timeout to cut the conversations short if the two AIs go round and round without resolving the issue
                 while True:
-                    user_response = agent_llm.plain_call(scenario_system_prompt,
-                                                        convert_conv_history_to_openai_format(conversation_history, "user"),
-                                                        [issue_resolved_tool]
-                                                        )
+                    user_response = await agent_llm.plain_call(scenario_system_prompt,
+                                                              convert_conv_history_to_openai_format(conversation_history, "user"),
+                                                              [issue_resolved_tool]
+                                                              )
 
                     # # TODO SAHAR REMOVE, just mock for development
                     # # Mock user response for development
@@ -567,7 +575,7 @@ Generate your next response for the following conversation so I can send it to t
     test_results_report = {}
     for scenario, conversation_history, reply_latencies in test_results:
         # TODO ADD LATENCY eval
-        eval_response = eval_test_scenario(scenario, conversation_history)
+        eval_response = await eval_test_scenario(scenario, conversation_history, eval_llm)
         test_results_report[scenario["scenario_id"]] = {
             "tested_component": scenario,
             "result": eval_response,
@@ -583,7 +591,10 @@ Generate your next response for the following conversation so I can send it to t
 
 
 async def main():
-    await run_tests(tests_to_run_count=2)
+    try:
+        await run_tests(tests_to_run_count=2)
+    finally:
+        await close_shared_async_http_client()
 
 if __name__ == "__main__":
     try: